@@ -0,0 +1,142 @@
+"""Replay frame sequences through the adaptive CameraSession pipeline and the
+always-full pipeline (full-resolution HOG + encoding on every frame).
+
+Usage:
+    python benchmarks/bench_adaptive.py [--sequence DIR ...] [--still 30] [--drift 30]
+
+Sequences:
+  * each --sequence DIR: the images in DIR in file-name order (a recording);
+  * without --sequence: kiosk captures from face_attendance/uploads/ grouped
+    per person and day;
+  * "still": one capture repeated with sensor noise (someone standing still);
+  * "drift": one capture shifted a few pixels per frame (slow movement).
+
+Frames are replayed as JPEG bytes, as cameras upload them, so both
+pipelines include the decode.  Reports CPU time per frame for both pipelines and the adaptive pipeline's
+recall of the names the full pipeline recognizes.
+"""
+import io
+import os
+import re
+import sys
+import glob
+import time
+import argparse
+from collections import defaultdict
+import numpy as np
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..", "face_attendance")
+sys.path.insert(0, APP_DIR)
+
+import face_recognition
+from face_index import FaceIndex
+from camera_session import CameraSession
+
+
+def load_gallery():
+    index = FaceIndex()
+    for path in sorted(glob.glob(os.path.join(APP_DIR, "known_faces", "*"))):
+        encs = face_recognition.face_encodings(face_recognition.load_image_file(path))
+        if encs:
+            index.add(encs[0], os.path.splitext(os.path.basename(path))[0])
+    return index
+
+
+def recorded_sequences(dirs, limit):
+    if dirs:
+        return {os.path.basename(os.path.normpath(d)): sorted(glob.glob(os.path.join(d, "*.jpg")))[:limit]
+                for d in dirs}
+    groups = defaultdict(list)
+    for path in sorted(glob.glob(os.path.join(APP_DIR, "uploads", "*.jpg"))):
+        m = re.match(r"(.+)_(\d{4}-\d{2}-\d{2})_", os.path.basename(path))
+        if m:
+            groups[f"{m.group(1)} {m.group(2)}"].append(path)
+    # The longest recordings are the most interesting to replay
+    longest = sorted(groups.items(), key=lambda kv: -len(kv[1]))[:3]
+    return {k: v[:limit] for k, v in longest}
+
+
+def jpeg(image, quality=90):
+    buf = io.BytesIO()
+    Image.fromarray(image).save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def synthetic_sequences(base, still, drift, seed=0):
+    rng = np.random.default_rng(seed)
+    seqs = {}
+    if still:
+        seqs["still"] = [jpeg(np.clip(base + rng.normal(0, 2, base.shape), 0, 255).astype(np.uint8))
+                         for _ in range(still)]
+    if drift:
+        seqs["drift"] = [jpeg(np.roll(base, shift=(i // 2, i), axis=(0, 1))) for i in range(drift)]
+    return seqs
+
+
+def full_pipeline(data, index):
+    image = face_recognition.load_image_file(io.BytesIO(data))
+    locations = face_recognition.face_locations(image)
+    encodings = face_recognition.face_encodings(image, locations) if locations else []
+    return {name for name, _, _ in index.match(encodings) if name}
+
+
+def adaptive_pipeline(session, data, index):
+    _locations, encodings, mode = session.process(data)
+    return {name for name, _, _ in index.match(encodings) if name}, mode
+
+
+def replay(name, frames, index, detect_width):
+    full_cpu, adaptive_cpu = 0.0, 0.0
+    expected, hits = 0, 0
+    modes = defaultdict(int)
+    session = CameraSession(detect_width=detect_width)
+    for data in frames:
+        t = time.process_time()
+        truth = full_pipeline(data, index)
+        full_cpu += time.process_time() - t
+        t = time.process_time()
+        got, mode = adaptive_pipeline(session, data, index)
+        adaptive_cpu += time.process_time() - t
+        modes[mode] += 1
+        expected += len(truth)
+        hits += len(truth & got)
+    n = len(frames)
+    recall = hits / expected if expected else float("nan")
+    mode_txt = " ".join(f"{k}={v}" for k, v in sorted(modes.items()))
+    print(f"{name:<22} {n:>6} {full_cpu / n * 1000:>10.1f} {adaptive_cpu / n * 1000:>12.1f} "
+          f"{recall:>7.2f}  {mode_txt}")
+    return n, full_cpu, adaptive_cpu, expected, hits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sequence", action="append", default=[], help="directory of frames")
+    parser.add_argument("--limit", type=int, default=40, help="max frames per recorded sequence")
+    parser.add_argument("--still", type=int, default=30)
+    parser.add_argument("--drift", type=int, default=30)
+    parser.add_argument("--detect-width", type=int, default=320)
+    args = parser.parse_args()
+
+    index = load_gallery()
+    sequences = {}
+    for name, paths in recorded_sequences(args.sequence, args.limit).items():
+        sequences[name] = [open(p, "rb").read() for p in paths]
+    first = next((frames[0] for frames in sequences.values() if frames), None)
+    if first is not None:
+        base = face_recognition.load_image_file(io.BytesIO(first))
+        sequences.update(synthetic_sequences(base, args.still, args.drift))
+
+    print(f"{'sequence':<22} {'frames':>6} {'full ms':>10} {'adaptive ms':>12} {'recall':>7}  modes")
+    totals = np.zeros(5)
+    for name, frames in sequences.items():
+        if frames:
+            totals += replay(name, frames, index, args.detect_width)
+    n, full_cpu, adaptive_cpu, expected, hits = totals
+    print(f"{'TOTAL':<22} {int(n):>6} {full_cpu / n * 1000:>10.1f} {adaptive_cpu / n * 1000:>12.1f} "
+          f"{hits / expected if expected else float('nan'):>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Matches per second for FaceIndex on synthetic 128-d galleries.
+
+Usage:
+    python benchmarks/bench_face_index.py [--sizes 1000 10000 100000] [--faces 4]
+
+For every gallery size this times the old per-face ``face_distance`` over a
+Python list, the exhaustive batched FaceIndex, and (for large galleries) the
+k-means partitioned FaceIndex, reporting matched faces per second.
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "face_attendance"))
+
+from face_index import FaceIndex
+
+
+def synthetic_gallery(n, dim=128, seed=0):
+    rng = np.random.default_rng(seed)
+    # Real encodings are roughly unit-length-ish with small per-dim spread
+    return (rng.normal(0.0, 0.09, size=(n, dim))).astype(np.float32)
+
+
+def noisy_queries(gallery, faces, seed=1):
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(gallery), size=faces)
+    return gallery[rows] + rng.normal(0.0, 0.02, size=(faces, gallery.shape[1])).astype(np.float32), rows
+
+
+def _rate(fn, faces, min_time=1.0):
+    fn()  # warm-up
+    runs, start = 0, time.perf_counter()
+    while True:
+        fn()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return runs * faces / elapsed
+
+
+def bench(n, faces, n_lists, n_probe):
+    gallery = synthetic_gallery(n)
+    names = [f"person_{i}" for i in range(n)]
+    queries, expected = noisy_queries(gallery, faces)
+    results = {}
+
+    # Baseline: what recognize_face did before (list -> array per face)
+    as_list = list(gallery.astype(np.float64))
+
+    def baseline():
+        for q in queries:
+            d = np.linalg.norm(np.asarray(as_list) - q, axis=1)
+            np.argmin(d)
+    results["list face_distance"] = (_rate(baseline, faces), None)
+
+    index = FaceIndex(capacity=16)
+    index.add_many(gallery, names)
+    hits = sum(m[2] == e for m, e in zip(index.match(queries), expected))
+    results["FaceIndex exhaustive"] = (_rate(lambda: index.match(queries), faces), hits / faces)
+
+    if n_lists and n >= n_lists * 10:
+        part = FaceIndex(capacity=16, n_lists=n_lists, n_probe=n_probe)
+        part.add_many(gallery, names)
+        part.build_partitions()
+        hits = sum(m[2] == e for m, e in zip(part.match(queries), expected))
+        label = f"FaceIndex {n_lists} lists/{n_probe} probes"
+        results[label] = (_rate(lambda: part.match(queries), faces), hits / faces)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--faces", type=int, default=4, help="faces per frame (batch size)")
+    parser.add_argument("--lists", type=int, default=256)
+    parser.add_argument("--probes", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'gallery':>8}  {'method':<32} {'matches/s':>12} {'recall':>7}")
+    for n in args.sizes:
+        for label, (rate, recall) in bench(n, args.faces, args.lists, args.probes).items():
+            recall_txt = "-" if recall is None else f"{recall:.2f}"
+            print(f"{n:>8}  {label:<32} {rate:>12,.0f} {recall_txt:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Match time and accuracy of the FaceIndex gallery modes with several
+enrolled photos per identity.
+
+Usage:
+    python benchmarks/bench_gallery_modes.py [--identities 2000] [--samples 1 5 20]
+
+Synthetic 128-d encodings: every identity has a center, enrolled photos and
+probe faces are the center plus per-photo noise, and some identities are
+"lookalikes" drawn close to another identity.  Probes of enrolled people
+must match the right name; probes of people who were never enrolled must be
+rejected.  Noise levels are tuned so same-person distances (~0.4-0.5) and
+different-person distances (~0.8+) resemble dlib encodings.
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "face_attendance"))
+
+from face_index import FaceIndex
+
+
+def make_identities(n, rng, spread=0.06, lookalike_frac=0.2, lookalike_spread=0.035):
+    centers = rng.normal(0.0, spread, size=(n, 128)).astype(np.float32)
+    # Some people look like someone else: their center sits near another one
+    k = int(n * lookalike_frac)
+    twins = rng.choice(n, size=k, replace=False)
+    partners = rng.integers(0, n, size=k)
+    centers[twins] = centers[partners] + rng.normal(0.0, lookalike_spread, size=(k, 128))
+    return centers
+
+
+def noisy(centers, rng, noise):
+    return (centers + rng.normal(0.0, noise, size=centers.shape)).astype(np.float32)
+
+
+def evaluate(index, probes, labels, threshold, repeats, batch=4):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for i in range(0, len(probes), batch):
+            index.match(probes[i:i + batch], threshold)
+    elapsed = time.perf_counter() - start
+    matches = index.match(probes, threshold)
+    correct = sum((m[0] == label) for m, label in zip(matches, labels))
+    return len(probes) * repeats / elapsed, correct / len(probes)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--identities", type=int, default=2000)
+    parser.add_argument("--samples", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--probes", type=int, default=400)
+    parser.add_argument("--noise", type=float, default=0.03, help="per-photo noise std per dimension")
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = make_identities(args.identities + args.probes // 4, rng)
+    enrolled, strangers = centers[:args.identities], centers[args.identities:]
+    names = [f"person_{i}" for i in range(args.identities)]
+
+    probe_ids = rng.integers(0, args.identities, size=args.probes)
+    probes = np.concatenate([noisy(enrolled[probe_ids], rng, args.noise), noisy(strangers, rng, args.noise)])
+    labels = [names[i] for i in probe_ids] + [None] * len(strangers)
+
+    print(f"{args.identities} identities, {len(probes)} probes ({len(strangers)} never enrolled)")
+    print(f"{'samples':>7} {'mode':<11} {'rows':>7} {'matches/s':>10} {'accuracy':>9}")
+    for samples in args.samples:
+        photos = np.concatenate([noisy(enrolled, rng, args.noise) for _ in range(samples)])
+        photo_names = names * samples
+        for mode in FaceIndex.MODES:
+            index = FaceIndex(capacity=len(photos), mode=mode)
+            index.add_many(photos, photo_names)
+            rate, accuracy = evaluate(index, probes, labels, args.threshold, args.repeats)
+            print(f"{samples:>7} {mode:<11} {len(index):>7} {rate:>10,.0f} {accuracy:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
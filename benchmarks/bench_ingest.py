@@ -0,0 +1,102 @@
+"""Decode time and peak memory of the upload ingest path versus
+face_recognition.load_image_file, for 480p, 1080p and 12MP JPEGs.
+
+Usage:
+    python benchmarks/bench_ingest.py [--image PATH] [--repeats 5] [--pipeline]
+
+The test images are an upload from face_attendance/uploads/ (or --image)
+resized to each resolution.  Every (size, method) pair runs in a fresh
+process so its peak RSS (ru_maxrss above the post-import baseline) is not
+hidden by earlier runs.  --pipeline also times detection and encoding.
+"""
+import io
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..", "face_attendance")
+sys.path.insert(0, APP_DIR)
+
+SIZES = {"480p": (640, 480), "1080p": (1920, 1080), "12MP": (4000, 3000)}
+
+
+def _maxrss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def child(method, path, repeats, pipeline):
+    import face_recognition
+    from ingest import IngestedFrame
+    data = open(path, "rb").read()
+    base = _maxrss_mb()
+    decode_s, total_s = [], []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        if method == "load_image_file":
+            image = face_recognition.load_image_file(io.BytesIO(data))
+            decode_s.append(time.perf_counter() - t)
+            if pipeline:
+                locations = face_recognition.face_locations(image)
+                face_recognition.face_encodings(image, locations)
+        else:
+            frame = IngestedFrame(data)
+            decode_s.append(time.perf_counter() - t)
+            if pipeline:
+                frame.encode(face_recognition.face_locations(frame.image))
+        total_s.append(time.perf_counter() - t)
+    print(json.dumps({"decode_ms": min(decode_s) * 1000, "total_ms": min(total_s) * 1000,
+                      "peak_mb": _maxrss_mb() - base}))
+
+
+def make_images(source, folder):
+    from PIL import Image
+    img = Image.open(source).convert("RGB")
+    paths = {}
+    for label, (w, h) in SIZES.items():
+        path = os.path.join(folder, f"{label}.jpg")
+        img.resize((w, h), Image.BICUBIC).save(path, "JPEG", quality=90)
+        paths[label] = path
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", help="source photo (default: first upload)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--pipeline", action="store_true", help="include detection and encoding")
+    parser.add_argument("--child", nargs=2, metavar=("METHOD", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0], args.child[1], args.repeats, args.pipeline)
+        return
+
+    source = args.image or sorted(glob.glob(os.path.join(APP_DIR, "uploads", "*.jpg")))[0]
+    with tempfile.TemporaryDirectory() as folder:
+        paths = make_images(source, folder)
+        header = f"{'size':<6} {'method':<16} {'file KB':>8} {'decode ms':>10} {'peak MB':>8}"
+        if args.pipeline:
+            header += f" {'total ms':>9}"
+        print(header)
+        for label, path in paths.items():
+            for method in ("load_image_file", "ingest"):
+                cmd = [sys.executable, __file__, "--child", method, path, "--repeats", str(args.repeats)]
+                if args.pipeline:
+                    cmd.append("--pipeline")
+                r = json.loads(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout)
+                line = (f"{label:<6} {method:<16} {os.path.getsize(path) / 1024:>8.0f} "
+                        f"{r['decode_ms']:>10.1f} {r['peak_mb']:>8.1f}")
+                if args.pipeline:
+                    line += f" {r['total_ms']:>9.1f}"
+                print(line)
+
+
+if __name__ == "__main__":
+    main()
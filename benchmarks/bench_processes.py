@@ -0,0 +1,142 @@
+"""Startup time and memory of each process type.
+
+Usage:
+    python benchmarks/bench_processes.py [--workers 2] [--frames 8]
+
+Every case runs in a fresh interpreter (Linux; memory is read from /proc)
+and its own scratch FACE_ATTENDANCE_HOME (synthetic.copy_live_gallery):
+
+  * reporting       reporting.create_app(): the read-only API, no dlib
+  * app             importing face_attendance.app, then its first frame
+                    (which loads the models) and the RSS after it
+  * workers/fork    a RecognitionEngine pool that loads the models in the
+                    parent and forks its workers afterwards
+  * workers/spawn   the same pool with spawned workers, each loading its
+                    own copy of the models
+
+For worker pools, RSS counts shared pages in every process; PSS splits them
+between the processes sharing them and USS is what each worker alone holds,
+so the PSS/USS columns show how much copy-on-write sharing saves.
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+import subprocess
+import tempfile
+
+from synthetic import copy_live_gallery
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+APP_DIR = os.path.join(ROOT, "face_attendance")
+
+CHILD = r"""
+import os, sys, json, glob, time
+case, workers, frames = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+sys.path.insert(0, os.path.join(os.getcwd(), "face_attendance"))
+
+def memory(pid="self"):
+    out = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    out[key] = int(rest.split()[0]) / 1024.0
+    except OSError:
+        with open(f"/proc/{pid}/status") as f:
+            out["Rss"] = next(int(l.split()[1]) / 1024.0 for l in f if l.startswith("VmRSS:"))
+    return {"rss_mb": out.get("Rss"), "pss_mb": out.get("Pss"),
+            "uss_mb": (out["Private_Clean"] + out["Private_Dirty"]) if "Private_Clean" in out else None}
+
+uploads = sorted(glob.glob("face_attendance/uploads/*.jpg"))[:frames]
+blobs = [open(p, "rb").read() for p in uploads]
+result = {}
+t = time.perf_counter()
+if case == "reporting":
+    import reporting
+    app = reporting.create_app()
+    result["startup_s"] = time.perf_counter() - t
+    app.test_client().get("/api/attendance?limit=100")
+    result.update(memory())
+elif case == "app":
+    import io
+    from datetime import datetime, timedelta
+    import face_attendance.app as A
+    result["startup_s"] = time.perf_counter() - t
+    result.update(memory(), dlib_loaded="dlib" in sys.modules)
+    client = A.app.test_client()
+    # Pretend everyone was just logged so the run writes no attendance
+    class _Recent(dict):
+        def get(self, key, default=None):
+            return datetime.now() + timedelta(days=1)
+    A.LAST_LOGGED = _Recent()
+    t = time.perf_counter()
+    client.post("/api/recognize", data={"image": (io.BytesIO(blobs[0]), "frame.jpg")})
+    result["first_frame_s"] = time.perf_counter() - t
+    result["after_first_frame"] = memory()
+else:
+    from recognition_engine import RecognitionEngine
+    import numpy as np
+    engine = RecognitionEngine(workers, start_method=case.split("/")[1])
+    engine.gallery.reset(np.random.default_rng(0).normal(0, 0.06, (1000, 128)), [str(i) for i in range(1000)])
+    result["startup_s"] = time.perf_counter() - t
+    for future in [engine.submit(b) for b in blobs * workers]:
+        engine.resolve(future.result())
+    result["parent"] = memory()
+    result["workers"] = [memory(pid) for pid in engine.pids()]
+    engine.close()
+result.setdefault("dlib_loaded", "dlib" in sys.modules)
+print(json.dumps(result))
+"""
+
+
+def run(case, workers, frames):
+    with tempfile.TemporaryDirectory(prefix="face-bench-") as home:
+        copy_live_gallery(home)
+        env = dict(os.environ, FACE_ATTENDANCE_HOME=home)
+        out = subprocess.run([sys.executable, "-c", CHILD, case, str(workers), str(frames)], cwd=ROOT,
+                             env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _mb(value):
+    return f"{value:>8.1f}" if value is not None else f"{'-':>8}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--frames", type=int, default=8, help="frames each worker handles before measuring")
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+    if not glob.glob(os.path.join(APP_DIR, "uploads", "*.jpg")):
+        raise SystemExit("Needs kiosk captures in face_attendance/uploads/")
+
+    results = {case: run(case, args.workers, args.frames)
+               for case in ("reporting", "app", "workers/fork", "workers/spawn")}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'process':<22} {'startup s':>9} {'RSS MB':>8} {'PSS MB':>8} {'USS MB':>8}  dlib")
+    for case in ("reporting", "app"):
+        r = results[case]
+        print(f"{case:<22} {r['startup_s']:>9.2f} {_mb(r['rss_mb'])} {_mb(r['pss_mb'])} {_mb(r['uss_mb'])}"
+              f"  {'yes' if r['dlib_loaded'] else 'no'}")
+    r = results["app"]["after_first_frame"]
+    print(f"{'app after 1st frame':<22} {results['app']['first_frame_s']:>9.2f} {_mb(r['rss_mb'])} "
+          f"{_mb(r['pss_mb'])} {_mb(r['uss_mb'])}  yes")
+    for case in ("workers/fork", "workers/spawn"):
+        r = results[case]
+        p = r["parent"]
+        print(f"{case + ' parent':<22} {r['startup_s']:>9.2f} {_mb(p['rss_mb'])} {_mb(p['pss_mb'])} "
+              f"{_mb(p['uss_mb'])}  {'yes' if r['dlib_loaded'] else 'no'}")
+        for i, w in enumerate(r["workers"]):
+            print(f"{'  worker %d' % i:<22} {'':>9} {_mb(w['rss_mb'])} {_mb(w['pss_mb'])} {_mb(w['uss_mb'])}  yes")
+
+
+if __name__ == "__main__":
+    main()
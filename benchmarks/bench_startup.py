@@ -0,0 +1,71 @@
+"""Cold vs warm startup of face_attendance.app with the encoding store.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 3]
+
+Runs in a scratch FACE_ATTENDANCE_HOME (synthetic.copy_live_gallery).
+"cold" deletes its data/known_encodings.* before importing
+the app, so every image in known_faces/ is decoded and encoded; "warm"
+imports with the store written by the previous run.  Each import happens in
+a fresh interpreter.
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+from synthetic import copy_live_gallery
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+STORE_FILES = ["known_encodings.npy", "known_encodings.json"]
+
+IMPORT_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import face_recognition
+t1 = time.perf_counter()
+import face_attendance.app as app
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t1, len(app.FACE_INDEX))
+"""
+
+
+def _import_once(home):
+    env = dict(os.environ, FACE_ATTENDANCE_HOME=home)
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=env,
+                         check=True, capture_output=True, text=True).stdout.split()
+    return float(out[0]), float(out[1]), int(out[2])
+
+
+def _clear_store(home):
+    for name in STORE_FILES:
+        path = os.path.join(home, "data", name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="face-bench-") as home:
+        copy_live_gallery(home)
+        cold, warm = [], []
+        for _ in range(args.runs):
+            _clear_store(home)
+            cold.append(_import_once(home))
+            warm.append(_import_once(home))
+
+    print(f"gallery size: {cold[0][2]} encodings, {args.runs} runs (median)")
+    print(f"{'':6} {'face_recognition import':>24} {'app import (gallery load)':>26}")
+    for label, runs in (("cold", cold), ("warm", warm)):
+        model = statistics.median(r[0] for r in runs)
+        gallery = statistics.median(r[1] for r in runs)
+        print(f"{label:6} {model:>23.3f}s {gallery:>25.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Load test for /api/recognize with and without the recognition worker pool.
+
+Usage:
+    python benchmarks/load_test.py [--workers 0 1 2 4] [--frames 64] [--concurrency 8]
+
+For each worker count a fresh interpreter imports the app with
+RECOGNITION_WORKERS set, then ``--concurrency`` client threads post frames
+through the Flask test client.  Reports frames/sec and p50/p99 latency.
+Frames default to the kiosk snapshots in face_attendance/uploads/; the app
+itself runs in a scratch FACE_ATTENDANCE_HOME (synthetic.copy_live_gallery)
+with attendance logging suppressed.
+"""
+import os
+import sys
+import json
+import glob
+import argparse
+import subprocess
+import tempfile
+
+from synthetic import copy_live_gallery
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+APP_DIR = os.path.join(ROOT, "face_attendance")
+
+CHILD = r"""
+import io, sys, json, time, threading
+from datetime import datetime, timedelta
+import numpy as np
+import face_attendance.app as A
+
+paths, total, concurrency = json.loads(sys.argv[1])
+frames = [open(p, "rb").read() for p in paths]
+# Pretend everyone was just logged so the run writes no attendance
+class _Recent(dict):
+    def get(self, key, default=None):
+        return datetime.now() + timedelta(days=1)
+A.LAST_LOGGED = _Recent()
+
+latencies, lock = [], threading.Lock()
+counter = iter(range(total))
+
+def client():
+    c = A.app.test_client()
+    for i in counter:
+        data = {"image": (io.BytesIO(frames[i % len(frames)]), "frame.jpg")}
+        t = time.perf_counter()
+        c.post("/api/recognize", data=data)
+        with lock:
+            latencies.append(time.perf_counter() - t)
+
+# Warm-up: one frame per worker so process start-up isn't measured
+warm = A.app.test_client()
+for f in frames[:max(1, A.app.config["RECOGNITION_WORKERS"])]:
+    warm.post("/api/recognize", data={"image": (io.BytesIO(f), "frame.jpg")})
+
+start = time.perf_counter()
+threads = [threading.Thread(target=client) for _ in range(concurrency)]
+for t in threads: t.start()
+for t in threads: t.join()
+elapsed = time.perf_counter() - start
+print(json.dumps({"fps": len(latencies) / elapsed,
+                  "p50": float(np.percentile(latencies, 50)),
+                  "p99": float(np.percentile(latencies, 99))}))
+"""
+
+
+def run(workers, home, paths, frames, concurrency):
+    env = dict(os.environ, RECOGNITION_WORKERS=str(workers), FACE_ATTENDANCE_HOME=home,
+               SNAPSHOT_COMPACT_INTERVAL="86400")
+    out = subprocess.run([sys.executable, "-c", CHILD, json.dumps([paths, frames, concurrency])],
+                         cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--frames", type=int, default=64, help="total frames to post")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    parser.add_argument("--images", default=os.path.join(APP_DIR, "uploads", "*.jpg"))
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(args.images))[:32]
+    if not paths:
+        sys.exit(f"No frames match {args.images}")
+    print(f"{len(paths)} distinct frames, {args.frames} requests, "
+          f"{args.concurrency} clients, {os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'frames/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    with tempfile.TemporaryDirectory(prefix="face-bench-") as home:
+        copy_live_gallery(home)
+        for workers in args.workers:
+            r = run(workers, home, paths, args.frames, args.concurrency)
+            label = "inline" if workers == 0 else str(workers)
+            print(f"{label:>7} {r['fps']:>9.2f} {r['p50'] * 1000:>8.0f} {r['p99'] * 1000:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""Reproducible benchmark suite: synthetic gallery, rendered faces and
+attendance history in a scratch FACE_ATTENDANCE_HOME, scenarios driven
+through the Flask test client, results as JSON.
+
+Usage:
+    python benchmarks/suite.py [--identities 1000] [--rows 100000] [--images 20]
+                               [--scenarios gallery recognize ...] [--out results.json]
+    python benchmarks/suite.py --compare baseline.json [--threshold 0.15]
+    python benchmarks/suite.py --compare baseline.json --results results.json
+
+Scenarios (each in a fresh interpreter on a fresh copy of the data):
+  * gallery         app import and _load_known_faces with the stored encodings
+  * gallery_cold    app import when the rendered photos in known_faces/ must be encoded
+  * recognize       /api/recognize on the rendered frames (template people enrolled)
+  * attendance      /api/attendance pages: first, deep cursor, per user, 304
+  * export          /export of the whole history as CSV
+  * summaries       /api/summary/day, /days and /user from the rollups
+  * attendance_write  rows per second through the background AttendanceWriter
+
+Metrics ending in ``_ms`` are lower-is-better, ``_per_s`` higher-is-better.
+``--compare`` runs the suite (or reads ``--results``) and flags every metric
+that got worse than the baseline by more than ``--threshold``; the exit
+status is 1 when anything regressed.  Everything runs offline on the CPU.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+sys.path.insert(0, HERE)
+
+SCENARIOS = ["gallery", "gallery_cold", "recognize", "attendance", "export", "summaries", "attendance_write"]
+# Differences below this many milliseconds are noise, whatever the ratio
+MIN_DELTA_MS = 0.5
+
+
+# === Scenarios (run in the child process) ===
+def _median_ms(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return statistics.median(times) * 1000
+
+
+def _import_app():
+    """(app module, face_recognition import ms, app import ms)."""
+    t0 = time.perf_counter()
+    import face_recognition  # noqa: F401  (model loading is not the app's cost)
+    t1 = time.perf_counter()
+    import face_attendance.app as A
+    t2 = time.perf_counter()
+    return A, (t1 - t0) * 1000, (t2 - t1) * 1000
+
+
+def scenario_gallery(home, args):
+    A, model_ms, import_ms = _import_app()
+    return {"encodings": len(A.FACE_INDEX), "model_import_ms": model_ms, "app_import_ms": import_ms,
+            "load_ms": _median_ms(A._load_known_faces, args["repeats"])}
+
+
+def scenario_gallery_cold(home, args):
+    rendered = sorted(os.listdir(os.path.join(home, "rendered")))
+    for f in rendered:
+        shutil.copy2(os.path.join(home, "rendered", f), os.path.join(home, "known_faces", f))
+    A, model_ms, import_ms = _import_app()
+    return {"images": len(rendered), "app_import_ms": import_ms,
+            "per_image_ms": import_ms / max(len(rendered), 1)}
+
+
+def _enroll_templates(A):
+    """Enroll the people the rendered frames were made from, so frames are
+    recognized (and logged) rather than all unknown."""
+    import face_recognition
+    import numpy as np
+    from synthetic import TEMPLATE_DIR
+    for f in sorted(os.listdir(TEMPLATE_DIR)):
+        image = face_recognition.load_image_file(os.path.join(TEMPLATE_DIR, f))
+        encs = face_recognition.face_encodings(image)
+        if encs:
+            name = A.identity_name(f)
+            A._add_to_gallery(np.array(encs[:1]), [A._encoding_entry(name, encs[0], "bench")])
+
+
+def scenario_recognize(home, args):
+    A, _, _ = _import_app()
+    _enroll_templates(A)
+    folder = os.path.join(home, "rendered")
+    frames = [open(os.path.join(folder, f), "rb").read() for f in sorted(os.listdir(folder))]
+    client = A.app.test_client()
+    client.post("/api/recognize", data={"image": (io.BytesIO(frames[0]), "frame.jpg")})  # warm-up
+    latencies, stages, recognized = [], {}, 0
+    start = time.perf_counter()
+    for i in range(args["frames"]):
+        t = time.perf_counter()
+        r = client.post("/api/recognize", data={"image": (io.BytesIO(frames[i % len(frames)]), "frame.jpg")},
+                        headers={"X-Server-Timing": "1"})
+        latencies.append(time.perf_counter() - t)
+        recognized += sum(d["status"] == "recognized" for d in r.get_json().get("detections", []))
+        for part in r.headers.get("Server-Timing", "").split(","):
+            if ";dur=" in part:
+                stage, dur = part.strip().split(";dur=")
+                stages.setdefault(stage, []).append(float(dur))
+    elapsed = time.perf_counter() - start
+    A.ATTENDANCE_WRITER.flush()
+    latencies.sort()
+    result = {"gallery": len(A.FACE_INDEX), "frames": len(latencies), "recognized": recognized,
+              "frames_per_s": len(latencies) / elapsed,
+              "p50_ms": latencies[len(latencies) // 2] * 1000,
+              "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000}
+    result.update({f"stage_{stage}_ms": statistics.median(durs) for stage, durs in stages.items()})
+    return result
+
+
+def _get(client, url, **kwargs):
+    r = client.get(url, **kwargs)
+    if r.status_code not in (200, 304):
+        raise RuntimeError(f"GET {url} returned {r.status_code}")
+    return r
+
+
+def scenario_attendance(home, args):
+    A, _, _ = _import_app()
+    from utils import count_attendance, attendance_names, query_attendance
+    client = A.app.test_client()
+    rows = count_attendance()
+    name = attendance_names()[0]
+    middle = query_attendance(1, ascending=True, after_id=rows // 2)[0]["id"]
+    etag = _get(client, "/api/attendance?limit=500").headers["ETag"]
+    n = args["repeats"]
+    return {"rows": rows,
+            "first_page_ms": _median_ms(lambda: _get(client, "/api/attendance?limit=500"), n),
+            "deep_page_ms": _median_ms(lambda: _get(client, f"/api/attendance?limit=500&cursor={middle}"), n),
+            "user_page_ms": _median_ms(lambda: _get(client, f"/api/attendance/{name}?limit=500"), n),
+            "range_page_ms": _median_ms(lambda: _get(
+                client, "/api/attendance?limit=500&start_date=2000-01-01&end_date=2999-12-31"), n),
+            "not_modified_ms": _median_ms(lambda: _get(client, "/api/attendance?limit=500",
+                                                       headers={"If-None-Match": etag}), n)}
+
+
+def scenario_export(home, args):
+    A, _, _ = _import_app()
+    from utils import count_attendance
+    client = A.app.test_client()
+    rows = count_attendance()
+    export_ms = _median_ms(lambda: _get(client, "/export").get_data(), max(1, args["repeats"] // 5))
+    return {"rows": rows, "export_ms": export_ms, "rows_per_s": rows / (export_ms / 1000)}
+
+
+def scenario_summaries(home, args):
+    A, _, _ = _import_app()
+    from utils import db_cursor
+    with db_cursor() as c:
+        c.execute("SELECT date FROM attendance_days ORDER BY present DESC, date DESC LIMIT 1")
+        busiest = c.fetchone()[0]
+        c.execute("SELECT name FROM attendance_users ORDER BY scans DESC, name LIMIT 1")
+        name = c.fetchone()[0]
+    client = A.app.test_client()
+    month = busiest[:7]
+    n = args["repeats"]
+    return {"day_ms": _median_ms(lambda: _get(client, f"/api/summary/day/{busiest}"), n),
+            "days_ms": _median_ms(lambda: _get(client, f"/api/summary/days?month={month}"), n),
+            "user_ms": _median_ms(lambda: _get(client, f"/api/summary/user/{name}?month={month}"), n)}
+
+
+def scenario_attendance_write(home, args):
+    A, _, _ = _import_app()
+    from datetime import datetime, timedelta
+    from synthetic import identity_names
+    names = identity_names(args["identities"])
+    writer = A.ATTENDANCE_WRITER
+    when = datetime.now()
+    start = time.perf_counter()
+    for i in range(args["events"]):
+        writer.submit(names[i % len(names)], when + timedelta(seconds=i))
+    writer.flush()
+    elapsed = time.perf_counter() - start
+    return {"events": args["events"], "rows_per_s": args["events"] / elapsed,
+            "backpressure": writer.stats()["backpressure"]}
+
+
+def child(name, home, args):
+    os.environ["FACE_ATTENDANCE_HOME"] = home
+    sys.path.insert(0, ROOT)
+    result = globals()[f"scenario_{name}"](home, args)
+    print(json.dumps(result))
+
+
+# === Running and comparing ===
+def _meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    import numpy
+    return {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit,
+            "python": platform.python_version(), "numpy": numpy.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def run_suite(args):
+    from synthetic import populate
+    params = {"identities": args.identities, "photos": args.photos, "images": args.images,
+              "rows": args.rows, "days": args.days, "seed": args.seed, "frames": args.frames,
+              "events": args.events, "repeats": args.repeats}
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="face-bench-") as scratch:
+        base = os.path.join(scratch, "base")
+        t = time.perf_counter()
+        populate(base, args.identities, args.photos, args.images, args.rows, args.days, args.seed)
+        print(f"generated data in {time.perf_counter() - t:.1f}s", file=sys.stderr)
+        for name in args.scenarios:
+            home = os.path.join(scratch, name)
+            shutil.copytree(base, home)
+            env = dict(os.environ, FACE_ATTENDANCE_HOME=home, RECOGNITION_WORKERS=str(args.workers),
+                       SNAPSHOT_COMPACT_INTERVAL="86400")
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", name, home, json.dumps(params)]
+            proc = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+            if proc.returncode != 0:
+                sys.stderr.write(proc.stderr)
+                raise SystemExit(f"scenario {name} failed")
+            results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"{name:<17} " + "  ".join(f"{k}={_fmt(v)}" for k, v in results[name].items()),
+                  file=sys.stderr)
+            shutil.rmtree(home, ignore_errors=True)
+    return {"meta": _meta(), "params": params, "results": results}
+
+
+def _fmt(value):
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+
+def _direction(metric):
+    if metric.endswith("_per_s"):
+        return 1
+    if metric.endswith("_ms"):
+        return -1
+    return 0
+
+
+def compare(baseline, current, threshold):
+    """[(scenario, metric, base, current, change, status)]; change is the
+    relative change, status "regression", "improvement" or "ok"."""
+    rows = []
+    for scenario, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            base = baseline["results"].get(scenario, {}).get(metric)
+            direction = _direction(metric)
+            if base is None or not direction or not base:
+                continue
+            change = (value - base) / base
+            worse = -change * direction
+            status = "ok"
+            if metric.endswith("_ms") and abs(value - base) < MIN_DELTA_MS:
+                pass
+            elif worse > threshold:
+                status = "regression"
+            elif worse < -threshold:
+                status = "improvement"
+            rows.append((scenario, metric, base, value, change, status))
+    return rows
+
+
+def print_comparison(rows, baseline, current):
+    if baseline["params"] != current["params"]:
+        print("warning: baseline was run with different parameters:", baseline["params"])
+    print(f"{'scenario':<17} {'metric':<22} {'baseline':>10} {'current':>10} {'change':>8}")
+    for scenario, metric, base, value, change, status in rows:
+        flag = {"regression": "  REGRESSION", "improvement": "  improved"}.get(status, "")
+        print(f"{scenario:<17} {metric:<22} {base:>10.2f} {value:>10.2f} {change:>+7.0%}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--identities", type=int, default=1000)
+    parser.add_argument("--photos", type=int, default=1, help="encodings per identity")
+    parser.add_argument("--images", type=int, default=20, help="rendered face photos")
+    parser.add_argument("--rows", type=int, default=100000, help="attendance history rows")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--frames", type=int, default=40, help="frames posted by the recognize scenario")
+    parser.add_argument("--events", type=int, default=5000, help="rows written by attendance_write")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=0, help="RECOGNITION_WORKERS for the app")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmark-results.json", help="where to write the results")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a saved run")
+    parser.add_argument("--results", help="with --compare: compare this saved run instead of running")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative change counted as a regression")
+    parser.add_argument("--child", nargs=3, metavar=("SCENARIO", "HOME", "PARAMS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0], args.child[1], json.loads(args.child[2]))
+        return
+
+    if args.results:
+        with open(args.results, "r", encoding="utf-8") as f:
+            current = json.load(f)
+    else:
+        current = run_suite(args)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"results written to {args.out}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(baseline, current, args.threshold)
+        print_comparison(rows, baseline, current)
+        regressions = [r for r in rows if r[-1] == "regression"]
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Synthetic data for the benchmarks, written into a FACE_ATTENDANCE_HOME
+folder (the layout the app uses next to its code: data/, known_faces/...).
+
+Usage:
+    python benchmarks/synthetic.py HOME [--identities 1000] [--photos 1]
+                                        [--images 20] [--rows 100000] [--days 365]
+
+* gallery: ``--identities`` people with ``--photos`` random 128-d encodings
+  each, written straight into the encoding store (as if bulk-enrolled), so
+  loading them needs no face detection;
+* images: ``--images`` face photos rendered from the template photos in
+  face_attendance/known_faces/ (scaled, rotated, mirrored, relit and placed
+  on a random background), saved to HOME/rendered/ for the scenarios that
+  need real detection and encoding;
+* history: ``--rows`` attendance rows over the last ``--days`` days, a few
+  scans per person per working day, inserted into HOME/data/attendance.db.
+
+Benchmarks that want the real faces instead use ``copy_live_gallery``,
+which copies the app's own known_faces/, encoding store and legacy
+encoding files into a scratch HOME, so nothing they do touches the live data.
+
+Everything is generated from ``--seed``, so two runs produce the same data
+(history dates are relative to today).
+"""
+import os
+import sys
+import glob
+import shutil
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..", "face_attendance")
+sys.path.insert(0, APP_DIR)
+
+from encoding_store import EncodingStore
+
+TEMPLATE_DIR = os.path.join(APP_DIR, "known_faces")
+# Gallery files read at startup (encoding store and legacy files), relative to HOME
+GALLERY_FILES = [os.path.join("data", "known_encodings.npy"), os.path.join("data", "known_encodings.json"),
+                 os.path.join("data", "encodings.pickle"), "known_encodings.npy"]
+FRAME_SIZE = (640, 480)
+
+
+def identity_names(n):
+    return [f"Person{i:05d}" for i in range(n)]
+
+
+def make_encodings(identities, photos=1, seed=0, spread=0.06, noise=0.03):
+    """(encodings, names): ``photos`` rows per identity around a random center,
+    with distances resembling dlib encodings (same person ~0.4, others ~0.8+)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0.0, spread, size=(identities, 128)).astype(np.float32)
+    encodings = np.repeat(centers, photos, axis=0)
+    encodings += rng.normal(0.0, noise, size=encodings.shape).astype(np.float32)
+    names = [name for name in identity_names(identities) for _ in range(photos)]
+    return encodings, names
+
+
+def write_gallery(home, identities, photos=1, seed=0):
+    """Store ``identities`` x ``photos`` encodings in HOME/data/known_encodings.*."""
+    encodings, names = make_encodings(identities, photos, seed)
+    entries = [{"name": name, "key": f"synthetic:{row}", "source": "synthetic"}
+               for row, name in enumerate(names)]
+    data_dir = os.path.join(home, "data")
+    store = EncodingStore(os.path.join(data_dir, "known_encodings.npy"),
+                          os.path.join(data_dir, "known_encodings.json"))
+    store.save(encodings, entries, {})
+    return len(entries)
+
+
+def render_face(template, rng, size=FRAME_SIZE):
+    """One frame showing the face photo ``template`` (a PIL image) at a random
+    size, angle, brightness and position on a random background."""
+    from PIL import Image, ImageEnhance, ImageOps
+    face = template.convert("RGB")
+    height = int(size[1] * rng.uniform(0.45, 0.8))
+    face = face.resize((max(1, face.width * height // face.height), height), Image.BILINEAR)
+    if rng.random() < 0.5:
+        face = ImageOps.mirror(face)
+    face = face.rotate(float(rng.uniform(-8, 8)), resample=Image.BILINEAR, expand=False,
+                       fillcolor=tuple(int(v) for v in rng.integers(0, 255, 3)))
+    face = ImageEnhance.Brightness(face).enhance(float(rng.uniform(0.75, 1.25)))
+    frame = Image.new("RGB", size, tuple(int(v) for v in rng.integers(0, 255, 3)))
+    x = int(rng.integers(0, max(1, size[0] - face.width)))
+    y = int(rng.integers(0, max(1, size[1] - face.height)))
+    frame.paste(face, (x, y))
+    return frame
+
+
+def write_images(home, count, seed=0, templates=TEMPLATE_DIR):
+    """Render ``count`` frames into HOME/rendered/; returns their paths.
+
+    Each file is named after the template person (``Panha_0003.jpg``), so the
+    scenarios can enroll the templates and know who should be recognized."""
+    from PIL import Image
+    sources = sorted(glob.glob(os.path.join(templates, "*.jpg")) + glob.glob(os.path.join(templates, "*.png")))
+    if not sources:
+        raise SystemExit(f"No template photos in {templates}")
+    rng = np.random.default_rng(seed)
+    folder = os.path.join(home, "rendered")
+    os.makedirs(folder, exist_ok=True)
+    opened = [(os.path.splitext(os.path.basename(p))[0], Image.open(p)) for p in sources]
+    paths = []
+    for i in range(count):
+        name, template = opened[i % len(opened)]
+        path = os.path.join(folder, f"{name}_{i:04d}.jpg")
+        render_face(template, rng).save(path, "JPEG", quality=90)
+        paths.append(path)
+    return paths
+
+
+def make_history(rows, names, days=365, seed=0, end=None):
+    """(name, date, time) rows in chronological order: every working day in
+    the last ``days`` days, a random subset of ``names`` comes in around 9:00,
+    is seen a few more times and leaves around 17:00, until ``rows`` rows
+    (fewer if everyone has been seen every day before that)."""
+    rng = np.random.default_rng(seed)
+    end = end or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    workdays = [end - timedelta(days=d) for d in range(days, -1, -1) if (end - timedelta(days=d)).weekday() < 5]
+    per_day = max(1, -(-rows // max(len(workdays), 1)))
+    out = []
+    for day in workdays:
+        remaining = rows - len(out)
+        if remaining <= 0:
+            break
+        day_rows = []
+        for i in rng.permutation(len(names)):
+            if len(day_rows) >= min(per_day, remaining):
+                break
+            name = names[int(i)]
+            arrive = 9 * 3600 + rng.normal(0, 1200)
+            leave = 17 * 3600 + rng.normal(0, 1800)
+            for t in sorted([arrive, leave, *rng.uniform(arrive, leave, int(rng.integers(0, 3)))]):
+                t = int(t)
+                day_rows.append((name, day.strftime("%Y-%m-%d"), f"{t // 3600:02d}:{t % 3600 // 60:02d}:{t % 60:02d}"))
+        day_rows.sort(key=lambda r: (r[2], r[0]))
+        out.extend(day_rows[:remaining])
+    return out
+
+
+def write_history(home, rows, names, days=365, seed=0):
+    """Insert a synthetic history into HOME/data/attendance.db (rollups included)."""
+    os.environ["FACE_ATTENDANCE_HOME"] = home
+    import utils
+    if utils.HOME_DIR != home:
+        raise RuntimeError("utils was imported before FACE_ATTENDANCE_HOME was set")
+    utils.init_db()
+    history = make_history(rows, names, days, seed)
+    with utils.db_cursor() as c:
+        c.executemany("INSERT INTO attendance (name, date, time) VALUES (?, ?, ?)", history)
+    return len(history)
+
+
+def populate(home, identities=1000, photos=1, images=20, rows=100000, days=365, seed=0):
+    """Write a complete synthetic HOME; returns what was generated."""
+    for folder in ("data", "known_faces", "uploads", "exports"):
+        os.makedirs(os.path.join(home, folder), exist_ok=True)
+    return {"encodings": write_gallery(home, identities, photos, seed),
+            "images": len(write_images(home, images, seed)) if images else 0,
+            "rows": write_history(home, rows, identity_names(identities), days, seed) if rows else 0}
+
+
+def copy_live_gallery(home):
+    """Copy the app's known_faces/ and gallery files into ``home``."""
+    shutil.copytree(os.path.join(APP_DIR, "known_faces"), os.path.join(home, "known_faces"))
+    os.makedirs(os.path.join(home, "data"), exist_ok=True)
+    for name in GALLERY_FILES:
+        if os.path.exists(os.path.join(APP_DIR, name)):
+            shutil.copy2(os.path.join(APP_DIR, name), os.path.join(home, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("home", help="folder to populate (used as FACE_ATTENDANCE_HOME)")
+    parser.add_argument("--identities", type=int, default=1000)
+    parser.add_argument("--photos", type=int, default=1, help="encodings per identity")
+    parser.add_argument("--images", type=int, default=20, help="rendered face photos")
+    parser.add_argument("--rows", type=int, default=100000, help="attendance rows")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    home = os.path.abspath(args.home)
+    print(populate(home, args.identities, args.photos, args.images, args.rows, args.days, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,90 +1,425 @@
-from flask import Flask, render_template, request, jsonify, send_file, url_for, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_file, send_from_directory
+import io
 import os
-import csv
+import atexit
+import sys
+import json
+import hashlib
+import time
+import threading
 from datetime import datetime, timedelta
-import face_recognition
 import numpy as np
-from werkzeug.utils import secure_filename
+from werkzeug.datastructures import FileStorage
+from PIL import Image
+
+try:  # optional: WebSocket transport for /ws/recognize (pip install flask-sock)
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
 
 # === Setup base directory ===
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Sibling modules are imported flat (like enroll.py does), whether the app is
+# started from the project root (run.py / start.py) or from this folder.
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from face_index import FaceIndex
+from encoding_store import EncodingStore, file_digest
+from utils import (load_encodings, init_db, count_attendance,
+                   identity_name, known_face_files,
+                   HOME_DIR, KNOWN_FACES_DIR, KNOWN_ENCODINGS_PATH, KNOWN_META_PATH)
+from import_attendance import import_csv_attendance
+from attendance_writer import AttendanceWriter
+from recognition_engine import RecognitionEngine, load_models, models_loaded
+from batch_recognition import read_archive, recognize_frames
+from camera_session import SessionRegistry
+from snapshot_store import SnapshotStore
+from frame_stream import StreamRegistry
+from ingest import IngestedFrame
+from unknown_faces import UnknownFaces
+from reporting import bp as reporting_bp
+import metrics
+from metrics import timed
+
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = os.path.join(BASE_DIR, 'uploads')
+app.config['UPLOAD_FOLDER'] = os.path.join(HOME_DIR, 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
+app.config['MATCH_THRESHOLD'] = 0.6  # Max face distance accepted as a match
+# Number of k-means partitions for very large galleries (0 = exhaustive scan)
+app.config['FACE_INDEX_LISTS'] = int(os.environ.get("FACE_INDEX_LISTS", 0))
+app.config['FACE_INDEX_PROBES'] = int(os.environ.get("FACE_INDEX_PROBES", 4))
+# Identities may have many photos: "centroid"/"medoid" match one representative
+# per person first and fall back to the photos for close calls; "exhaustive"
+# compares against every photo
+app.config['GALLERY_MODE'] = os.environ.get("GALLERY_MODE", "centroid")
+# Adaptive per-camera pipeline for frames posted with a camera_id
+app.config['ADAPTIVE_DETECTION'] = os.environ.get("ADAPTIVE_DETECTION", "1") == "1"
+app.config['DETECT_WIDTH'] = int(os.environ.get("DETECT_WIDTH", 320))  # px, HOG input width
+app.config['REDETECT_EVERY'] = int(os.environ.get("REDETECT_EVERY", 10))  # frames between full detections
+app.config['SKIP_FRAME_DIFF'] = float(os.environ.get("SKIP_FRAME_DIFF", 2.0))  # mean abs diff, 0-255
+app.config['MAX_BATCH_FRAMES'] = int(os.environ.get("MAX_BATCH_FRAMES", 64))
+# Uncompressed size limits for images inside a batch archive (per image, whole batch)
+app.config['MAX_BATCH_FRAME_MB'] = int(os.environ.get("MAX_BATCH_FRAME_MB", 16))
+app.config['MAX_BATCH_MB'] = int(os.environ.get("MAX_BATCH_MB", 128))
+# Larger uploads are decoded at reduced size for detection (see ingest.py)
+app.config['INGEST_DETECT_WIDTH'] = int(os.environ.get("INGEST_DETECT_WIDTH", 640))
+app.config['ENCODE_FACE_WIDTH'] = int(os.environ.get("ENCODE_FACE_WIDTH", 160))  # px, min face width for encoding
+# Processes for detection/encoding/matching (0 = do it in the request thread)
+app.config['RECOGNITION_WORKERS'] = int(os.environ.get("RECOGNITION_WORKERS", 0))
+# Load dlib's models at startup instead of on the first frame (always done
+# before forking recognition workers)
+app.config['PRELOAD_MODELS'] = os.environ.get("PRELOAD_MODELS", "0") == "1"
+# Background attendance writer: max queued events and batch flush interval (s)
+app.config['ATTENDANCE_QUEUE_SIZE'] = int(os.environ.get("ATTENDANCE_QUEUE_SIZE", 1000))
+app.config['ATTENDANCE_FLUSH_INTERVAL'] = float(os.environ.get("ATTENDANCE_FLUSH_INTERVAL", 0.5))
+# Retries (with doubling waits) of a failed attendance insert before the batch is dropped
+app.config['ATTENDANCE_WRITE_RETRIES'] = int(os.environ.get("ATTENDANCE_WRITE_RETRIES", 3))
+# Seconds between checks for encodings appended by bulk_enroll.py or other app processes
+app.config['GALLERY_REFRESH_INTERVAL'] = float(os.environ.get("GALLERY_REFRESH_INTERVAL", 5.0))
+# Send per-stage timings in a Server-Timing header on every response (clients
+# can also ask per request with an "X-Server-Timing: 1" header)
+app.config['SERVER_TIMING'] = os.environ.get("SERVER_TIMING", "0") == "1"
+# Face snapshots of logged recognitions (see snapshot_store.py)
+app.config['SNAPSHOT_SIZE'] = int(os.environ.get("SNAPSHOT_SIZE", 160))  # px, longest side
+app.config['SNAPSHOT_QUALITY'] = int(os.environ.get("SNAPSHOT_QUALITY", 80))  # JPEG quality
+app.config['SNAPSHOT_RETENTION_DAYS'] = int(os.environ.get("SNAPSHOT_RETENTION_DAYS", 90))
+app.config['SNAPSHOT_MAX_MB'] = int(os.environ.get("SNAPSHOT_MAX_MB", 1024))
+app.config['SNAPSHOT_COMPACT_INTERVAL'] = float(os.environ.get("SNAPSHOT_COMPACT_INTERVAL", 3600))  # seconds
+# Streaming recognition: cameras without frames for this long are closed
+app.config['STREAM_IDLE_TIMEOUT'] = float(os.environ.get("STREAM_IDLE_TIMEOUT", 60))
+# Unrecognized faces kept for registration (see unknown_faces.py)
+app.config['UNKNOWN_CACHE_SIZE'] = int(os.environ.get("UNKNOWN_CACHE_SIZE", 256))  # face samples
+app.config['UNKNOWN_CACHE_TTL'] = float(os.environ.get("UNKNOWN_CACHE_TTL", 3600))  # seconds since last seen
+# Unknown sightings closer than this to a visitor's mean encoding are grouped
+# with them; defaults to the match tolerance so grouping agrees with recognition
+app.config['UNKNOWN_CLUSTER_THRESHOLD'] = float(os.environ.get("UNKNOWN_CLUSTER_THRESHOLD",
+                                                               app.config['MATCH_THRESHOLD']))
+app.config['UNKNOWN_SAMPLES_PER_CLUSTER'] = int(os.environ.get("UNKNOWN_SAMPLES_PER_CLUSTER", 8))
+
+ARCHIVE_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed",
+                         "application/x-tar", "application/gzip", "application/x-gzip")
 
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # === Create required folders ===
 for folder in ["uploads", "data", "exports", "known_faces"]:
-    os.makedirs(os.path.join(BASE_DIR, folder), exist_ok=True)
+    os.makedirs(os.path.join(HOME_DIR, folder), exist_ok=True)
 
-ATTENDANCE_FILE = os.path.join(BASE_DIR, "data", "attendance.csv")
-USER_ATTENDANCE_DIR = os.path.join(BASE_DIR, "data", "attendance_users")
-os.makedirs(USER_ATTENDANCE_DIR, exist_ok=True)
+# Legacy CSV logs, only read by the one-shot import into attendance.db
+ATTENDANCE_FILE = os.path.join(HOME_DIR, "data", "attendance.csv")
+USER_ATTENDANCE_DIR = os.path.join(HOME_DIR, "data", "attendance_users")
 
 # === Global cache for known faces ===
-KNOWN_ENCODINGS = []
-KNOWN_NAMES = []
+FACE_INDEX = FaceIndex()
+# Persistent encodings so startup only re-encodes new or changed images
+ENCODING_STORE = EncodingStore(KNOWN_ENCODINGS_PATH, KNOWN_META_PATH)
+# Written by register_unknown_face before the store existed; read once to migrate
+LEGACY_ENCODINGS_FILE = os.path.join(HOME_DIR, "known_encodings.npy")
+# (key, name) of every store entry already in FACE_INDEX, and when the store was last checked
+GALLERY_KEYS = set()
+GALLERY_SYNC = {"checked": 0.0, "mtime": None}
+GALLERY_SYNC_LOCK = threading.Lock()
 
 # === Rate-limit logging per user to avoid spam ===
 LAST_LOGGED = {}
 
+def _next_face_path(name):
+    """Free known_faces/ path for another photo of ``name``."""
+    known_faces_dir = KNOWN_FACES_DIR
+    base_filename = f"{name}.jpg"
+    counter = 1
+    while os.path.exists(os.path.join(known_faces_dir, base_filename)):
+        base_filename = f"{name}_{counter}.jpg"
+        counter += 1
+    return base_filename, os.path.join(known_faces_dir, base_filename)
+
+def _file_entry(file, image_path, digest):
+    """Store entry for an encoding derived from an image in known_faces/."""
+    st = os.stat(image_path)
+    return {"name": identity_name(file), "key": digest, "source": "file",
+            "file": file, "size": st.st_size, "mtime": st.st_mtime}
+
+def _encoding_entry(name, encoding, source):
+    """Store entry for an encoding that has no image file behind it."""
+    digest = hashlib.sha1(np.asarray(encoding, dtype=np.float32).tobytes()).hexdigest()
+    return {"name": name, "key": f"{source}:{digest}", "source": source}
+
+def _legacy_encodings():
+    """Yield (name, encoding, source) saved outside known_faces/ by older code:
+    enroll.py's pickle and the known_encodings.npy written by register_unknown."""
+    for name, encs in load_encodings().items():
+        for enc in encs:
+            yield name, enc, "enroll"
+    if os.path.exists(LEGACY_ENCODINGS_FILE):
+        try:
+            legacy = np.load(LEGACY_ENCODINGS_FILE, allow_pickle=True).item()
+        except (OSError, ValueError):
+            return
+        for enc, name in zip(legacy.get("encodings", []), legacy.get("names", [])):
+            yield name, enc, "manual"
+
 def _load_known_faces():
-    global KNOWN_ENCODINGS, KNOWN_NAMES
-    KNOWN_ENCODINGS, KNOWN_NAMES = [], []
-    known_faces_dir = os.path.join(BASE_DIR, "known_faces")
-    for file in os.listdir(known_faces_dir):
-        if file.lower().endswith((".jpg", ".jpeg", ".png")):
-            name = os.path.splitext(file)[0]
-            image_path = os.path.join(known_faces_dir, file)
+    """Build FACE_INDEX from the encoding store, re-encoding only the images
+    in known_faces/ whose bytes changed since the store was written."""
+    global FACE_INDEX
+    GALLERY_SYNC["mtime"] = _store_mtime()
+    store = ENCODING_STORE.load()
+    cached_rows = store.rows_by_key()
+    cached_files = {e.get("file"): e for e in store.entries if e["source"] == "file"}
+    encodings, entries, skipped = [], [], {}
+
+    known_faces_dir = KNOWN_FACES_DIR
+    files = known_face_files()
+    for file in files:
+        image_path = os.path.join(known_faces_dir, file)
+        # Skip hashing when size and mtime match what was cached
+        previous = cached_files.get(file)
+        st = os.stat(image_path)
+        if previous and (previous.get("size"), previous.get("mtime")) == (st.st_size, st.st_mtime):
+            digest = previous["key"]
+        else:
+            digest = file_digest(image_path)
+        if digest in store.skipped:
+            skipped[digest] = file
+            continue
+        row = cached_rows.get(digest)
+        if row is not None and store.entries[row]["source"] == "file":
+            encodings.append(np.array(store.matrix[row]))
+        else:
+            import face_recognition
             image = face_recognition.load_image_file(image_path)
             encs = face_recognition.face_encodings(image)
-            if len(encs) > 0:
-                KNOWN_ENCODINGS.append(encs[0])
-                KNOWN_NAMES.append(name)
-_load_known_faces()
-
-# === Create attendance.csv if not exists ===
-if not os.path.exists(ATTENDANCE_FILE):
-    with open(ATTENDANCE_FILE, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["id", "name", "date", "time", "image_path"])
-
-def _already_logged_today(name, date_str):
-    """Check if user already logged attendance today"""
-    user_file = os.path.join(USER_ATTENDANCE_DIR, f"{name}.csv")
-    if not os.path.exists(user_file):
-        return False
-    with open(user_file, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row["name"] == name and row["date"] == date_str:
-                return True
-    return False
-
-def _next_id(csv_path):
-    """Return the next integer ID for the given CSV (1-based). Falls back to 1 if file missing/empty."""
-    if not os.path.exists(csv_path):
-        return 1
+            if len(encs) == 0:
+                skipped[digest] = file
+                continue
+            encodings.append(encs[0])
+        entries.append(_file_entry(file, image_path, digest))
+
+    # Encoding happened outside the lock; the store is re-read under it so
+    # rows other writers appended meanwhile (registrations, bulk_enroll.py)
+    # are merged rather than overwritten.  Rows of the scanned files are
+    # replaced by the scan, other rows are kept unless their image is gone.
+    scanned = set(files)
+    with ENCODING_STORE.locked():
+        store = ENCODING_STORE.load()
+        # Keep encodings registered without an image and fold in legacy files,
+        # skipping legacy copies of encodings that came from known_faces/ anyway
+        from_files = np.array(encodings, dtype=np.float32).reshape(-1, store.dim)
+        seen = {entry["key"] for entry in entries}
+        for row, entry in enumerate(store.entries):
+            if entry["key"] in seen:
+                continue
+            if entry["source"] == "file" and (entry.get("file") in scanned or not os.path.exists(
+                    os.path.join(known_faces_dir, entry.get("file") or ""))):
+                continue
+            seen.add(entry["key"])
+            encodings.append(np.array(store.matrix[row]))
+            entries.append(entry)
+        for name, enc, source in _legacy_encodings():
+            entry = _encoding_entry(name, enc, source)
+            if len(from_files) and np.min(np.linalg.norm(from_files - np.asarray(enc, dtype=np.float32), axis=1)) < 1e-4:
+                continue
+            if entry["key"] not in seen:
+                seen.add(entry["key"])
+                encodings.append(enc)
+                entries.append(entry)
+
+        matrix = np.array(encodings, dtype=np.float32).reshape(-1, store.dim)
+        if entries != store.entries or skipped != store.skipped:
+            store.save(matrix, entries, skipped)
+
+    index = FaceIndex(capacity=max(len(entries), 1024),
+                      n_lists=app.config['FACE_INDEX_LISTS'],
+                      n_probe=app.config['FACE_INDEX_PROBES'],
+                      mode=app.config['GALLERY_MODE'])
+    index.add_many(matrix, [entry["name"] for entry in entries])
+    if index.n_lists:
+        index.build_partitions()
+    FACE_INDEX = index
+    GALLERY_KEYS.clear()
+    GALLERY_KEYS.update((entry["key"], entry["name"]) for entry in entries)
+    if RECOGNITION_ENGINE is not None:
+        RECOGNITION_ENGINE.gallery.reset(matrix, index.names)
+
+def _add_to_gallery(encodings, entries):
+    """Make new encodings (with their store entries) matchable in this
+    process and in the worker pool."""
+    names = [entry["name"] for entry in entries]
+    FACE_INDEX.add_many(encodings, names)
+    GALLERY_KEYS.update((entry["key"], entry["name"]) for entry in entries)
+    if RECOGNITION_ENGINE is not None:
+        RECOGNITION_ENGINE.gallery.add(encodings, names)
+
+def _store_mtime():
     try:
-        with open(csv_path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            max_id = 0
-            for row in reader:
-                try:
-                    rid = int(row.get("id", 0))
-                    if rid > max_id:
-                        max_id = rid
-                except (ValueError, TypeError):
-                    # Skip non-integer IDs
-                    continue
-            return max_id + 1
-    except Exception:
-        return 1
+        return os.stat(KNOWN_META_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+def _refresh_gallery():
+    """Add encodings that other processes appended to the store since the
+    last check (at most every GALLERY_REFRESH_INTERVAL seconds).
+
+    Only additions are picked up; removing people still needs a restart.
+    """
+    now = time.monotonic()
+    if now - GALLERY_SYNC["checked"] < app.config['GALLERY_REFRESH_INTERVAL']:
+        return 0
+    with GALLERY_SYNC_LOCK:
+        GALLERY_SYNC["checked"] = now
+        mtime = _store_mtime()
+        if mtime is None or mtime == GALLERY_SYNC["mtime"]:
+            return 0
+        GALLERY_SYNC["mtime"] = mtime
+        # A separate reader so request threads appending via ENCODING_STORE aren't disturbed
+        store = EncodingStore(KNOWN_ENCODINGS_PATH, KNOWN_META_PATH).load()
+        rows = [row for row, entry in enumerate(store.entries)
+                if (entry["key"], entry["name"]) not in GALLERY_KEYS]
+        if rows:
+            _add_to_gallery(np.array(store.matrix[rows]), [store.entries[row] for row in rows])
+            app.logger.info("Added %d new encodings from the encoding store", len(rows))
+        return len(rows)
+
+# === Recognition worker pool (optional) ===
+# The pool is started here, before any other thread, so the workers fork
+# from a parent that has just loaded the models (see RecognitionEngine).
+RECOGNITION_ENGINE = None
+_load_known_faces()
+if app.config['PRELOAD_MODELS']:
+    load_models()
+if app.config['RECOGNITION_WORKERS'] > 0:
+    RECOGNITION_ENGINE = RecognitionEngine(app.config['RECOGNITION_WORKERS'],
+                                           detect_width=app.config['INGEST_DETECT_WIDTH'],
+                                           face_width=app.config['ENCODE_FACE_WIDTH'],
+                                           # Workers match exactly like FACE_INDEX does
+                                           mode=app.config['GALLERY_MODE'],
+                                           n_lists=app.config['FACE_INDEX_LISTS'],
+                                           n_probe=app.config['FACE_INDEX_PROBES'])
+    RECOGNITION_ENGINE.gallery.reset(FACE_INDEX.encodings, FACE_INDEX.names)
+    atexit.register(RECOGNITION_ENGINE.close)
+
+# === Per-camera adaptive detection ===
+CAMERA_SESSIONS = SessionRegistry(detect_width=app.config['DETECT_WIDTH'],
+                                  face_width=app.config['ENCODE_FACE_WIDTH'],
+                                  redetect_every=app.config['REDETECT_EVERY'],
+                                  skip_threshold=app.config['SKIP_FRAME_DIFF'])
+
+def _detect_and_match(file, camera_id=None):
+    """Return (face_locations, encodings, matches) for an uploaded image.
+
+    Every frame is decoded through the ingest layer and detected, encoded
+    (and, for untagged frames, matched) in the worker pool when one is
+    configured, in this thread otherwise.  Frames tagged with a camera id
+    also go through that camera's adaptive session, which decides whether
+    to skip the frame, track the previous faces or detect afresh, at
+    DETECT_WIDTH instead of INGEST_DETECT_WIDTH.
+    face_recognition (and dlib's models) is imported on the first frame
+    that needs it in this process."""
+    _refresh_gallery()
+    threshold = app.config['MATCH_THRESHOLD']
+    if camera_id and app.config['ADAPTIVE_DETECTION']:
+        file.stream.seek(0)
+        detect = RECOGNITION_ENGINE.detect if RECOGNITION_ENGINE is not None else None
+        face_locations, encodings, mode = CAMERA_SESSIONS.get(camera_id).process(file.read(), detect)
+        metrics.FRAMES.inc(label_value=mode)
+        # Skipped frames reuse encodings, so matching stays here, against the current gallery
+        with timed("match"):
+            return face_locations, encodings, FACE_INDEX.match(encodings, threshold=threshold)
+    if RECOGNITION_ENGINE is not None:
+        file.stream.seek(0)
+        return RECOGNITION_ENGINE.recognize(file.read(), threshold)
+    import face_recognition
+    with timed("decode"):
+        frame = IngestedFrame(file, app.config['INGEST_DETECT_WIDTH'], app.config['ENCODE_FACE_WIDTH'])
+    with timed("detect"):
+        face_locations = face_recognition.face_locations(frame.image, model="hog")
+    if len(face_locations) == 0:
+        return [], [], []
+    with timed("encode"):
+        encodings = frame.encode(face_locations)
+    # Match every face in the frame against the gallery in one batch
+    with timed("match"):
+        return frame.to_full(face_locations), encodings, FACE_INDEX.match(encodings, threshold=threshold)
+
+# === Attendance database ===
+# attendance.db replaces the CSV files; existing CSV history is imported once
+# into an empty database (see import_attendance.py).
+init_db()
+if count_attendance() == 0:
+    import_csv_attendance(ATTENDANCE_FILE, USER_ATTENDANCE_DIR)
+
+# Face crops are kept in date folders under uploads/, trimmed in the background
+SNAPSHOT_STORE = SnapshotStore(app.config['UPLOAD_FOLDER'],
+                               size=app.config['SNAPSHOT_SIZE'],
+                               quality=app.config['SNAPSHOT_QUALITY'],
+                               retention_days=app.config['SNAPSHOT_RETENTION_DAYS'],
+                               max_bytes=app.config['SNAPSHOT_MAX_MB'] * 1024 * 1024)
+SNAPSHOT_STORE.start(app.config['SNAPSHOT_COMPACT_INTERVAL'])
+atexit.register(SNAPSHOT_STORE.stop)
+
+# Attendance rows and snapshots are written off the request thread
+ATTENDANCE_WRITER = AttendanceWriter(max_queue=app.config['ATTENDANCE_QUEUE_SIZE'],
+                                     flush_interval=app.config['ATTENDANCE_FLUSH_INTERVAL'],
+                                     retries=app.config['ATTENDANCE_WRITE_RETRIES'],
+                                     snapshots=SNAPSHOT_STORE).start()
+atexit.register(ATTENDANCE_WRITER.stop)
+
+# Unknown faces are clustered server-side; clients only get a token per visitor
+UNKNOWN_FACES = UnknownFaces(capacity=app.config['UNKNOWN_CACHE_SIZE'],
+                             ttl=app.config['UNKNOWN_CACHE_TTL'],
+                             cluster_threshold=app.config['UNKNOWN_CLUSTER_THRESHOLD'],
+                             samples_per_cluster=app.config['UNKNOWN_SAMPLES_PER_CLUSTER'])
+
+# === Metrics ===
+# Stage timings and face counters are recorded in metrics.py; these are read
+# when /metrics is scraped.  Each process keeps its own numbers.
+metrics.REGISTRY.callback("gallery_encodings", "Encodings in the face gallery.", lambda: len(FACE_INDEX))
+metrics.REGISTRY.callback("gallery_identities", "People in the face gallery.", lambda: len(FACE_INDEX.identities))
+metrics.REGISTRY.callback("camera_sessions", "Cameras with adaptive detection state.", lambda: len(CAMERA_SESSIONS))
+metrics.REGISTRY.callback("streams", "Open streaming connections.", lambda: len(STREAMS))
+metrics.REGISTRY.callback("recognition_workers", "Recognition worker processes.",
+                          lambda: app.config['RECOGNITION_WORKERS'])
+metrics.REGISTRY.callback("attendance_queue_depth", "Attendance events waiting to be written.",
+                          lambda: ATTENDANCE_WRITER.stats()["queue_depth"])
+metrics.REGISTRY.callback("attendance_written_total", "Attendance rows written.",
+                          lambda: ATTENDANCE_WRITER.stats()["written"], kind="counter")
+metrics.REGISTRY.callback("attendance_backpressure_total", "Attendance events written inline on a full queue.",
+                          lambda: ATTENDANCE_WRITER.stats()["backpressure"], kind="counter")
+metrics.REGISTRY.callback("attendance_errors_total", "Failed attendance or snapshot writes.",
+                          lambda: ATTENDANCE_WRITER.stats()["errors"], kind="counter")
+metrics.REGISTRY.callback("attendance_dropped_total", "Attendance rows given up after every retry failed.",
+                          lambda: ATTENDANCE_WRITER.stats()["dropped"], kind="counter")
+metrics.REGISTRY.callback("unknown_clusters", "Unknown visitors waiting for registration.",
+                          lambda: len(UNKNOWN_FACES))
+metrics.REGISTRY.callback("snapshot_bytes", "Size of the face snapshot store at the last compaction.",
+                          lambda: SNAPSHOT_STORE.stats()["bytes"] or 0)
+metrics.REGISTRY.callback("models_loaded", "1 once dlib's models are loaded in this process.",
+                          lambda: int(models_loaded()))
+metrics.REGISTRY.callback("profiler_running", "1 while the sampling profiler is on.",
+                          lambda: int(metrics.PROFILER.running))
+
+@app.before_request
+def _start_timing():
+    request.started_at = time.perf_counter()
+    metrics.start_request()
+
+@app.after_request
+def _finish_timing(response):
+    elapsed = time.perf_counter() - getattr(request, "started_at", time.perf_counter())
+    metrics.REQUEST_SECONDS.observe(elapsed, request.endpoint or "unknown")
+    timings = metrics.request_timings()
+    if timings and (app.config['SERVER_TIMING'] or request.headers.get("X-Server-Timing") == "1"):
+        response.headers["Server-Timing"] = metrics.server_timing(dict(timings, total=elapsed))
+    metrics.end_request()
+    return response
 
 # === Routes ===
+# Attendance listings, export, summaries and snapshots (see reporting.py)
+app.register_blueprint(reporting_bp)
+
 @app.route("/")
 def index():
     try:
@@ -118,63 +453,58 @@ def register_face():
     if not name or file.filename == "":
         return jsonify({"error": "Invalid name or file"}), 400
 
-    image = face_recognition.load_image_file(file)
-    encs = face_recognition.face_encodings(image)
+    # Enrollment photos are encoded at twice the usual face resolution
+    import face_recognition
+    frame = IngestedFrame(file, app.config['INGEST_DETECT_WIDTH'], 2 * app.config['ENCODE_FACE_WIDTH'])
+    locations = face_recognition.face_locations(frame.image)
+    encs = frame.encode(locations[:1])
     if len(encs) == 0:
         return jsonify({"error": "No face detected in uploaded image."}), 400
 
-    save_path = os.path.join(BASE_DIR, "known_faces", f"{name}.jpg")
+    # Each registration adds another photo; earlier ones stay in the gallery
+    filename, save_path = _next_face_path(name)
     file.stream.seek(0)
     file.save(save_path)
 
-    KNOWN_ENCODINGS.append(encs[0])
-    KNOWN_NAMES.append(name)
+    entry = _file_entry(filename, save_path, file_digest(save_path))
+    _add_to_gallery([encs[0]], [entry])
+    ENCODING_STORE.append([encs[0]], [entry])
 
     return jsonify({"success": True, "message": f"Face registered for {name}."})
 
-@app.route("/api/recognize", methods=["POST"])
-def recognize_face():
-    if "image" not in request.files:
-        return jsonify({"success": False, "message": "No image uploaded."}), 400
-
-    file = request.files["image"]
-    test_image = face_recognition.load_image_file(file)
-    face_locations = face_recognition.face_locations(test_image, model="hog")
-
-    if len(face_locations) == 0:
-        return jsonify({"success": False, "message": "No face detected."}), 400
-
-    test_encodings = face_recognition.face_encodings(test_image, face_locations)
+def _frame_result(face_locations, encodings, matches, now, get_snapshot):
+    """Build the detections for one frame and log attendance for recognized
+    faces (at most once a minute per person).  Unknown faces go to the
+    unknown-face cache and are returned as its tokens.  ``get_snapshot``
+    returns the frame bytes and is only called if someone is logged or an
+    unknown face is kept as a sample."""
     detections = []
-    unknown_face_encodings = []
+    unknown_face_tokens = []
     unknown_face_locations = []
 
-    now = datetime.now()
-    date = now.strftime("%Y-%m-%d")
-    time = now.strftime("%H:%M:%S")
-    file_time = time.replace(":", "-")
-    event_id_base = now.strftime("%Y%m%d-%H%M%S")
-
-    for i, (encoding, loc) in enumerate(zip(test_encodings, face_locations)):
-        name = None
-        confidence = 1.0
-        
-        if len(KNOWN_ENCODINGS) > 0:
-            face_distances = face_recognition.face_distance(KNOWN_ENCODINGS, encoding)
-            best_match = np.argmin(face_distances)
-            confidence = face_distances[best_match]
-            if confidence < 0.6:  # Lower is better match
-                name = KNOWN_NAMES[best_match]
-        
+    snapshot = None  # frame bytes, read once if anyone gets logged
+
+    def frame_bytes():
+        nonlocal snapshot
+        if snapshot is None:
+            snapshot = get_snapshot()
+        return snapshot
+
+    metrics.FACES.inc(len(face_locations), "detected")
+    for encoding, loc, (name, confidence, _row) in zip(encodings, face_locations, matches):
         top, right, bottom, left = loc
         
         if name is None:
-            # Store unknown face data for potential registration
-            unknown_face_encodings.append(encoding.tolist())  # Convert numpy array to list for JSON
+            metrics.FACES.inc(label_value="unknown")
+            # Cached (with a face crop) for registration; the client gets a token
+            token, seen = UNKNOWN_FACES.add(encoding, lambda loc=loc: SNAPSHOT_STORE.crop(frame_bytes(), loc))
+            unknown_face_tokens.append(token)
             unknown_face_locations.append(loc)
             detections.append({
                 "status": "unknown",
-                "face_id": len(unknown_face_encodings) - 1,
+                "face_id": len(unknown_face_tokens) - 1,
+                "token": token,
+                "seen": seen,
                 "top": top, 
                 "right": right, 
                 "bottom": bottom, 
@@ -193,146 +523,313 @@ def recognize_face():
             })
             
             # Log attendance for known faces
+            metrics.FACES.inc(label_value="recognized")
             last = LAST_LOGGED.get(name)
             if last and (now - last) < timedelta(seconds=60):
+                metrics.FACES.inc(label_value="rate_limited")
                 continue
-                
-            img_path = os.path.join(BASE_DIR, "uploads", f"{name}_{date}_{file_time}.jpg")
-            file.stream.seek(0)
-            file.save(img_path)
-
-            global_next_id = _next_id(ATTENDANCE_FILE)
-            user_file = os.path.join(USER_ATTENDANCE_DIR, f"{name}.csv")
-            user_next_id = _next_id(user_file)
-
-            with open(ATTENDANCE_FILE, "a", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow([global_next_id, name, date, time, img_path])
-
-            new_file = not os.path.exists(user_file)
-            with open(user_file, "a", newline="", encoding="utf-8") as uf:
-                writer = csv.writer(uf)
-                if new_file:
-                    writer.writerow(["id", "name", "date", "time", "image_path"])
-                writer.writerow([user_next_id, name, date, time, img_path])
-                
+
+            # The writer crops the face into the snapshot store and inserts the row
+            ATTENDANCE_WRITER.submit(name, now, frame_bytes(), loc)
+            metrics.FACES.inc(label_value="logged")
+
             LAST_LOGGED[name] = now
 
-    response = {
-        "success": True, 
-        "detections": detections
-    }
+    result = {"detections": detections}
     
     # Add unknown face data if any were found
-    if unknown_face_encodings:
-        response["unknown_faces"] = {
-            "encodings": unknown_face_encodings,
+    if unknown_face_tokens:
+        result["unknown_faces"] = {
+            "tokens": unknown_face_tokens,
             "locations": [{"top": t, "right": r, "bottom": b, "left": l} 
                          for (t, r, b, l) in unknown_face_locations]
         }
-    
+    return result
+
+@app.route("/api/recognize", methods=["POST"])
+def recognize_face():
+    if "image" not in request.files:
+        return jsonify({"success": False, "message": "No image uploaded."}), 400
+
+    with timed("parse"):
+        file = request.files["image"]
+        camera_id = request.form.get("camera_id")
+    face_locations, test_encodings, matches = _detect_and_match(file, camera_id)
+
+    if len(face_locations) == 0:
+        return jsonify({"success": False, "message": "No face detected."}), 400
+
+    def read_upload():
+        file.stream.seek(0)
+        return file.read()
+
+    response = {"success": True}
+    with timed("log"):
+        response.update(_frame_result(face_locations, test_encodings, matches, datetime.now(), read_upload))
     return jsonify(response)
 
-@app.route("/api/register_unknown", methods=["POST"])
-def register_unknown_face():
+def recognize_batch(frames):
+    """Recognize and log attendance for several frames in one call.
+
+    ``frames`` is a list of (filename, image bytes).  Frames are handled in
+    order with the same de-duplication as /api/recognize, so a person seen in
+    several frames is logged once.  Returns one result dict per frame.
+    """
+    _refresh_gallery()
+    blobs = [data for _name, data in frames]
+    threshold = app.config['MATCH_THRESHOLD']
+    if RECOGNITION_ENGINE is not None:
+        # Frames fan out across the worker processes
+        futures = [RECOGNITION_ENGINE.submit(data, threshold) for data in blobs]
+        raw = []
+        for future in futures:
+            try:
+                locations, encodings, matches = RECOGNITION_ENGINE.resolve(future.result(), threshold)
+                raw.append({"locations": locations, "encodings": encodings, "matches": matches})
+            except Exception as e:
+                raw.append({"error": str(e)})
+    else:
+        raw = recognize_frames(blobs, FACE_INDEX, threshold,
+                               detect_width=app.config['INGEST_DETECT_WIDTH'],
+                               face_width=app.config['ENCODE_FACE_WIDTH'])
+
+    now = datetime.now()
+    results = []
+    for (filename, data), frame in zip(frames, raw):
+        if "error" in frame:
+            results.append({"filename": filename, "success": False,
+                            "message": f"Could not read image: {frame['error']}"})
+        elif len(frame["locations"]) == 0:
+            results.append({"filename": filename, "success": False, "message": "No face detected."})
+        else:
+            result = {"filename": filename, "success": True}
+            with timed("log"):
+                result.update(_frame_result(frame["locations"], frame["encodings"], frame["matches"],
+                                        now, lambda data=data: data))
+            results.append(result)
+    return results
+
+@app.route("/api/recognize_batch", methods=["POST"])
+def recognize_batch_route():
+    """Recognize several frames in one request: multipart ``images`` files,
+    an ``archive`` file (zip/tar), or a raw zip/tar request body."""
+    def unpack(data, filename=""):
+        # Archives may only fill what is left of the batch
+        return read_archive(data, filename,
+                            max_frames=max(app.config['MAX_BATCH_FRAMES'] - len(frames), 0),
+                            max_frame_bytes=app.config['MAX_BATCH_FRAME_MB'] << 20,
+                            max_total_bytes=app.config['MAX_BATCH_MB'] << 20)
+
     try:
-        if not request.is_json:
-            return jsonify({"success": False, "message": "Missing JSON in request"}), 400
-            
-        data = request.get_json()
-        
-        if not all(key in data for key in ["name", "face_index", "encodings"]):
-            return jsonify({"success": False, "message": "Name, face index, and encodings are required"}), 400
-        
-        name = data["name"].strip()
-        face_index = data["face_index"]
-        encodings = data["encodings"]
-        
-        if not name or face_index < 0 or face_index >= len(encodings):
-            return jsonify({"success": False, "message": "Invalid name or face index"}), 400
-        
-        # Get the face encoding
+        frames = [(f.filename, f.read()) for f in request.files.getlist("images") if f.filename]
+        if "archive" in request.files:
+            archive = request.files["archive"]
+            frames.extend(unpack(archive.read(), archive.filename))
+        if not request.files and request.content_type in ARCHIVE_CONTENT_TYPES:
+            frames.extend(unpack(request.get_data()))
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    if not frames:
+        return jsonify({"success": False, "message": "No images uploaded."}), 400
+    if len(frames) > app.config['MAX_BATCH_FRAMES']:
+        return jsonify({"success": False,
+                        "message": f"At most {app.config['MAX_BATCH_FRAMES']} frames per batch."}), 400
+
+    return jsonify({"success": True, "frames": recognize_batch(frames)})
+
+# === Streaming recognition ===
+# A camera keeps one connection open and sends raw JPEG frames; only the
+# newest frame is processed (stale ones are dropped, see frame_stream.py) and
+# each result goes back as a compact message:
+#   {"faces": [[top, right, bottom, left, name or null, confidence, token or null], ...],
+#    "ms": processing time, "seq": frame number, "dropped": frames skipped,
+#    "lag_ms": time from arrival to result}
+# ``token`` identifies an unknown face for /api/register_unknown.
+def _stream_frame(camera_id, data):
+    start = time.perf_counter()
+    file = FileStorage(stream=io.BytesIO(data), filename="frame.jpg")
+    face_locations, encodings, matches = _detect_and_match(file, camera_id)
+    faces = []
+    if len(face_locations):
+        result = _frame_result(face_locations, encodings, matches, datetime.now(), lambda: data)
+        faces = [[d["top"], d["right"], d["bottom"], d["left"], d.get("name"), round(d.get("confidence", 0.0), 3),
+                  d.get("token")] for d in result["detections"]]
+    return {"faces": faces, "ms": round((time.perf_counter() - start) * 1000, 1)}
+
+STREAMS = StreamRegistry(_stream_frame, idle_timeout=app.config['STREAM_IDLE_TIMEOUT'])
+
+def _stream_message(message):
+    return json.dumps(message, separators=(",", ":"))
+
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route("/ws/recognize")
+    def recognize_stream_ws(ws):
+        """Binary messages are JPEG frames; every processed frame is answered
+        with a text message.  ``?camera_id=`` keeps adaptive detection state."""
+        camera_id = request.args.get("camera_id") or f"ws-{id(ws):x}"
+        stream = STREAMS.get(camera_id)
+        done = threading.Event()
+
+        def live():
+            """This connection's stream, reopened if the registry closed it
+            (idle or past max_streams) while the socket is still open."""
+            nonlocal stream
+            if stream.closed and not done.is_set():
+                stream = STREAMS.get(camera_id)
+            return stream
+
+        def send_results():
+            while not done.is_set():
+                message = live().next_result(timeout=1.0)
+                if message is None:
+                    continue
+                try:
+                    ws.send(_stream_message(message))
+                except Exception:
+                    return
+
+        sender = threading.Thread(target=send_results, name=f"ws-send-{camera_id}", daemon=True)
+        sender.start()
         try:
-            encoding = np.array(encodings[face_index])
-            
-            # Save the face image (we'll use the first available face from the last recognition)
-            known_faces_dir = os.path.join(BASE_DIR, "known_faces")
-            os.makedirs(known_faces_dir, exist_ok=True)
-            
-            # Generate a unique filename
-            base_filename = f"{name}.jpg"
-            counter = 1
-            while os.path.exists(os.path.join(known_faces_dir, base_filename)):
-                base_filename = f"{name}_{counter}.jpg"
-                counter += 1
-                
-            save_path = os.path.join(known_faces_dir, base_filename)
-            
-            # Try to get the face image from the last recognition
-            if hasattr(recognize_face, 'last_unknown_face_image'):
-                face_image = recognize_face.last_unknown_face_image
-                if face_image is not None:
-                    import cv2
-                    cv2.imwrite(save_path, cv2.cvtColor(face_image, cv2.COLOR_RGB2BGR))
-            
-            # Add to known faces
-            KNOWN_ENCODINGS.append(encoding)
-            KNOWN_NAMES.append(name)
-            
-            # Save the updated encodings to disk
-            np.save(os.path.join(BASE_DIR, "known_encodings.npy"), {"encodings": KNOWN_ENCODINGS, "names": KNOWN_NAMES})
-            
-            return jsonify({
-                "success": True, 
-                "message": f"Successfully registered {name}.",
-                "name": name
-            })
-            
-        except Exception as e:
-            return jsonify({"success": False, "message": f"Error processing face data: {str(e)}"}), 500
-            
-    except Exception as e:
-        return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
-
-@app.route("/api/attendance", methods=["GET"])
-def get_attendance():
-    data = []
-    if os.path.exists(ATTENDANCE_FILE):
-        with open(ATTENDANCE_FILE, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            data = list(reader)
-    return jsonify({"success": True, "attendance": data})
-
-@app.route("/api/users", methods=["GET"])
-def list_users():
-    users = set()
-    known_dir = os.path.join(BASE_DIR, "known_faces")
-    if os.path.isdir(known_dir):
-        for file in os.listdir(known_dir):
-            if file.lower().endswith((".jpg", ".jpeg", ".png")):
-                users.add(os.path.splitext(file)[0])
-    if os.path.isdir(USER_ATTENDANCE_DIR):
-        for file in os.listdir(USER_ATTENDANCE_DIR):
-            if file.lower().endswith(".csv"):
-                users.add(os.path.splitext(file)[0])
-    return jsonify({"success": True, "users": sorted(users)})
-
-@app.route("/api/attendance/<name>", methods=["GET"])
-def get_user_attendance(name):
-    user_file = os.path.join(USER_ATTENDANCE_DIR, f"{name}.csv")
-    records = []
-    if os.path.exists(user_file):
-        with open(user_file, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            records = list(reader)
-    return jsonify({"success": True, "attendance": records})
-
-@app.route("/export", methods=["GET"])
-def export_csv():
-    if not os.path.exists(ATTENDANCE_FILE):
-        return jsonify({"error": "No attendance data found."}), 404
-    return send_file(ATTENDANCE_FILE, as_attachment=True)
+            while True:
+                data = ws.receive()
+                if data is None:
+                    break
+                if isinstance(data, (bytes, bytearray)):
+                    live().push(bytes(data))
+        finally:
+            done.set()
+            STREAMS.close(camera_id)
+
+@app.route("/api/stream/<camera_id>", methods=["GET", "POST"])
+def recognize_stream_http(camera_id):
+    """Chunked-HTTP fallback for clients without WebSocket support.
+
+    POST a raw JPEG body to submit a frame (answered immediately); keep one
+    GET open to receive results as newline-delimited JSON."""
+    if request.method == "POST":
+        data = request.get_data()
+        if not data:
+            return jsonify({"success": False, "message": "Empty frame."}), 400
+        stream = STREAMS.get(camera_id)
+        stream.push(data)
+        return jsonify({"success": True, "seq": stream.received, "dropped": stream.frames.replaced}), 202
+
+    def generate():
+        yield _stream_message({"ready": True, "camera_id": camera_id}) + "\n"
+        while True:
+            message = STREAMS.get(camera_id).next_result(timeout=15)
+            # A bare newline every 15s keeps proxies from closing the stream
+            yield (_stream_message(message) if message is not None else "") + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# === Unknown faces ===
+# Recognition responses carry a token per unknown face; the samples behind it
+# (encodings and face crops) stay on the server until registered or expired.
+@app.route("/api/unknown_faces", methods=["GET"])
+def list_unknown_faces():
+    """Unknown visitors seen recently, most often seen first."""
+    return jsonify({"success": True, "clusters": UNKNOWN_FACES.clusters()})
+
+@app.route("/api/unknown_faces/<token>/<int:sample>.jpg", methods=["GET"])
+def unknown_face_image(token, sample):
+    crop = UNKNOWN_FACES.crop(token, sample)
+    if crop is None:
+        return jsonify({"success": False, "message": "No such face."}), 404
+    buf = io.BytesIO()
+    Image.fromarray(crop).save(buf, "JPEG", quality=90)
+    return Response(buf.getvalue(), mimetype="image/jpeg", headers={"Cache-Control": "no-store"})
+
+@app.route("/api/unknown_faces/<token>", methods=["DELETE"])
+def dismiss_unknown_face(token):
+    if not UNKNOWN_FACES.discard(token):
+        return jsonify({"success": False, "message": "No such face."}), 404
+    return jsonify({"success": True})
 
+@app.route("/api/register_unknown", methods=["POST"])
+def register_unknown_face():
+    """Enroll every cached sample of an unknown visitor (JSON ``name`` and
+    ``token``).  Samples with a face crop are saved to known_faces/."""
+    data = request.get_json(silent=True) or {}
+    name = str(data.get("name", "")).strip()
+    token = data.get("token")
+    if not name or not token:
+        return jsonify({"success": False, "message": "Name and token are required"}), 400
+
+    samples = UNKNOWN_FACES.samples(token)
+    if not samples or not len(samples[0]):
+        return jsonify({"success": False, "message": "That face is no longer cached; scan it again."}), 404
+    encodings, crops = samples
+
+    try:
+        entries = []
+        for encoding, crop in zip(encodings, crops):
+            if crop is None:
+                entries.append(_encoding_entry(name, encoding, "unknown"))
+                continue
+            # Extra photos are saved as name_1.jpg, name_2.jpg... of the same identity
+            filename, save_path = _next_face_path(name)
+            Image.fromarray(crop).save(save_path, "JPEG", quality=95)
+            entries.append(_file_entry(filename, save_path, file_digest(save_path)))
+        _add_to_gallery(encodings, entries)
+        # Persist the encodings so they survive a restart
+        ENCODING_STORE.append(encodings, entries)
+    except OSError as e:
+        return jsonify({"success": False, "message": f"Could not save the face: {e}"}), 500
+
+    UNKNOWN_FACES.discard(token)
+    return jsonify({
+        "success": True,
+        "message": f"Successfully registered {name} ({len(entries)} photos).",
+        "name": name,
+        "samples": len(entries)
+    })
+
+@app.route("/api/status", methods=["GET"])
+def status():
+    return jsonify({"success": True, "gallery_size": len(FACE_INDEX),
+                    "recognition_workers": app.config['RECOGNITION_WORKERS'],
+                    "models_loaded": models_loaded(),
+                    "camera_sessions": len(CAMERA_SESSIONS),
+                    "streams": STREAMS.stats(),
+                    "websocket": Sock is not None,
+                    "attendance_writer": ATTENDANCE_WRITER.stats(),
+                    "unknown_faces": UNKNOWN_FACES.stats(),
+                    "snapshots": SNAPSHOT_STORE.stats()})
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/profiler", methods=["GET", "POST"])
+def profiler():
+    """Switch the sampling profiler on or off (POST ``action=start|stop``,
+    optional ``interval`` in seconds) or read its collapsed stacks (GET;
+    ``?format=collapsed`` returns flamegraph input as text)."""
+    if request.method == "POST":
+        action = request.values.get("action")
+        if action == "start":
+            try:
+                interval = float(request.values.get("interval", 0.01))
+            except ValueError:
+                return jsonify({"success": False, "message": "interval must be a number"}), 400
+            metrics.PROFILER.start(max(interval, 0.001))
+        elif action == "stop":
+            metrics.PROFILER.stop()
+        else:
+            return jsonify({"success": False, "message": "action must be start or stop"}), 400
+        return jsonify({"success": True, "profiler": metrics.PROFILER.status()})
+    if request.args.get("format") == "collapsed":
+        text = "".join(f"{stack} {count}\n" for stack, count in metrics.PROFILER.collapsed())
+        return Response(text, mimetype="text/plain")
+    top = [{"stack": stack, "samples": count}
+           for stack, count in metrics.PROFILER.collapsed(request.args.get("limit", 20, type=int))]
+    return jsonify({"success": True, "profiler": metrics.PROFILER.status(), "top": top})
 
 if __name__ == "__main__":
     app.run(debug=False, port=5000)
@@ -0,0 +1,140 @@
+# attendance_writer.py
+import time
+import queue
+import logging
+import threading
+import metrics
+from utils import add_attendance_many
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class AttendanceWriter:
+    """Background stage that takes attendance inserts and snapshot saves off
+    the request thread.
+
+    ``submit`` puts one event on a bounded queue; a worker thread drains it,
+    saves face snapshots to ``snapshots`` (a SnapshotStore) and inserts the
+    rows, with the snapshot keys, in one transaction per batch.  A batch is
+    flushed when it reaches ``batch_size`` events or ``flush_interval``
+    seconds after its first event.  When the queue is full the caller writes
+    the event itself (counted as ``backpressure``) so no attendance is
+    dropped.  A failed insert (a locked or busy database) is retried
+    ``retries`` times, waiting ``retry_delay`` seconds and doubling the wait
+    each time, before the batch is given up (counted as ``dropped``).
+    """
+
+    def __init__(self, max_queue=1000, flush_interval=0.5, batch_size=100, snapshots=None,
+                 retries=3, retry_delay=0.2):
+        self.snapshots = snapshots
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"enqueued": 0, "written": 0, "batches": 0, "backpressure": 0, "errors": 0,
+                       "retries": 0, "dropped": 0}
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, name, when, frame=None, box=None):
+        """Queue an attendance row for writing, with a snapshot of the face at
+        ``box`` in the encoded ``frame`` when both are given."""
+        event = (name, when, frame, box)
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._count("backpressure")
+            self._write([event])
+            return
+        self._count("enqueued")
+
+    def flush(self):
+        """Block until every queued event has been written."""
+        self._queue.join()
+
+    def stop(self, timeout=10):
+        """Write out everything still queued and stop the worker thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        return stats
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def _run(self):
+        pending, deadline = [], None
+        while True:
+            timeout = None if not pending else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._write(pending)
+                self._done(len(pending) + 1)
+                return
+            if item is not None:
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(item)
+            if pending and (item is None or len(pending) >= self.batch_size
+                            or time.monotonic() >= deadline):
+                self._write(pending)
+                self._done(len(pending))
+                pending = []
+
+    def _done(self, n):
+        for _ in range(n):
+            self._queue.task_done()
+
+    def _write(self, events):
+        if not events:
+            return
+        rows = []
+        for name, when, frame, box in events:
+            key = None
+            if self.snapshots is not None and frame is not None and box is not None:
+                try:
+                    with metrics.timed("snapshot_write"):
+                        key = self.snapshots.save(frame, box, when)
+                except Exception:
+                    log.exception("Could not save snapshot for %s", name)
+                    self._count("errors")
+            rows.append((name, when, key))
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.timed("db_write"):
+                    add_attendance_many(rows)
+                break
+            except Exception:
+                if attempt == self.retries:
+                    log.exception("Could not write %d attendance rows, giving up after %d attempts",
+                                  len(events), attempt + 1)
+                    self._count("errors")
+                    self._count("dropped", len(events))
+                    return
+                delay = self.retry_delay * 2 ** attempt
+                log.warning("Could not write %d attendance rows, retrying in %.1fs", len(events), delay,
+                            exc_info=True)
+                self._count("retries")
+                time.sleep(delay)
+        self._count("written", len(events))
+        self._count("batches")
@@ -0,0 +1,164 @@
+# batch_recognition.py
+import io
+import os
+import tarfile
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import metrics
+from ingest import IngestedFrame, DETECT_WIDTH, ENCODE_FACE_WIDTH
+from utils import IMAGE_EXTENSIONS
+
+
+def _read_member(stream, name, size_limit, chunk_size=1 << 16):
+    """Read an archive member in chunks, refusing more than ``size_limit``
+    bytes whatever its header claims."""
+    chunks, total = [], 0
+    while True:
+        chunk = stream.read(min(chunk_size, size_limit - total + 1))
+        if not chunk:
+            return b"".join(chunks)
+        total += len(chunk)
+        if total > size_limit:
+            raise ValueError(f"{name} is larger than {size_limit // (1024 * 1024)} MB")
+        chunks.append(chunk)
+
+
+def read_archive(data, filename="", max_frames=64, max_frame_bytes=16 << 20, max_total_bytes=128 << 20,
+                 max_members=1024):
+    """Return [(name, bytes)] for the images inside a zip or tar archive,
+    sorted by name.
+
+    Raises ValueError for anything that isn't an archive and as soon as the
+    archive holds more than ``max_frames`` images or ``max_members``
+    entries, an image over ``max_frame_bytes`` or images over
+    ``max_total_bytes`` altogether; sizes are checked against the headers
+    first and enforced while reading, so a small archive can't expand into
+    a huge one in memory."""
+    buf = io.BytesIO(data)
+    frames, total = [], 0
+
+    def add(name, size, open_member):
+        nonlocal total
+        if len(frames) >= max_frames:
+            raise ValueError(f"{filename or 'archive'} has more than {max_frames} images")
+        if size > max_frame_bytes:
+            raise ValueError(f"{name} is larger than {max_frame_bytes // (1024 * 1024)} MB")
+        if total + size > max_total_bytes:
+            raise ValueError(f"{filename or 'archive'} holds more than {max_total_bytes // (1024 * 1024)} MB of images")
+        with open_member() as stream:
+            content = _read_member(stream, name, min(max_frame_bytes, max_total_bytes - total))
+        total += len(content)
+        frames.append((name, content))
+
+    if zipfile.is_zipfile(buf):
+        with zipfile.ZipFile(buf) as zf:
+            infos = zf.infolist()
+            if len(infos) > max_members:
+                raise ValueError(f"{filename or 'archive'} has more than {max_members} entries")
+            for info in sorted(infos, key=lambda i: i.filename):
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    add(info.filename, info.file_size, lambda info=info: zf.open(info))
+        return frames
+    buf.seek(0)
+    try:
+        with tarfile.open(fileobj=buf, mode="r:*") as tf:
+            # Walk the members as they come rather than indexing the whole
+            # (possibly compressed) archive first
+            for count, member in enumerate(tf, 1):
+                if count > max_members:
+                    raise ValueError(f"{filename or 'archive'} has more than {max_members} entries")
+                if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                    add(member.name, member.size, lambda member=member: tf.extractfile(member))
+    except (tarfile.TarError, EOFError, OSError, zlib.error):
+        raise ValueError(f"{filename or 'upload'} is not a zip or tar archive")
+    return sorted(frames, key=lambda frame: frame[0])
+
+
+def _decode_and_detect(data, model, detect_width, face_width):
+    import face_recognition
+    with metrics.timed("decode"):
+        frame = IngestedFrame(data, detect_width, face_width)
+    with metrics.timed("detect"):
+        return frame, face_recognition.face_locations(frame.image, model=model)
+
+
+def batch_face_encodings(images, locations, num_jitters=1):
+    """128-d encodings for the faces of several images in one dlib call.
+
+    Same landmarks (5-point) and descriptor as face_recognition.face_encodings,
+    but every face of every image goes through the network together.
+    Returns one (n_faces, 128) float32 array per image.
+    """
+    import dlib
+    from face_recognition import api as fr_api
+    out = [np.zeros((0, 128), dtype=np.float32) for _ in images]
+    batch_idx, batch_imgs, batch_shapes = [], [], []
+    for i, (image, locs) in enumerate(zip(images, locations)):
+        if image is None or not locs:
+            continue
+        shapes = dlib.full_object_detections()
+        for loc in locs:
+            shapes.append(fr_api.pose_predictor_5_point(image, fr_api._css_to_rect(loc)))
+        batch_idx.append(i)
+        batch_imgs.append(image)
+        batch_shapes.append(shapes)
+    if batch_imgs:
+        descriptors = fr_api.face_encoder.compute_face_descriptor(batch_imgs, batch_shapes, num_jitters)
+        for i, desc in zip(batch_idx, descriptors):
+            out[i] = np.asarray([np.asarray(d) for d in desc], dtype=np.float32)
+    return out
+
+
+def recognize_frames(blobs, index, threshold=0.6, workers=None, model="hog",
+                     detect_width=DETECT_WIDTH, face_width=ENCODE_FACE_WIDTH):
+    """Recognize faces in several encoded images at once.
+
+    Frames are read like single uploads (see ingest.IngestedFrame): decoding
+    at most ``detect_width`` wide and detection run concurrently on a thread
+    pool, faces wide enough in the detection image are encoded in one
+    batched dlib call (the others from a finer decode of their crops) and
+    matching is a single ``index.match`` over every face of every frame.
+    Returns one dict per frame with ``locations`` (in original pixels),
+    ``encodings`` and ``matches`` (as FaceIndex.match), or ``error`` if the
+    frame could not be decoded.
+    """
+    if not blobs:
+        return []
+    workers = workers or min(len(blobs), os.cpu_count() or 1) or 1
+    # Wall time of the parallel section; the pool threads record their own
+    # decode/detect stages in the histograms
+    with metrics.timed("decode_detect"), ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_decode_and_detect, data, model, detect_width, face_width) for data in blobs]
+    frames, locations, errors = [], [], []
+    for future in futures:
+        try:
+            frame, locs = future.result()
+            frames.append(frame)
+            locations.append(locs)
+            errors.append(None)
+        except Exception as e:
+            frames.append(None)
+            locations.append([])
+            errors.append(str(e))
+
+    with metrics.timed("encode"):
+        batched = [frame is not None and frame.encodes_in_place(locs) for frame, locs in zip(frames, locations)]
+        encodings = batch_face_encodings([frame.image if ok else None for frame, ok in zip(frames, batched)],
+                                         locations)
+        for i, (frame, locs, ok) in enumerate(zip(frames, locations, batched)):
+            if frame is not None and not ok:
+                encodings[i] = np.asarray(frame.encode(locs), dtype=np.float32).reshape(-1, 128)
+    with metrics.timed("match"):
+        all_matches = index.match(np.concatenate(encodings), threshold=threshold)
+
+    results, offset = [], 0
+    for frame, locs, encs, error in zip(frames, locations, encodings, errors):
+        matches = all_matches[offset:offset + len(encs)]
+        offset += len(encs)
+        if error is not None:
+            results.append({"error": error})
+        else:
+            results.append({"locations": frame.to_full(locs), "encodings": encs, "matches": matches})
+    return results
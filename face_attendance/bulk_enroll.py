@@ -0,0 +1,164 @@
+# bulk_enroll.py
+import os
+import csv
+import sys
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from encoding_store import EncodingStore, file_digest
+from utils import KNOWN_ENCODINGS_PATH, KNOWN_META_PATH, IMAGE_EXTENSIONS, identity_name
+
+
+def scan_directory(root):
+    """(name, path) pairs from ``root/Name/*.jpg`` folders and ``root/Name.jpg``
+    / ``root/Name_1.jpg`` files."""
+    items = []
+    for entry in sorted(os.listdir(root)):
+        path = os.path.join(root, entry)
+        if os.path.isdir(path):
+            for dirpath, _dirs, files in os.walk(path):
+                items.extend((entry, os.path.join(dirpath, f)) for f in sorted(files)
+                             if f.lower().endswith(IMAGE_EXTENSIONS))
+        elif entry.lower().endswith(IMAGE_EXTENSIONS):
+            items.append((identity_name(entry), path))
+    return items
+
+
+def read_manifest(path):
+    """(name, path) pairs from a CSV with ``name`` and ``path`` columns;
+    relative paths are resolved against the manifest's folder."""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return [(row["name"].strip(), os.path.join(base, row["path"].strip()))
+                for row in csv.DictReader(f) if row.get("name") and row.get("path")]
+
+
+def encode_image(name, path, key, max_width=1600, model="hog", allow_multiple=False):
+    """Encode one photo in a worker process.
+
+    Returns a dict with ``status`` ("ok", "no_face", "multiple_faces" or
+    "error") and, when ok, the encoding of the (largest) face.
+    """
+    import face_recognition
+    from PIL import Image
+    result = {"name": name, "path": path, "key": key}
+    try:
+        with Image.open(path) as img:
+            img = img.convert("RGB")
+            # Phone photos are far bigger than HOG needs
+            if max_width and img.width > max_width:
+                img = img.resize((max_width, round(img.height * max_width / img.width)), Image.BILINEAR)
+            image = np.asarray(img)
+        locations = face_recognition.face_locations(image, model=model)
+        result["faces"] = len(locations)
+        if not locations:
+            result["status"] = "no_face"
+            return result
+        if len(locations) > 1 and not allow_multiple:
+            result["status"] = "multiple_faces"
+            return result
+        largest = max(locations, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]))
+        result["encoding"] = np.asarray(face_recognition.face_encodings(image, [largest])[0], dtype=np.float32)
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+    return result
+
+
+def bulk_enroll(items, store=None, workers=None, max_width=1600, model="hog",
+                allow_multiple=False, progress=None):
+    """Encode (name, path) items on a process pool and append the new ones to
+    the encoding store in a single atomic write.
+
+    Photos whose bytes are already enrolled under the same name are not
+    re-encoded.  Returns a report dict with per-status counts, the failed
+    files and throughput.
+    """
+    store = store or EncodingStore(KNOWN_ENCODINGS_PATH, KNOWN_META_PATH)
+    known = {(e["key"], e["name"]) for e in store.load().entries}
+    start = time.perf_counter()
+    counts = {"ok": 0, "no_face": 0, "multiple_faces": 0, "error": 0, "already_enrolled": 0}
+    failures = []
+    encodings, entries = [], []
+
+    # Hashing is cheap next to detection, so duplicates are dropped up front
+    pending = []
+    for name, path in items:
+        try:
+            key = file_digest(path)
+        except OSError as e:
+            counts["error"] += 1
+            failures.append({"name": name, "path": path, "status": "error", "error": str(e)})
+            continue
+        if (key, name) in known:
+            counts["already_enrolled"] += 1
+        else:
+            known.add((key, name))
+            pending.append((name, path, key))
+    done = len(items) - len(pending)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(encode_image, name, path, key, max_width, model, allow_multiple)
+                   for name, path, key in pending]
+        for future in as_completed(futures):
+            r = future.result()
+            status = r["status"]
+            done += 1
+            counts[status] += 1
+            if status == "ok":
+                encodings.append(r["encoding"])
+                entries.append({"name": r["name"], "key": r["key"], "source": "bulk",
+                                "path": os.path.abspath(r["path"])})
+            else:
+                failures.append({k: r.get(k) for k in ("name", "path", "status", "faces", "error")
+                                 if r.get(k) is not None})
+            if progress:
+                progress(done, len(items), time.perf_counter() - start)
+
+    if encodings:
+        store.append(encodings, entries)
+    elapsed = time.perf_counter() - start
+    return {"total": len(items), "counts": counts, "failures": failures, "seconds": elapsed,
+            "images_per_second": len(items) / elapsed if elapsed else 0.0,
+            "gallery_size": len(store.entries), "identities": len({e["name"] for e in store.entries})}
+
+
+def _print_progress(done, total, elapsed):
+    if done == total or done % 50 == 0:
+        rate = done / elapsed if elapsed else 0.0
+        eta = (total - done) / rate if rate else 0.0
+        print(f"\r{done}/{total} images  {rate:.1f} img/s  ETA {eta:.0f}s", end="", file=sys.stderr)
+        if done == total:
+            print(file=sys.stderr)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Enroll many photos into the face gallery at once")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="folder with Name/*.jpg sub-folders or Name.jpg files")
+    source.add_argument("--manifest", help="CSV file with name,path columns")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--max-width", type=int, default=1600, help="downscale wider photos before detection")
+    parser.add_argument("--model", choices=["hog", "cnn"], default="hog")
+    parser.add_argument("--allow-multiple", action="store_true", help="use the largest face in group photos")
+    parser.add_argument("--report", help="write the full JSON report here")
+    args = parser.parse_args()
+
+    items = scan_directory(args.dir) if args.dir else read_manifest(args.manifest)
+    report = bulk_enroll(items, workers=args.workers, max_width=args.max_width, model=args.model,
+                         allow_multiple=args.allow_multiple, progress=_print_progress)
+    print(f"Processed {report['total']} images in {report['seconds']:.1f}s "
+          f"({report['images_per_second']:.1f} img/s)")
+    for status, n in report["counts"].items():
+        print(f"  {status:<17} {n}")
+    for failure in report["failures"][:20]:
+        print(f"  ! {failure['status']:<15} {failure['path']}")
+    if len(report["failures"]) > 20:
+        print(f"  ... {len(report['failures']) - 20} more (see --report)")
+    print(f"Gallery now holds {report['gallery_size']} encodings of {report['identities']} people")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,161 @@
+# camera_session.py
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+import metrics
+from ingest import IngestedFrame, decode
+
+# Width of the decode used only to tell whether the scene changed
+THUMBNAIL_DECODE_WIDTH = 128
+
+
+def thumbnail(image, size=(64, 48)):
+    """Tiny grayscale copy used to tell whether the scene changed."""
+    return np.asarray(Image.fromarray(image).convert("L").resize(size, Image.BILINEAR), dtype=np.float32)
+
+
+def frame_difference(a, b):
+    """Mean absolute difference of two thumbnails (0-255 scale)."""
+    return float(np.mean(np.abs(a - b)))
+
+
+def _track(image, boxes, upsample=1, roi_margin=0.5):
+    """Re-detect inside regions around ``boxes``; None if any face is lost."""
+    import face_recognition
+    h, w = image.shape[:2]
+    found = []
+    for top, right, bottom, left in boxes:
+        mh = int((bottom - top) * roi_margin)
+        mw = int((right - left) * roi_margin)
+        y0, y1 = max(0, top - mh), min(h, bottom + mh)
+        x0, x1 = max(0, left - mw), min(w, right + mw)
+        crop = np.ascontiguousarray(image[y0:y1, x0:x1])
+        locs = face_recognition.face_locations(crop, number_of_times_to_upsample=upsample)
+        if not locs:
+            return None
+        # Keep the largest face in the region
+        t, r, b, l = max(locs, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+        found.append((t + y0, r + x0, b + y0, l + x0))
+    return found
+
+
+def detect_frame(source, detect_width=320, face_width=160, upsample=1, boxes=None, roi_margin=0.5):
+    """Detect and encode the faces of an upload (bytes or file).
+
+    The upload goes through the ingest layer: decoded at most
+    ``detect_width`` wide for detection, faces encoded at just enough
+    resolution.  With ``boxes`` (the previous frame's faces, in detection
+    coordinates) HOG only runs around them, and on the whole frame if one
+    is lost.  Returns (boxes, locations, encodings, mode): boxes in
+    detection coordinates, locations in original pixels, mode "tracked" or
+    "full".  Runs in the request thread or in a recognition worker.
+    """
+    import face_recognition
+    with metrics.timed("decode"):
+        frame = IngestedFrame(source, detect_width, face_width)
+    found, mode = None, "full"
+    if boxes:
+        with metrics.timed("track"):
+            found = _track(frame.image, boxes, upsample, roi_margin)
+        mode = "tracked"
+    if found is None:
+        with metrics.timed("detect"):
+            found = face_recognition.face_locations(frame.image, number_of_times_to_upsample=upsample)
+        mode = "full"
+    with metrics.timed("encode"):
+        encodings = frame.encode(found) if found else []
+    return found, frame.to_full(found), encodings, mode
+
+
+class CameraSession:
+    """Detection state for one camera.
+
+    Each frame goes through three cheaper-first steps:
+
+    * skip: if the frame barely differs from the last processed one, the
+      previous detections and encodings are returned without any detection
+      or encoding work (telling needs only a 1/8-scale decode);
+    * track: while faces were found recently, HOG only runs inside boxes
+      around the previous faces (a full re-detect happens every
+      ``redetect_every`` frames, on a large scene change, or when a tracked
+      face is lost);
+    * detect: otherwise HOG runs on the frame decoded ``detect_width`` wide.
+
+    The session only makes these decisions; the work is ``detect_frame``,
+    which ``process`` runs in this thread unless given another runner (the
+    app passes its worker pool's).  Boxes are mapped back to the original
+    frame and faces are encoded at ``face_width`` pixels or more.
+    """
+
+    def __init__(self, detect_width=320, face_width=160, upsample=1, roi_margin=0.5, redetect_every=10,
+                 skip_threshold=2.0, scene_change_threshold=12.0, max_skip=15):
+        self.detect_width = detect_width
+        self.face_width = face_width
+        self.upsample = upsample
+        self.roi_margin = roi_margin
+        self.redetect_every = redetect_every
+        self.skip_threshold = skip_threshold
+        self.scene_change_threshold = scene_change_threshold
+        self.max_skip = max_skip
+        self.last_seen = time.monotonic()
+        self._lock = threading.Lock()
+        self._thumb = None
+        self._boxes = []          # previous faces in detection-image coordinates
+        self._last = None         # (locations, encodings) of the last processed frame
+        self._skipped = 0
+        self._since_full = 0
+
+    def process(self, source, detect=None):
+        """Return (face_locations, encodings, mode) for an upload (bytes or
+        file), where mode is "skipped", "tracked" or "full".  ``detect`` runs
+        ``detect_frame``'s work (same arguments and result)."""
+        with self._lock:
+            self.last_seen = time.monotonic()
+            with metrics.timed("decode"):
+                small, _scale = decode(source, THUMBNAIL_DECODE_WIDTH)
+                thumb = thumbnail(np.asarray(small))
+            diff = None if self._thumb is None else frame_difference(thumb, self._thumb)
+            if (diff is not None and self._last is not None and diff < self.skip_threshold
+                    and self._skipped < self.max_skip):
+                self._skipped += 1
+                return self._last[0], self._last[1], "skipped"
+            self._skipped = 0
+            self._thumb = thumb
+
+            track = (self._boxes and self._since_full < self.redetect_every
+                     and diff is not None and diff < self.scene_change_threshold)
+            boxes, locations, encodings, mode = (detect or detect_frame)(
+                source, self.detect_width, self.face_width, self.upsample,
+                self._boxes if track else None, self.roi_margin)
+            self._since_full = self._since_full + 1 if mode == "tracked" else 0
+            self._boxes = boxes
+            self._last = (locations, encodings)
+            return locations, encodings, mode
+
+
+class SessionRegistry:
+    """Per-camera sessions, least recently used evicted past ``max_sessions``
+    or after ``idle_timeout`` seconds without frames."""
+
+    def __init__(self, max_sessions=64, idle_timeout=600, **session_options):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.session_options = session_options
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, camera_id):
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, s in self._sessions.items() if now - s.last_seen > self.idle_timeout]:
+                del self._sessions[key]
+            session = self._sessions.pop(camera_id, None) or CameraSession(**self.session_options)
+            self._sessions[camera_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
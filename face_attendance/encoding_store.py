@@ -0,0 +1,119 @@
+# encoding_store.py
+import os
+import json
+import hashlib
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not expected to run concurrently
+    fcntl = None
+
+STORE_VERSION = 1
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-1 of a file's bytes, used as the cache key for its encoding."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class EncodingStore:
+    """On-disk gallery cache: an ``.npy`` matrix plus a JSON sidecar.
+
+    Row ``i`` of the matrix belongs to ``entries[i]``, a dict with at least
+    ``name``, ``key`` and ``source``.  Image-derived entries are keyed by the
+    SHA-1 of the image bytes so only changed images need re-encoding; the
+    matrix is memory-mapped on load.  ``skipped`` maps digests of images with
+    no detectable face to their file name so they are not retried either.
+    """
+
+    def __init__(self, matrix_path, meta_path, dim=128):
+        self.matrix_path = matrix_path
+        self.meta_path = meta_path
+        self.dim = dim
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.entries = []
+        self.skipped = {}
+        self.generation = 0
+
+    def load(self):
+        """Read the store from disk; a missing or corrupt store loads empty."""
+        self.matrix = np.zeros((0, self.dim), dtype=np.float32)
+        self.entries, self.skipped, self.generation = [], {}, 0
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.meta_path)):
+            return self
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            matrix = np.load(self.matrix_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return self
+        entries = meta.get("entries", [])
+        if meta.get("version") != STORE_VERSION or matrix.shape != (len(entries), self.dim):
+            return self
+        self.matrix = matrix
+        self.entries = entries
+        self.skipped = meta.get("skipped", {})
+        self.generation = meta.get("generation", 0)
+        return self
+
+    def rows_by_key(self):
+        return {entry["key"]: row for row, entry in enumerate(self.entries)}
+
+    @contextmanager
+    def locked(self):
+        """Exclusive lock so concurrent writers don't interleave saves."""
+        with open(self.meta_path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self, matrix, entries, skipped=None):
+        """Atomically replace the store contents and bump its generation."""
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        if len(matrix) != len(entries):
+            raise ValueError("matrix rows and entries must have the same length")
+        skipped = self.skipped if skipped is None else skipped
+        meta = {
+            "version": STORE_VERSION,
+            "generation": self.generation + 1,
+            "entries": list(entries),
+            "skipped": skipped,
+        }
+        folder = os.path.dirname(self.matrix_path)
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_matrix = tempfile.mkstemp(dir=folder, suffix=".npy.tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, matrix)
+        fd, tmp_meta = tempfile.mkstemp(dir=folder, suffix=".json.tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        # Drop our memory map of the old file before replacing it (Windows
+        # refuses to replace a mapped file).
+        self.matrix = np.zeros((0, self.dim), dtype=np.float32)
+        # Matrix first: a reader seeing old meta with a new matrix fails the
+        # shape check and treats the store as cold rather than misaligned.
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_meta, self.meta_path)
+        self.matrix = matrix
+        self.entries = list(entries)
+        self.skipped = skipped
+        self.generation = meta["generation"]
+
+    def append(self, encodings, entries):
+        """Add rows to the persisted store in one atomic rewrite."""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        with self.locked():
+            self.load()
+            self.save(np.concatenate([np.asarray(self.matrix), encodings]),
+                      self.entries + list(entries))
@@ -0,0 +1,362 @@
+# face_index.py
+import threading
+import numpy as np
+
+
+class FaceIndex:
+    """In-memory gallery of face encodings kept in one float32 matrix.
+
+    Rows are appended in place (the matrix doubles when full) and all queries
+    are answered with a single batched distance computation, so matching N
+    faces in a frame costs one matrix product instead of N passes over a
+    Python list.
+
+    When ``n_lists`` is set the index can also be partitioned with k-means
+    (see ``build_partitions``); queries then only scan the rows of the
+    ``n_probe`` closest partitions.
+
+    A name may own many rows (several photos of one person).  In "centroid"
+    or "medoid" mode ``match`` first compares queries against one
+    representative per identity, so the cost follows headcount rather than
+    photo count.  The representatives only shortlist: the verdict is the
+    distance to the nearest photo of the best identity, or of the
+    ``fallback_k`` best ones when the call is close (runner-up within
+    ``margin``, or that photo not clearly below the threshold), so it agrees
+    with exhaustive matching.  A partitioned index only shortlists identities
+    with photos in the probed partitions.
+    """
+
+    MODES = ("exhaustive", "centroid", "medoid")
+
+    def __init__(self, dim=128, capacity=1024, n_lists=0, n_probe=4,
+                 mode="exhaustive", margin=0.08, fallback_k=3):
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {', '.join(self.MODES)}")
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.mode = mode
+        self.margin = margin
+        self.fallback_k = fallback_k
+        self._matrix = np.zeros((max(capacity, 1), dim), dtype=np.float32)
+        self._sq_norms = np.zeros(max(capacity, 1), dtype=np.float32)
+        self._names = []
+        self._count = 0
+        self._lock = threading.Lock()
+        # Coarse partitioning state (None until build_partitions is called)
+        self._centroids = None
+        self._lists = None
+        self._list_cache = {}
+        # Identities: name -> id, rows per id and one representative per id
+        self._identity_ids = {}
+        self._identity_names = []
+        self._identity_rows = []
+        self._identity_cache = {}
+        self._row_idents = np.zeros(max(capacity, 1), dtype=np.int64)  # row -> identity id
+        self._reps = np.zeros((64, dim), dtype=np.float32)
+        self._rep_norms = np.zeros(64, dtype=np.float32)
+        self._n_reps = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def identities(self):
+        """Distinct names, in enrollment order."""
+        return list(self._identity_names)
+
+    def rows_for(self, name):
+        """Row numbers holding encodings of ``name``."""
+        ident = self._identity_ids.get(name)
+        return [] if ident is None else list(self._identity_rows[ident])
+
+    @property
+    def names(self):
+        return list(self._names)
+
+    @property
+    def encodings(self):
+        """Read-only view of the stored encodings (count x dim)."""
+        view = self._matrix[:self._count]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def partitioned(self):
+        return self._centroids is not None
+
+    # === Insertion ===
+    def _grow(self, needed):
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:self._count] = self._matrix[:self._count]
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        sq_norms[:self._count] = self._sq_norms[:self._count]
+        # Swap in whole arrays so concurrent readers keep a consistent view
+        self._matrix, self._sq_norms = matrix, sq_norms
+
+    def add(self, encoding, name):
+        """Append one encoding and return its row number."""
+        return self.add_many([encoding], [name])[0]
+
+    def add_many(self, encodings, names):
+        """Append several encodings at once and return their row numbers."""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        names = list(names)
+        if len(names) != len(encodings):
+            raise ValueError("encodings and names must have the same length")
+        with self._lock:
+            start = self._count
+            end = start + len(encodings)
+            self._grow(end)
+            self._matrix[start:end] = encodings
+            self._sq_norms[start:end] = np.einsum("ij,ij->i", encodings, encodings)
+            self._names.extend(names)
+            self._update_identities(start, names)
+            if self._centroids is not None and len(encodings):
+                assignment = self._nearest_lists(encodings, 1)[:, 0]
+                for row, list_id in zip(range(start, end), assignment):
+                    self._lists[list_id].append(row)
+                    self._list_cache.pop(int(list_id), None)
+            self._count = end
+        return list(range(start, end))
+
+    @staticmethod
+    def _grown(arr, needed):
+        if needed <= arr.shape[0]:
+            return arr
+        capacity = arr.shape[0]
+        while capacity < needed:
+            capacity *= 2
+        out = np.zeros((capacity,) + arr.shape[1:], dtype=arr.dtype)
+        out[:arr.shape[0]] = arr
+        return out
+
+    def _update_identities(self, start, names):
+        dirty = set()
+        row_idents = self._grown(self._row_idents, start + len(names))
+        for offset, name in enumerate(names):
+            ident = self._identity_ids.get(name)
+            if ident is None:
+                ident = len(self._identity_names)
+                self._identity_ids[name] = ident
+                self._identity_names.append(name)
+                self._identity_rows.append([])
+            self._identity_rows[ident].append(start + offset)
+            self._identity_cache.pop(ident, None)
+            row_idents[start + offset] = ident
+            dirty.add(ident)
+        self._row_idents = row_idents
+        if self.mode == "exhaustive":
+            return
+        n_ids = len(self._identity_names)
+        reps = self._grown(self._reps, n_ids)
+        rep_norms = self._grown(self._rep_norms, n_ids)
+        if reps is self._reps:
+            # Update copies so concurrent readers never see half-written rows
+            reps, rep_norms = reps.copy(), rep_norms.copy()
+        for ident in dirty:
+            samples = self._matrix[self._identity_rows[ident]]
+            if self.mode == "medoid" and len(samples) > 2:
+                norms = np.einsum("ij,ij->i", samples, samples)
+                sq = np.maximum(norms[:, None] + norms[None, :] - 2.0 * samples @ samples.T, 0.0)
+                rep = samples[np.argmin(np.sqrt(sq).sum(axis=1))]
+            else:
+                rep = samples.mean(axis=0)
+            reps[ident] = rep
+            rep_norms[ident] = rep @ rep
+        self._reps, self._rep_norms, self._n_reps = reps, rep_norms, n_ids
+
+    def _identity_row_array(self, ident):
+        rows = self._identity_cache.get(ident)
+        if rows is None:
+            rows = np.asarray(self._identity_rows[ident], dtype=np.int64)
+            self._identity_cache[ident] = rows
+        return rows
+
+    # === Partitioning ===
+    def build_partitions(self, n_lists=None, iterations=10, seed=0):
+        """Cluster the gallery into ``n_lists`` partitions with k-means."""
+        n_lists = n_lists or self.n_lists
+        with self._lock:
+            data = self._matrix[:self._count]
+            if n_lists <= 1 or len(data) < n_lists:
+                self._centroids, self._lists, self._list_cache = None, None, {}
+                return
+            rng = np.random.default_rng(seed)
+            centroids = data[rng.choice(len(data), n_lists, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = self._argmin_rows(data, centroids)
+                for list_id in range(n_lists):
+                    members = data[assignment == list_id]
+                    if len(members):
+                        centroids[list_id] = members.mean(axis=0)
+            assignment = self._argmin_rows(data, centroids)
+            self.n_lists = n_lists
+            self._centroids = centroids
+            self._lists = [np.flatnonzero(assignment == i).tolist() for i in range(n_lists)]
+            self._list_cache = {}
+
+    @staticmethod
+    def _argmin_rows(data, centroids, chunk=8192):
+        c_norms = np.einsum("ij,ij->i", centroids, centroids)
+        out = np.empty(len(data), dtype=np.int64)
+        for start in range(0, len(data), chunk):
+            block = data[start:start + chunk]
+            out[start:start + chunk] = np.argmin(c_norms - 2.0 * block @ centroids.T, axis=1)
+        return out
+
+    def _nearest_lists(self, queries, n_probe):
+        c_norms = np.einsum("ij,ij->i", self._centroids, self._centroids)
+        scores = c_norms - 2.0 * queries @ self._centroids.T
+        n_probe = min(n_probe, len(self._centroids))
+        return np.argsort(scores, axis=1)[:, :n_probe]
+
+    def _candidate_rows(self, queries):
+        probes = np.unique(self._nearest_lists(queries, self.n_probe))
+        parts = []
+        for list_id in probes:
+            list_id = int(list_id)
+            rows = self._list_cache.get(list_id)
+            if rows is None:
+                rows = np.asarray(self._lists[list_id], dtype=np.int64)
+                self._list_cache[list_id] = rows
+            parts.append(rows)
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    # === Queries ===
+    def distances(self, queries, rows=None):
+        """Euclidean distances between each query and the gallery rows."""
+        sq = self._sq_distances(queries, rows)
+        return np.sqrt(sq, out=sq)
+
+    def _sq_distances(self, queries, rows=None):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        count = self._count
+        matrix, sq_norms = self._matrix, self._sq_norms
+        if rows is None:
+            gallery, g_norms = matrix[:count], sq_norms[:count]
+        else:
+            gallery, g_norms = matrix[rows], sq_norms[rows]
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+        sq = q_norms[:, None] + g_norms[None, :] - 2.0 * (queries @ gallery.T)
+        return np.maximum(sq, 0.0, out=sq)
+
+    def _search(self, queries, k):
+        """Return (rows, distances) arrays of shape (q, k) sorted by distance."""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        if self._count == 0 or len(queries) == 0:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        rows = self._candidate_rows(queries) if self._centroids is not None else None
+        if rows is not None and len(rows) == 0:
+            rows = None
+        # Rank on squared distances; only the selected ones get a sqrt
+        dists = self._sq_distances(queries, rows)
+        k = min(k, dists.shape[1])
+        if k == 1:
+            idx = np.argmin(dists, axis=1)[:, None]
+        else:
+            idx = np.argpartition(dists, k - 1, axis=1)[:, :k]
+            order = np.argsort(np.take_along_axis(dists, idx, axis=1), axis=1)
+            idx = np.take_along_axis(idx, order, axis=1)
+        best = np.sqrt(np.take_along_axis(dists, idx, axis=1))
+        if rows is not None:
+            idx = rows[idx]
+        return idx, best
+
+    def query(self, queries, k=5, threshold=None):
+        """Top-k matches per query as lists of (name, distance, row).
+
+        Matches farther than ``threshold`` (when given) are dropped.
+        """
+        idx, best = self._search(queries, k)
+        names = self._names
+        results = []
+        for q_rows, q_dists in zip(idx, best):
+            hits = []
+            for row, dist in zip(q_rows, q_dists):
+                if threshold is not None and dist >= threshold:
+                    break
+                hits.append((names[row], float(dist), int(row)))
+            results.append(hits)
+        return results
+
+    def match(self, queries, threshold=0.6):
+        """Best match per query as (name, distance, row).
+
+        ``name`` and ``row`` are None when the gallery is empty or the closest
+        encoding is not below ``threshold``; ``distance`` is then the closest
+        distance seen (1.0 for an empty gallery).
+        """
+        if self.mode != "exhaustive" and self._n_reps:
+            return self._match_identities(queries, threshold)
+        idx, best = self._search(queries, 1)
+        results = []
+        for q_rows, q_dists in zip(idx, best):
+            if len(q_rows) == 0:
+                results.append((None, 1.0, None))
+                continue
+            row, dist = int(q_rows[0]), float(q_dists[0])
+            if dist < threshold:
+                results.append((self._names[row], dist, row))
+            else:
+                results.append((None, dist, None))
+        return results
+
+    def _match_identities(self, queries, threshold):
+        """Representative-first matching for the centroid/medoid modes."""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        if len(queries) == 0:
+            return []
+        pool = None  # identity ids to consider (None = all)
+        if self._centroids is not None:
+            rows = self._candidate_rows(queries)
+            if len(rows):
+                pool = np.unique(self._row_idents[rows])
+        if pool is None:
+            n_ids = self._n_reps
+            reps, rep_norms = self._reps[:n_ids], self._rep_norms[:n_ids]
+        else:
+            n_ids = len(pool)
+            reps, rep_norms = self._reps[pool], self._rep_norms[pool]
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+        sq = np.maximum(q_norms[:, None] + rep_norms[None, :] - 2.0 * (queries @ reps.T), 0.0)
+        k = min(self.fallback_k, n_ids)
+        cand = np.argpartition(sq, k - 1, axis=1)[:, :k] if k < n_ids else np.tile(np.arange(n_ids), (len(queries), 1))
+        order = np.argsort(np.take_along_axis(sq, cand, axis=1), axis=1)
+        cand = np.take_along_axis(cand, order, axis=1)
+        rep_dists = np.sqrt(np.take_along_axis(sq, cand, axis=1))
+        if pool is not None:
+            cand = pool[cand]
+
+        results = []
+        for query, ids, dists in zip(queries, cand, rep_dists):
+            best = self._nearest_sample(query, ids[:1])
+            # Close calls are settled on the photos of the runners-up too
+            close = (len(dists) > 1 and dists[1] - dists[0] < self.margin) \
+                or best[1] >= threshold - self.margin
+            if close and len(ids) > 1:
+                other = self._nearest_sample(query, ids[1:])
+                if other[1] < best[1]:
+                    best = other
+            ident, dist, row = best
+            name = self._identity_names[ident]
+            results.append((name, dist, row) if dist < threshold else (None, dist, None))
+        return results
+
+    def _nearest_sample(self, query, idents):
+        """(identity, distance, row) of the photo closest to ``query`` among
+        the photos of ``idents``."""
+        best = (None, float("inf"), None)
+        for ident in idents:
+            rows = self._identity_row_array(int(ident))
+            sample_d = self.distances(query[None, :], rows)[0]
+            i = int(np.argmin(sample_d))
+            if sample_d[i] < best[1]:
+                best = (int(ident), float(sample_d[i]), int(rows[i]))
+        return best
@@ -0,0 +1,145 @@
+# frame_stream.py
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class LatestSlot:
+    """Single-slot mailbox: ``put`` replaces whatever is still waiting, so a
+    slow consumer only ever sees the newest item.  ``replaced`` counts the
+    items that were dropped that way."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._full = False
+        self.closed = False
+        self.replaced = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._full:
+                self.replaced += 1
+            self._item, self._full = item, True
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Newest item, or None after ``timeout`` seconds or once closed."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._full or self.closed, timeout)
+            if not self._full:
+                return None
+            item, self._item, self._full = self._item, None, False
+            return item
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class StreamSession:
+    """One camera's frame stream.
+
+    ``push`` drops a frame in the ``frames`` slot; a worker thread runs
+    ``process(camera_id, frame_bytes)`` on the newest frame and puts the
+    returned dict (plus ``seq``, ``dropped`` and ``lag_ms``) in the
+    ``results`` slot.  Frames that arrive while one is being processed
+    replace each other, so the server never works through a backlog.
+    """
+
+    def __init__(self, camera_id, process):
+        self.camera_id = camera_id
+        self.process = process
+        self.frames = LatestSlot()
+        self.results = LatestSlot()
+        self.last_seen = time.monotonic()
+        self.received = 0
+        self.processed = 0
+        self._thread = threading.Thread(target=self._run, name=f"stream-{camera_id}", daemon=True)
+        self._thread.start()
+
+    @property
+    def closed(self):
+        return self.frames.closed
+
+    def push(self, frame):
+        self.last_seen = time.monotonic()
+        self.received += 1
+        self.frames.put((self.received, time.perf_counter(), frame))
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def next_result(self, timeout=None):
+        """Newest result, or None after ``timeout`` seconds or once closed.
+        A client waiting for results keeps the stream from going idle."""
+        self.touch()
+        message = self.results.get(timeout)
+        self.touch()
+        return message
+
+    def close(self):
+        self.frames.close()
+        self.results.close()
+
+    def _run(self):
+        while not self.closed:
+            item = self.frames.get(timeout=1.0)
+            if item is None:
+                continue
+            seq, received_at, frame = item
+            try:
+                message = self.process(self.camera_id, frame)
+            except Exception as e:
+                log.exception("Stream frame from %s failed", self.camera_id)
+                message = {"error": str(e)}
+            self.processed += 1
+            message.update(seq=seq, dropped=self.frames.replaced,
+                           lag_ms=round((time.perf_counter() - received_at) * 1000, 1))
+            self.results.put(message)
+
+
+class StreamRegistry:
+    """Open streams by camera id; idle ones (no frame pushed and no result
+    read for ``idle_timeout`` seconds) are closed, and the least recently
+    used past ``max_streams``.  Holders of a closed stream get a new one
+    from ``get``."""
+
+    def __init__(self, process, max_streams=32, idle_timeout=60):
+        self.process = process
+        self.max_streams = max_streams
+        self.idle_timeout = idle_timeout
+        self._streams = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._streams)
+
+    def get(self, camera_id):
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, s in self._streams.items() if now - s.last_seen > self.idle_timeout]:
+                self._streams.pop(key).close()
+            stream = self._streams.pop(camera_id, None)
+            if stream is None or stream.closed:
+                stream = StreamSession(camera_id, self.process)
+            stream.touch()
+            self._streams[camera_id] = stream
+            while len(self._streams) > self.max_streams:
+                self._streams.popitem(last=False)[1].close()
+            return stream
+
+    def close(self, camera_id):
+        with self._lock:
+            stream = self._streams.pop(camera_id, None)
+        if stream is not None:
+            stream.close()
+
+    def stats(self):
+        with self._lock:
+            return {k: {"received": s.received, "processed": s.processed, "dropped": s.frames.replaced}
+                    for k, s in self._streams.items()}
@@ -0,0 +1,64 @@
+# import_attendance.py
+import os
+import csv
+from utils import db_cursor, init_db, rebuild_rollups, snapshot_key, DATA_DIR
+
+ATTENDANCE_CSV = os.path.join(DATA_DIR, "attendance.csv")
+USER_ATTENDANCE_DIR = os.path.join(DATA_DIR, "attendance_users")
+
+def _csv_rows(path):
+    """Yield complete rows from an attendance CSV, skipping blank/partial lines."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("name") and row.get("date") and row.get("time"):
+                yield row
+
+def import_csv_attendance(attendance_csv=ATTENDANCE_CSV, users_dir=USER_ATTENDANCE_DIR):
+    """Copy rows from the old CSV files into the attendance table.
+
+    The global CSV and the per-user CSVs overlap, so rows are de-duplicated on
+    (name, date, time), including against rows already in the database; running
+    the import twice is harmless.  New ids are assigned in chronological order
+    and the original id (which may be a string such as
+    ``Panha-20251023-131446``) is kept in ``legacy_id``.  Absolute image
+    paths are reduced to snapshot keys (the file name under uploads/).
+    Returns the number of rows inserted.
+    """
+    sources = []
+    if os.path.exists(attendance_csv):
+        sources.append(attendance_csv)
+    if os.path.isdir(users_dir):
+        sources.extend(os.path.join(users_dir, f) for f in sorted(os.listdir(users_dir))
+                       if f.lower().endswith(".csv"))
+
+    rows = {}
+    for path in sources:
+        for row in _csv_rows(path):
+            key = (row["name"].strip(), row["date"].strip(), row["time"].strip())
+            if key not in rows:
+                rows[key] = (snapshot_key((row.get("image_path") or "").strip()),
+                             (row.get("id") or "").strip() or None)
+
+    init_db()
+    with db_cursor() as c:
+        c.execute("SELECT name, date, time FROM attendance")
+        existing = {tuple(r) for r in c.fetchall()}
+        new_rows = [(name, date, time, image_path, legacy_id)
+                    for (name, date, time), (image_path, legacy_id) in rows.items()
+                    if (name, date, time) not in existing]
+        new_rows.sort(key=lambda r: (r[1], r[2], r[0]))
+        c.executemany("INSERT INTO attendance (name, date, time, image_path, legacy_id) "
+                      "VALUES (?, ?, ?, ?, ?)", new_rows)
+    return len(new_rows)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Import attendance CSVs into attendance.db")
+    parser.add_argument("--csv", default=ATTENDANCE_CSV)
+    parser.add_argument("--users-dir", default=USER_ATTENDANCE_DIR)
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="recompute the daily/per-user summaries from the whole log after importing")
+    args = parser.parse_args()
+    print(f"Imported {import_csv_attendance(args.csv, args.users_dir)} rows")
+    if args.rebuild_rollups:
+        print(f"Rebuilt rollups: {rebuild_rollups()} person-days")
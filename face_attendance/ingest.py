@@ -0,0 +1,113 @@
+# ingest.py
+import io
+import math
+import numpy as np
+from PIL import Image
+
+# Frames up to this wide are detected at native size (kiosk frames are 480px)
+DETECT_WIDTH = 640
+# Faces narrower than this (px) are encoded from a higher-resolution decode
+ENCODE_FACE_WIDTH = 160
+# Context kept around each face crop for the landmark model
+CROP_MARGIN = 0.5
+
+
+def _open(source):
+    """PIL image reading straight from bytes or an upload's stream."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    stream = getattr(source, "stream", source)
+    stream.seek(0)
+    return Image.open(stream)
+
+
+def decode(source, width=None):
+    """Decode ``source`` at most ``width`` pixels wide; returns (PIL image, scale).
+
+    JPEGs are decoded with DCT scaling (PIL draft mode) at the smallest
+    1/2, 1/4 or 1/8 size that is still at least ``width`` wide, so the
+    full-resolution image is never materialized; the rest is a cheap resize.
+    ``scale`` is decoded pixels per original pixel.
+    """
+    img = _open(source)
+    full_w, full_h = img.size
+    if width and full_w > width:
+        img.draft("RGB", (width, max(1, full_h * width // full_w)))
+        if img.size[0] > width:
+            img = img.resize((width, max(1, round(img.size[1] * width / img.size[0]))), Image.BILINEAR,
+                             reducing_gap=2.0)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img, img.size[0] / float(full_w)
+
+
+def _scale_box(box, factor):
+    top, right, bottom, left = box
+    return (int(round(top * factor)), int(round(right * factor)),
+            int(round(bottom * factor)), int(round(left * factor)))
+
+
+class IngestedFrame:
+    """An upload decoded for detection, with encodings computed from face
+    crops at just enough resolution.
+
+    ``image`` is the RGB array detection runs on (at most ``detect_width``
+    wide).  ``encode`` takes face boxes in ``image`` coordinates: if every
+    face is at least ``face_width`` pixels wide there, they are encoded from
+    ``image`` itself; otherwise the upload is decoded once more at the
+    resolution the smallest face needs and only the face regions are turned
+    into arrays.
+    """
+
+    def __init__(self, source, detect_width=DETECT_WIDTH, face_width=ENCODE_FACE_WIDTH):
+        self.source = source
+        self.face_width = face_width
+        img, self.scale = decode(source, detect_width)
+        self.size = (round(img.size[0] / self.scale), round(img.size[1] / self.scale))
+        self.image = np.asarray(img)
+
+    def to_full(self, locations):
+        """Boxes in ``image`` coordinates mapped to the original upload."""
+        if self.scale == 1.0:
+            return list(locations)
+        return [_scale_box(box, 1.0 / self.scale) for box in locations]
+
+    def _needed_scale(self, locations):
+        smallest = min(right - left for _top, right, _bottom, left in locations)
+        return min(1.0, self.scale * self.face_width / max(smallest, 1))
+
+    def encodes_in_place(self, locations):
+        """Whether ``encode`` uses ``image`` itself for these boxes (every
+        face is wide enough there), so callers may batch them."""
+        return not locations or self._needed_scale(locations) <= self.scale * 1.01
+
+    def encode(self, locations, num_jitters=1):
+        import face_recognition
+        if not locations:
+            return []
+        if self.encodes_in_place(locations):
+            return face_recognition.face_encodings(self.image, locations, num_jitters)
+        needed = self._needed_scale(locations)
+
+        img, scale = decode(self.source, math.ceil(self.size[0] * needed))
+        factor = scale / self.scale
+        encodings = []
+        for box in locations:
+            top, right, bottom, left = _scale_box(box, factor)
+            mh, mw = int((bottom - top) * CROP_MARGIN), int((right - left) * CROP_MARGIN)
+            y0, x0 = max(0, top - mh), max(0, left - mw)
+            y1, x1 = min(img.size[1], bottom + mh), min(img.size[0], right + mw)
+            crop = np.asarray(img.crop((x0, y0, x1, y1)))
+            encodings.extend(face_recognition.face_encodings(
+                crop, [(top - y0, right - x0, bottom - y0, left - x0)], num_jitters))
+        return encodings
+
+
+def detect_and_encode(source, model="hog", detect_width=DETECT_WIDTH, face_width=ENCODE_FACE_WIDTH):
+    """(face_locations, encodings) for an upload, locations in original pixels."""
+    import face_recognition
+    frame = IngestedFrame(source, detect_width, face_width)
+    locations = face_recognition.face_locations(frame.image, model=model)
+    if not locations:
+        return [], []
+    return frame.to_full(locations), frame.encode(locations)
@@ -0,0 +1,249 @@
+# metrics.py
+import sys
+import time
+import bisect
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Seconds; spans a cached match (~1ms) up to the 7s client timeout
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+def _labels(label, value, **extra):
+    pairs = ([(label, value)] if label else []) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one optional label."""
+
+    def __init__(self, name, help, label=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}   # label value -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, label_value=""):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for value, counts in sorted(series.items()):
+            total = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                total += n
+                lines.append(f"{self.name}_bucket{_labels(self.label, value, le=_number(bound))} {total}")
+            lines.append(f"{self.name}_sum{_labels(self.label, value)} {counts[-1]!r}")
+            lines.append(f"{self.name}_count{_labels(self.label, value)} {total}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with one optional label."""
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._lock = threading.Lock()
+        self._values = defaultdict(int)
+
+    def inc(self, n=1, label_value=""):
+        with self._lock:
+            self._values[label_value] += n
+
+    def value(self, label_value=""):
+        return self._values.get(label_value, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        lines.extend(f"{self.name}{_labels(self.label, k)} {_number(v)}" for k, v in sorted(values.items()))
+        return lines
+
+
+class Callback:
+    """Gauge or counter whose value is read from ``fn`` at scrape time."""
+
+    def __init__(self, name, help, fn, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}",
+                f"{self.name} {_number(self.fn())}"]
+
+
+class Registry:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._metrics = {}
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name, help, label=None, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self.prefix + name, help, label, buckets))
+
+    def counter(self, name, help, label=None):
+        return self._register(Counter(self.prefix + name, help, label))
+
+    def callback(self, name, help, fn, kind="gauge"):
+        return self._register(Callback(self.prefix + name, help, fn, kind))
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:  # a broken callback must not break the scrape
+                continue
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry("face_attendance_")
+STAGE_SECONDS = REGISTRY.histogram("stage_seconds", "Time spent per recognition stage.", "stage")
+REQUEST_SECONDS = REGISTRY.histogram("request_seconds", "Request latency per endpoint.", "endpoint")
+FACES = REGISTRY.counter("faces_total", "Faces seen, by outcome.", "outcome")
+FRAMES = REGISTRY.counter("camera_frames_total", "Camera frames by adaptive pipeline mode.", "mode")
+
+# === Per-request stage timings (for the Server-Timing header) ===
+_request = threading.local()
+
+
+def start_request():
+    _request.timings = {}
+
+
+def request_timings():
+    """Stage durations (seconds) recorded on this thread since start_request."""
+    return getattr(_request, "timings", None) or {}
+
+
+def end_request():
+    _request.timings = None
+
+
+def observe(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = getattr(_request, "timings", None)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    """Record the duration of the block under ``stage``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def server_timing(timings):
+    """Format stage timings as a Server-Timing header value (milliseconds)."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+# === Sampling profiler ===
+class SamplingProfiler:
+    """Samples every thread's Python stack at a fixed interval from a daemon
+    thread and counts identical stacks, so it can be switched on and off in a
+    running server.  Output is in the "collapsed stack" format read by
+    flamegraph tools (``frame;frame;frame count``)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._stacks = defaultdict(int)
+        self.interval = 0.01
+        self.samples = 0
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=0.01):
+        with self._lock:
+            if self.running:
+                return False
+            self.interval = interval
+            self._stacks.clear()
+            self.samples = 0
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            if not self.running:
+                return False
+            self._stop.set()
+            thread = self._thread
+        thread.join()
+        return True
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                self.samples += 1
+                for ident, frame in frames.items():
+                    if ident != me:
+                        self._stacks[_collapse(frame)] += 1
+
+    def collapsed(self, limit=None):
+        """[(stack, count)] sorted by count, most frequent first."""
+        with self._lock:
+            stacks = sorted(self._stacks.items(), key=lambda kv: -kv[1])
+        return stacks[:limit] if limit else stacks
+
+    def status(self):
+        return {"running": self.running, "interval": self.interval, "samples": self.samples,
+                "started_at": self.started_at, "stacks": len(self._stacks)}
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,295 @@
+# recognition_engine.py
+import gc
+import sys
+import time
+import struct
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import metrics
+from face_index import FaceIndex
+
+# Control block layout: reset epoch, generation, row count, capacity, data segment name
+_CONTROL = struct.Struct("qqqq64s")
+
+
+# === Models ===
+def models_loaded():
+    return "face_recognition" in sys.modules
+
+
+def load_models():
+    """Import face_recognition, which loads dlib's detector, landmark and
+    encoding models; returns the seconds it took (0.0 if already loaded).
+
+    Nothing imports it at module level, so processes that never detect or
+    encode a face (reporting, CSV import) never pay for the models."""
+    if models_loaded():
+        return 0.0
+    start = time.perf_counter()
+    import face_recognition  # noqa: F401
+    seconds = time.perf_counter() - start
+    metrics.observe("model_load", seconds)
+    return seconds
+
+
+def _attach(name, untrack):
+    """Attach to an existing segment without letting this process unlink it.
+
+    Forked workers share the owner's resource tracker, so re-registering is
+    harmless there; spawned workers get their own tracker, which would unlink
+    the segment when they exit unless the registration is dropped.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no track flag
+        shm = shared_memory.SharedMemory(name=name)
+        if untrack:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedGallery:
+    """Known-encodings matrix in shared memory, owned by the web process.
+
+    Rows mirror the app's FaceIndex; after the matrix, the data segment holds
+    an identity label per row (equal labels = same name) so workers can group
+    a person's photos without the names.  Workers map the segment read-only
+    and find it through a small control block; when the matrix outgrows its
+    segment a bigger one is created and the control block's generation is
+    bumped so workers re-attach on their next task.  ``reset`` bumps the
+    epoch so workers rebuild their index instead of extending it.
+    """
+
+    def __init__(self, dim=128, capacity=1024):
+        self.dim = dim
+        self.names = []
+        self._labels = {}  # name -> label
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._generation = 0
+        self._control = shared_memory.SharedMemory(create=True, size=_CONTROL.size)
+        self._data = None
+        self._rows = None
+        self._row_labels = None
+        self._allocate(max(capacity, 1))
+
+    @property
+    def control_name(self):
+        return self._control.name
+
+    def __len__(self):
+        return len(self.names)
+
+    def _allocate(self, capacity):
+        data = shared_memory.SharedMemory(create=True, size=capacity * (self.dim + 1) * 4)
+        rows, row_labels = _segment_arrays(data, capacity, self.dim)
+        if self._rows is not None:
+            rows[:len(self.names)] = self._rows[:len(self.names)]
+            row_labels[:len(self.names)] = self._row_labels[:len(self.names)]
+        old = self._data
+        self._data, self._rows, self._row_labels = data, rows, row_labels
+        self._generation += 1
+        self._publish()
+        if old is not None:
+            # Workers still mapping the old segment keep their mapping
+            old.close()
+            old.unlink()
+
+    def _publish(self):
+        _CONTROL.pack_into(self._control.buf, 0, self._epoch, self._generation, len(self.names),
+                           self._rows.shape[0], self._data.name.encode("ascii"))
+
+    def add(self, encodings, names):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            start, end = len(self.names), len(self.names) + len(encodings)
+            if end > self._rows.shape[0]:
+                capacity = self._rows.shape[0]
+                while capacity < end:
+                    capacity *= 2
+                self._allocate(capacity)
+            # Rows are written before the count is published
+            self._rows[start:end] = encodings
+            self._row_labels[start:end] = [self._labels.setdefault(name, len(self._labels)) for name in names]
+            self.names.extend(names)
+            self._publish()
+
+    def reset(self, encodings, names):
+        """Replace the whole gallery (after the app reloads known faces)."""
+        with self._lock:
+            self.names = []
+            self._labels = {}
+            self._epoch += 1
+            self._publish()
+        self.add(encodings, names)
+
+    def close(self):
+        self._rows = self._row_labels = None
+        for shm in (self._data, self._control):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._data = self._control = None
+
+
+def _segment_arrays(shm, capacity, dim):
+    """(rows, labels) arrays laid out in a gallery data segment."""
+    rows = np.ndarray((capacity, dim), dtype=np.float32, buffer=shm.buf)
+    labels = np.ndarray((capacity,), dtype=np.int32, buffer=shm.buf, offset=capacity * dim * 4)
+    return rows, labels
+
+
+# === Worker side ===
+_worker = {}
+
+
+def _worker_init(control_name, untrack, index_options):
+    # Forked workers already have the parent's models; spawned ones load
+    # theirs now rather than on their first frame
+    load_models()
+    _worker["untrack"] = untrack
+    _worker["control"] = _attach(control_name, untrack)
+    _worker["generation"] = None
+    _worker["index_options"] = index_options
+    _worker["index"] = None
+
+
+def _worker_index():
+    """FaceIndex over the shared gallery, configured like the app's, so the
+    workers and the web process give the same verdict for a face.  Rows
+    added since the last task are appended; a reset rebuilds it."""
+    epoch, generation, count, capacity, seg = _CONTROL.unpack_from(_worker["control"].buf, 0)
+    if generation != _worker["generation"]:
+        _worker["data"] = _attach(seg.rstrip(b"\0").decode("ascii"), _worker["untrack"])
+        _worker["rows"], _worker["labels"] = _segment_arrays(_worker["data"], capacity, 128)
+        _worker["generation"] = generation
+    index = _worker["index"]
+    if index is None or _worker.get("epoch") != epoch or count < len(index):
+        index = FaceIndex(capacity=max(count, 1024), **_worker["index_options"])
+        index.add_many(_worker["rows"][:count], _worker["labels"][:count].tolist())
+        if index.n_lists:
+            index.build_partitions()
+        _worker["index"], _worker["epoch"] = index, epoch
+    elif count > len(index):
+        start = len(index)
+        index.add_many(_worker["rows"][start:count], _worker["labels"][start:count].tolist())
+    return index
+
+
+def _ready(delay):
+    time.sleep(delay)
+    return True
+
+
+def _recognize_task(image_bytes, model="hog", detect_width=640, face_width=160, threshold=0.6):
+    """Decode, detect, encode and match one frame inside a worker.
+
+    Also returns the per-stage durations so the parent can record them."""
+    import face_recognition
+    from ingest import IngestedFrame
+    timings = {}
+    t = time.perf_counter()
+    frame = IngestedFrame(image_bytes, detect_width, face_width)
+    timings["decode"], t = time.perf_counter() - t, time.perf_counter()
+    locations = face_recognition.face_locations(frame.image, model=model)
+    timings["detect"], t = time.perf_counter() - t, time.perf_counter()
+    if not locations:
+        return [], np.zeros((0, 128), dtype=np.float32), [], [], timings
+    encodings = np.asarray(frame.encode(locations), dtype=np.float32).reshape(-1, 128)
+    locations = frame.to_full(locations)
+    timings["encode"], t = time.perf_counter() - t, time.perf_counter()
+    matches = _worker_index().match(encodings, threshold=threshold)
+    timings["match"] = time.perf_counter() - t
+    return locations, encodings, [row for _label, _dist, row in matches], [dist for _label, dist, _row in matches], timings
+
+
+def _session_task(image_bytes, *args):
+    """Run ``camera_session.detect_frame`` for a camera session inside a
+    worker; its stage timings are appended to the result."""
+    from camera_session import detect_frame
+    metrics.start_request()
+    try:
+        return detect_frame(image_bytes, *args) + (metrics.request_timings(),)
+    finally:
+        metrics.end_request()
+
+
+class RecognitionEngine:
+    """Fans frame decoding, HOG detection, encoding and matching out to a
+    process pool whose workers read the gallery from a SharedGallery.
+
+    With the fork start method the models are loaded here, in the parent,
+    and every worker is started straight away: the workers then share the
+    model pages copy-on-write instead of each loading a private copy, and
+    the first frames don't wait for a worker to start.
+
+    ``index_options`` (mode, n_lists, n_probe...) configure the FaceIndex
+    each worker matches with; pass the ones of the app's index.
+    """
+
+    def __init__(self, workers, start_method=None, detect_width=640, face_width=160, **index_options):
+        if start_method is None:
+            start_method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+        self.workers = workers
+        self.start_method = start_method
+        self.detect_width = detect_width
+        self.face_width = face_width
+        self.gallery = SharedGallery()
+        if start_method == "fork":
+            load_models()
+            # Move everything allocated so far out of the collector's reach so
+            # collections in the workers don't write to (and un-share) it
+            gc.freeze()
+        self._pool = ProcessPoolExecutor(max_workers=workers,
+                                         mp_context=mp.get_context(start_method),
+                                         initializer=_worker_init,
+                                         initargs=(self.gallery.control_name,
+                                                   start_method != "fork", index_options))
+        # Overlapping sleeps make every worker start and take one
+        for future in [self._pool.submit(_ready, 0.05) for _ in range(workers)]:
+            future.result()
+
+    def pids(self):
+        """Process ids of the workers."""
+        return list(self._pool._processes or {})
+
+    def submit(self, image_bytes, threshold=0.6, model="hog"):
+        return self._pool.submit(_recognize_task, image_bytes, model, self.detect_width, self.face_width,
+                                 threshold)
+
+    def recognize(self, image_bytes, threshold=0.6, model="hog"):
+        """Return (locations, encodings, matches) for one encoded image, with
+        matches as (name, distance, row) like FaceIndex.match."""
+        with metrics.timed("worker"):
+            result = self.submit(image_bytes, threshold, model).result()
+        return self.resolve(result, threshold)
+
+    def detect(self, image_bytes, *args):
+        """``camera_session.detect_frame`` run by a worker: the camera session
+        keeps the skip and tracking decisions, the worker does the work."""
+        with metrics.timed("worker"):
+            *result, timings = self._pool.submit(_session_task, image_bytes, *args).result()
+        for stage, seconds in timings.items():
+            metrics.observe(stage, seconds)
+        return tuple(result)
+
+    def resolve(self, result, threshold=0.6):
+        locations, encodings, rows, dists, timings = result
+        for stage, seconds in timings.items():
+            metrics.observe(stage, seconds)
+        names = self.gallery.names
+        matches = []
+        for row, dist in zip(rows, dists):
+            if row is not None and dist < threshold and row < len(names):
+                matches.append((names[row], dist, row))
+            else:
+                matches.append((None, dist, None))
+        return locations, encodings, matches
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self.gallery.close()
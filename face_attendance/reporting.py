@@ -0,0 +1,257 @@
+# reporting.py
+# Read-only attendance API: listings, export, summaries and snapshots.
+#
+# These routes only read attendance.db, the names in the encoding store and
+# known_faces/ file names, so they work in a process that never imports
+# face_recognition or dlib.  app.py registers the blueprint next to the
+# recognition routes; create_app() builds a reporting-only app that starts in
+# a fraction of the time and memory:
+#
+#     python face_attendance/reporting.py          # port 5002
+#     gunicorn -w 4 'reporting:create_app()'       # from face_attendance/
+import io
+import os
+import csv
+import json
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from flask import Blueprint, Flask, Response, current_app, jsonify, request, send_file, stream_with_context
+from encoding_store import EncodingStore
+from snapshot_store import SnapshotStore
+from import_attendance import import_csv_attendance
+from utils import (init_db, count_attendance, attendance_names, query_attendance, iter_attendance,
+                   attendance_stats, day_rollup, days_rollup, user_rollup, identity_name,
+                   known_face_files, ATTENDANCE_COLUMNS, UPLOAD_DIR, KNOWN_ENCODINGS_PATH, KNOWN_META_PATH)
+
+bp = Blueprint("reporting", __name__)
+
+# Attendance listing / export paging
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+EXPORT_CHUNK_ROWS = 1000
+
+@bp.record_once
+def _config_defaults(state):
+    # Working hours for the presence flags in /api/summary (HH:MM:SS)
+    state.app.config.setdefault('WORKDAY_START', os.environ.get("WORKDAY_START", "09:00:00"))
+    state.app.config.setdefault('WORKDAY_END', os.environ.get("WORKDAY_END", "17:00:00"))
+
+# === Enrolled people ===
+# Names in the encoding store, re-read only when the store changes
+_IDENTITIES = {"mtime": None, "names": frozenset()}
+_IDENTITIES_LOCK = threading.Lock()
+
+def gallery_identities():
+    """Names of everyone with an encoding in the store."""
+    try:
+        mtime = os.stat(KNOWN_META_PATH).st_mtime_ns
+    except OSError:
+        return frozenset()
+    with _IDENTITIES_LOCK:
+        if mtime != _IDENTITIES["mtime"]:
+            store = EncodingStore(KNOWN_ENCODINGS_PATH, KNOWN_META_PATH).load()
+            _IDENTITIES.update(mtime=mtime, names=frozenset(e["name"] for e in store.entries))
+        return _IDENTITIES["names"]
+
+# === Attendance reads ===
+def _attendance_query_args():
+    """Filters from the query string; raises ValueError on malformed dates."""
+    filters = {key: request.args.get(key) or None for key in ("name", "start_date", "end_date")}
+    for key in ("start_date", "end_date"):
+        if filters[key]:
+            datetime.strptime(filters[key], "%Y-%m-%d")
+    return filters
+
+def _attendance_etag(filters, *extra):
+    """ETag that changes whenever a row matching ``filters`` is logged."""
+    count, days = attendance_stats(**filters)
+    raw = json.dumps([filters, extra, count, days], sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+def _not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+def _attendance_page(filters):
+    try:
+        limit = min(max(int(request.args.get("limit", DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        cursor = request.args.get("cursor")
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return jsonify({"success": False, "message": "limit and cursor must be integers"}), 400
+    ascending = request.args.get("order", "asc") != "desc"
+
+    etag = _attendance_etag(filters, limit, cursor, ascending)
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+
+    # Fetch one extra row to know whether another page exists
+    rows = query_attendance(limit + 1, ascending=ascending, after_id=cursor, **filters)
+    next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+    response = jsonify({"success": True, "attendance": rows[:limit], "next_cursor": next_cursor})
+    response.set_etag(etag)
+    return response
+
+@bp.route("/api/attendance", methods=["GET"])
+def get_attendance():
+    try:
+        filters = _attendance_query_args()
+    except ValueError:
+        return jsonify({"success": False, "message": "Dates must be YYYY-MM-DD"}), 400
+    return _attendance_page(filters)
+
+@bp.route("/snapshots/<path:key>", methods=["GET"])
+def serve_snapshot(key):
+    """Face snapshot by the key stored in an attendance row's image_path."""
+    try:
+        path = SnapshotStore(current_app.config.get('UPLOAD_FOLDER', UPLOAD_DIR)).path(key)
+    except ValueError:
+        return jsonify({"error": "Invalid snapshot key"}), 400
+    if not os.path.isfile(path):
+        return jsonify({"error": "Snapshot not found"}), 404
+    return send_file(path, mimetype="image/jpeg", max_age=86400)
+
+@bp.route("/api/users", methods=["GET"])
+def list_users():
+    users = set(attendance_names())
+    users.update(gallery_identities())
+    users.update(identity_name(file) for file in known_face_files())
+    return jsonify({"success": True, "users": sorted(users)})
+
+@bp.route("/api/attendance/<name>", methods=["GET"])
+def get_user_attendance(name):
+    try:
+        filters = _attendance_query_args()
+    except ValueError:
+        return jsonify({"success": False, "message": "Dates must be YYYY-MM-DD"}), 400
+    filters["name"] = name
+    return _attendance_page(filters)
+
+# === Summaries (from the rollup tables, see utils.py) ===
+SUMMARY_DEFAULT_DAYS = 31
+
+def _seconds(hms):
+    h, m, sec = (int(part) for part in hms.split(":"))
+    return h * 3600 + m * 60 + sec
+
+def _presence(row):
+    """A rollup row with hours between first and last scan and presence flags."""
+    row = dict(row)
+    row["hours"] = round((_seconds(row["last_seen"]) - _seconds(row["first_seen"])) / 3600.0, 2)
+    row["present"] = True
+    row["late"] = row["first_seen"] > current_app.config['WORKDAY_START']
+    row["left_early"] = row["last_seen"] < current_app.config['WORKDAY_END']
+    row["single_scan"] = row["scans"] == 1
+    return row
+
+def _summary_range():
+    """(start_date, end_date) from ?month=YYYY-MM or ?start_date/end_date,
+    by default the last SUMMARY_DEFAULT_DAYS days; raises ValueError."""
+    month = request.args.get("month")
+    if month:
+        first = datetime.strptime(month, "%Y-%m")
+        following = (first + timedelta(days=32)).replace(day=1)
+        return first.strftime("%Y-%m-%d"), (following - timedelta(days=1)).strftime("%Y-%m-%d")
+    filters = _attendance_query_args()
+    end = filters["end_date"] or datetime.now().strftime("%Y-%m-%d")
+    start = filters["start_date"] or (datetime.strptime(end, "%Y-%m-%d")
+                                      - timedelta(days=SUMMARY_DEFAULT_DAYS - 1)).strftime("%Y-%m-%d")
+    return start, end
+
+@bp.route("/api/summary/day", methods=["GET"])
+@bp.route("/api/summary/day/<date>", methods=["GET"])
+def day_summary(date=None):
+    """Who was present on ``date`` (default today), with first-in/last-out."""
+    date = date or datetime.now().strftime("%Y-%m-%d")
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"success": False, "message": "Dates must be YYYY-MM-DD"}), 400
+    totals, rows = day_rollup(date)
+    people = [_presence(row) for row in rows]
+    seen = {row["name"] for row in rows}
+    totals = totals or {"date": date, "present": 0, "scans": 0, "first_seen": None, "last_seen": None}
+    return jsonify({"success": True, **totals, "people": people,
+                    "absent": sorted(gallery_identities() - seen)})
+
+@bp.route("/api/summary/days", methods=["GET"])
+def days_summary():
+    """Head count and scans per day over a range (default the last month)."""
+    try:
+        start, end = _summary_range()
+    except ValueError:
+        return jsonify({"success": False, "message": "Use month=YYYY-MM or YYYY-MM-DD dates"}), 400
+    return jsonify({"success": True, "start_date": start, "end_date": end, "days": days_rollup(start, end)})
+
+@bp.route("/api/summary/user/<name>", methods=["GET"])
+def user_summary(name):
+    """Days present and hours for one person over a range (default the last
+    month), plus their all-time totals."""
+    try:
+        start, end = _summary_range()
+    except ValueError:
+        return jsonify({"success": False, "message": "Use month=YYYY-MM or YYYY-MM-DD dates"}), 400
+    totals, rows = user_rollup(name, start, end)
+    if totals is None and name not in gallery_identities():
+        return jsonify({"success": False, "message": f"No attendance for {name}"}), 404
+    days = [_presence(row) for row in rows]
+    return jsonify({"success": True, "name": name, "start_date": start, "end_date": end,
+                    "days_present": len(days),
+                    "hours": round(sum(day["hours"] for day in days), 2),
+                    "late_days": sum(day["late"] for day in days),
+                    "scans": sum(day["scans"] for day in days),
+                    "days": days, "all_time": totals})
+
+@bp.route("/export", methods=["GET"])
+def export_csv():
+    try:
+        filters = _attendance_query_args()
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    etag = _attendance_etag(filters, fmt)
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+    if attendance_stats(**filters)[0] == 0:
+        return jsonify({"error": "No attendance data found."}), 404
+
+    def generate():
+        # Rows are rendered in chunks so memory stays flat for long histories
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=ATTENDANCE_COLUMNS, extrasaction="ignore")
+        if fmt == "csv":
+            writer.writeheader()
+        for i, row in enumerate(iter_attendance(EXPORT_CHUNK_ROWS, **filters), 1):
+            if fmt == "csv":
+                writer.writerow(row)
+            else:
+                buf.write(json.dumps(row) + "\n")
+            if i % EXPORT_CHUNK_ROWS == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    response = Response(stream_with_context(generate()), mimetype=mimetype,
+                        headers={"Content-Disposition": f"attachment; filename=attendance.{fmt}"})
+    response.set_etag(etag)
+    return response
+
+def create_app():
+    """Flask app serving only the reporting routes (no face recognition)."""
+    app = Flask(__name__)
+    app.config['UPLOAD_FOLDER'] = UPLOAD_DIR
+    init_db()
+    if count_attendance() == 0:
+        import_csv_attendance()
+    app.register_blueprint(bp)
+    return app
+
+if __name__ == "__main__":
+    create_app().run(debug=False, port=int(os.environ.get("REPORTING_PORT", 5002)))
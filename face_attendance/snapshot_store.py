@@ -0,0 +1,197 @@
+# snapshot_store.py
+import io
+import os
+import re
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from PIL import Image
+
+log = logging.getLogger(__name__)
+
+_DAY_DIR = re.compile(r"^\d{4}/\d{2}/\d{2}$")
+
+
+class SnapshotStore:
+    """Face crops of logged recognitions, kept under ``root`` as
+    ``YYYY/MM/DD/<sha1>.jpg``.
+
+    Only the face region (plus ``margin`` on each side) is stored, scaled to
+    fit ``size`` pixels and re-encoded at ``quality``.  Files are named by
+    the hash of their bytes, so an identical crop on the same day is stored
+    once.  Keys returned by ``save`` are relative to ``root``; that is what
+    the attendance table records.  ``compact`` removes days older than
+    ``retention_days`` and then the oldest files until the store fits in
+    ``max_bytes``; ``start`` runs it periodically on a daemon thread.
+    """
+
+    def __init__(self, root, size=160, quality=80, margin=0.4, retention_days=90, max_bytes=1 << 30):
+        self.root = root
+        self.size = size
+        self.quality = quality
+        self.margin = margin
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"saved": 0, "duplicates": 0, "errors": 0, "removed": 0, "removed_bytes": 0,
+                       "files": None, "bytes": None, "last_compaction": None}
+
+    # === Writing ===
+    def save(self, frame, box, when):
+        """Store the face at ``box`` (top, right, bottom, left) of the encoded
+        frame ``frame``; returns the snapshot key."""
+        buf = io.BytesIO()
+        self.crop(frame, box).save(buf, "JPEG", quality=self.quality, optimize=True)
+        data = buf.getvalue()
+        key = f"{when:%Y/%m/%d}/{hashlib.sha1(data).hexdigest()}.jpg"
+        path = self.path(key)
+        if os.path.exists(path):
+            self._count("duplicates")
+            return key
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)  # mkstemp creates files readable by the owner only
+        os.replace(tmp, path)
+        self._count("saved")
+        return key
+
+    def crop(self, frame, box):
+        """Decode only as much of ``frame`` as the crop needs and return the
+        face region as an RGB image no larger than ``size``."""
+        img = Image.open(io.BytesIO(frame))
+        full_w, full_h = img.size
+        top, right, bottom, left = box
+        mh, mw = (bottom - top) * self.margin, (right - left) * self.margin
+        top, bottom = max(0, top - mh), min(full_h, bottom + mh)
+        left, right = max(0, left - mw), min(full_w, right + mw)
+        if right - left < 1 or bottom - top < 1:
+            raise ValueError(f"face box {box} is outside the {full_w}x{full_h} frame")
+        # JPEG can decode at 1/2, 1/4 or 1/8 scale; use the smallest that
+        # still leaves the crop at least ``size`` pixels wide
+        reduce = 1
+        while reduce < 8 and (right - left) / (reduce * 2) >= self.size:
+            reduce *= 2
+        if reduce > 1 and img.format == "JPEG":
+            img.draft("RGB", (full_w // reduce, full_h // reduce))
+        scale = img.size[0] / float(full_w)
+        face = img.crop((int(left * scale), int(top * scale), int(round(right * scale)),
+                         int(round(bottom * scale)))).convert("RGB")
+        face.thumbnail((self.size, self.size), Image.BILINEAR)
+        return face
+
+    def path(self, key):
+        """Absolute path of a snapshot key; keys may not leave ``root``."""
+        path = os.path.normpath(os.path.join(self.root, *key.split("/")))
+        if os.path.commonpath([path, os.path.normpath(self.root)]) != os.path.normpath(self.root):
+            raise ValueError(f"invalid snapshot key {key!r}")
+        return path
+
+    # === Retention ===
+    def _days(self):
+        """[(date, folder)] of every date shard, oldest first."""
+        days = []
+        for dirpath, dirnames, _files in os.walk(self.root):
+            rel = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+            if _DAY_DIR.match(rel):
+                dirnames[:] = []
+                try:
+                    days.append((datetime.strptime(rel, "%Y/%m/%d").date(), dirpath))
+                except ValueError:
+                    continue
+            elif rel.count("/") >= 2:
+                dirnames[:] = []
+        return sorted(days)
+
+    def compact(self, now=None):
+        """Apply retention and the size quota; returns the updated stats.
+
+        Files outside the date shards (full frames saved by older versions)
+        are left alone."""
+        now = now or datetime.now()
+        cutoff = (now - timedelta(days=self.retention_days)).date()
+        removed, removed_bytes = 0, 0
+        files, emptied = [], set()
+        for day, folder in self._days():
+            entries = []
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.is_file():
+                        st = entry.stat()
+                        entries.append((day, st.st_mtime, st.st_size, entry.path))
+            if day < cutoff:
+                removed += len(entries)
+                removed_bytes += sum(e[2] for e in entries)
+                shutil.rmtree(folder, ignore_errors=True)
+                emptied.update({os.path.dirname(folder), os.path.dirname(os.path.dirname(folder))})
+            else:
+                files.extend(entries)
+
+        total = sum(f[2] for f in files)
+        if self.max_bytes and total > self.max_bytes:
+            files.sort()
+            while files and total > self.max_bytes:
+                _day, _mtime, size, path = files.pop(0)
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+                removed_bytes += size
+        # Drop month/year folders left empty, except the ones being written to
+        current = {self.path(f"{now:%Y}"), self.path(f"{now:%Y/%m}")}
+        for folder in sorted(emptied - current, reverse=True):
+            try:
+                os.rmdir(folder)  # only succeeds when empty
+            except OSError:
+                pass
+
+        with self._lock:
+            self._stats["removed"] += removed
+            self._stats["removed_bytes"] += removed_bytes
+            self._stats["files"] = len(files)
+            self._stats["bytes"] = total
+            self._stats["last_compaction"] = now.isoformat(timespec="seconds")
+        return self.stats()
+
+    # === Background compaction ===
+    def start(self, interval=3600):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(interval,),
+                                            name="snapshot-compaction", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self, interval):
+        while True:
+            started = time.monotonic()
+            try:
+                self.compact()
+            except Exception:
+                log.exception("Snapshot compaction failed")
+                self._count("errors")
+            if self._stop.wait(max(1.0, interval - (time.monotonic() - started))):
+                return
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
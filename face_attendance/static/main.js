@@ -21,16 +21,16 @@
     let scanInFlight = false;
     let unknownPrompted = false;
     const autoScanIntervalMs = 2000;
+    // Lets the server keep per-camera tracking state between frames
+    const cameraId = `cam-${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 8)}`;
 
-    async function scanOnce() {
-      if (!video || !canvas) return;
-      // Ensure canvas matches current video dimensions
+    // Draw the current video frame and return a downscaled JPEG of it
+    async function captureFrame(overlay) {
       const ctx = canvas.getContext("2d");
       if (canvas.width !== video.videoWidth || canvas.height !== video.videoHeight) {
         canvas.width = video.videoWidth || canvas.width;
         canvas.height = video.videoHeight || canvas.height;
       }
-      // Draw current frame
       ctx.clearRect(0, 0, canvas.width, canvas.height);
       ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
       // Prepare downscaled offscreen canvas
@@ -42,12 +42,63 @@
       off.width = dw; off.height = dh;
       const octx = off.getContext('2d');
       octx.drawImage(canvas, 0, 0, dw, dh);
-      // Get JPEG blob
-      const { blob } = await new Promise(resolve => {
-        off.toBlob(b => resolve({ blob: b }), "image/jpeg", 0.7);
+      if (overlay) drawDetections(overlay.detections, overlay.dw, overlay.dh);
+      const blob = await new Promise(resolve => off.toBlob(resolve, "image/jpeg", 0.7));
+      return { blob, dw, dh };
+    }
+
+    // Draw detection boxes (in dw x dh frame coordinates) on the full-size canvas
+    function drawDetections(detections, dw, dh) {
+      canvas.classList.remove("hidden");
+      const ctx2 = canvas.getContext("2d");
+      ctx2.strokeStyle = "#00FF00";
+      ctx2.lineWidth = 2;
+      ctx2.fillStyle = "#00FF00";
+      ctx2.font = "bold 22px sans-serif";
+      const sx = canvas.width / (dw || canvas.width);
+      const sy = canvas.height / (dh || canvas.height);
+      detections.forEach(d => {
+        const left = Math.round((d.left | 0) * sx);
+        const top = Math.round((d.top | 0) * sy);
+        const right = Math.round((d.right | 0) * sx);
+        const bottom = Math.round((d.bottom | 0) * sy);
+        const w = right - left;
+        const h = bottom - top;
+        ctx2.strokeRect(left, top, w, h);
+        const label = d.name && d.name.length ? d.name : "Unknown";
+        const textY = Math.max(12, top - 4);
+        ctx2.fillText(label, left + 2, textY);
       });
+    }
+
+    // Unknown faces come with a server-side token; registering it enrolls
+    // every sample the server collected of that visitor
+    async function promptUnknown(detections) {
+      const unknown = detections.find(d => d.token);
+      if (!unknown || unknownPrompted) return;
+      unknownPrompted = true;
+      const seen = unknown.seen > 1 ? ` (seen ${unknown.seen} times)` : "";
+      const proposed = prompt(`Face not recognized${seen}. Enter name to register this face (or Cancel):`, "");
+      if (proposed && proposed.trim().length > 0) {
+        try {
+          const regRes = await fetch("/api/register_unknown", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ name: proposed.trim(), token: unknown.token }),
+          });
+          const regJ = await regRes.json();
+          alert(regJ.message || regJ.error || "");
+        } catch (_) {}
+      }
+      setTimeout(() => { unknownPrompted = false; }, 3000);
+    }
+
+    async function scanOnce() {
+      if (!video || !canvas) return;
+      const { blob, dw, dh } = await captureFrame();
       const fd = new FormData();
       fd.append("image", blob, "capture.jpg");
+      fd.append("camera_id", cameraId);
       const controller = new AbortController();
       const t = setTimeout(() => controller.abort(), 7000);
       let j = {};
@@ -62,43 +113,8 @@
       document.getElementById("recResult").innerText = j.message || j.error || "";
       // Draw detections on full-size canvas
       if (j && Array.isArray(j.detections)) {
-        canvas.classList.remove("hidden");
-        const ctx2 = canvas.getContext("2d");
-        ctx2.strokeStyle = "#00FF00";
-        ctx2.lineWidth = 2;
-        ctx2.fillStyle = "#00FF00";
-        ctx2.font = "bold 22px sans-serif";
-        const sx = canvas.width / (dw || canvas.width);
-        const sy = canvas.height / (dh || canvas.height);
-        j.detections.forEach(d => {
-          const left = Math.round((d.left | 0) * sx);
-          const top = Math.round((d.top | 0) * sy);
-          const right = Math.round((d.right | 0) * sx);
-          const bottom = Math.round((d.bottom | 0) * sy);
-          const w = right - left;
-          const h = bottom - top;
-          ctx2.strokeRect(left, top, w, h);
-          const label = d.name && d.name.length ? d.name : "Unknown";
-          const textY = Math.max(12, top - 4);
-          ctx2.fillText(label, left + 2, textY);
-        });
-
-        const hasUnknown = j.detections.some(d => !d.name || d.name === "Unknown");
-        if (hasUnknown && !unknownPrompted) {
-          unknownPrompted = true;
-          const proposed = prompt("Face not recognized. Enter name to register this face (or Cancel):", "");
-          if (proposed && proposed.trim().length > 0) {
-            try {
-              const regFd = new FormData();
-              regFd.append("name", proposed.trim());
-              regFd.append("image", blob, "register.jpg");
-              const regRes = await fetch("/api/register", { method: "POST", body: regFd });
-              const regJ = await regRes.json();
-              alert(regJ.message || regJ.error || "");
-            } catch (_) {}
-          }
-          setTimeout(() => { unknownPrompted = false; }, 3000);
-        }
+        drawDetections(j.detections, dw, dh);
+        await promptUnknown(j.detections);
       }
     }
 
@@ -120,6 +136,128 @@
       unknownPrompted = false;
     }
 
+    // --- Streaming recognition: one connection per camera ---
+    // Frames go out as raw JPEGs over a WebSocket (or chunked HTTP when the
+    // server has no WebSocket support); the server only processes the newest
+    // frame and answers with compact [top, right, bottom, left, name, confidence,
+    // token] tuples.  Falls back to the polling loop above if neither is available.
+    const streamIntervalMs = 250;
+    let frameStream = null;
+    let streamTimer = null;
+    let streamBusy = false;
+    let lastFrame = null;
+    let overlay = null;
+
+    function onStreamMessage(m) {
+      if (!m || !Array.isArray(m.faces) || !lastFrame) return;
+      const detections = m.faces.map(([top, right, bottom, left, name, confidence, token]) => ({
+        top, right, bottom, left, name, confidence, token, status: name ? "recognized" : "unknown"
+      }));
+      overlay = { detections, dw: lastFrame.dw, dh: lastFrame.dh };
+      const names = detections.filter(d => d.name).map(d => d.name);
+      document.getElementById("recResult").innerText =
+        names.length ? `Recognized: ${names.join(", ")}` : (detections.length ? "" : "No face detected.");
+      drawDetections(detections, lastFrame.dw, lastFrame.dh);
+      promptUnknown(detections);
+    }
+
+    function openWebSocketStream(onClosed) {
+      return new Promise((resolve, reject) => {
+        const proto = location.protocol === "https:" ? "wss" : "ws";
+        const ws = new WebSocket(`${proto}://${location.host}/ws/recognize?camera_id=${encodeURIComponent(cameraId)}`);
+        let opened = false;
+        ws.onopen = () => {
+          opened = true;
+          resolve({
+            // Skip frames while the previous one is still being sent
+            send: blob => { if (ws.readyState === WebSocket.OPEN && ws.bufferedAmount === 0) ws.send(blob); },
+            close: () => ws.close(),
+          });
+        };
+        ws.onmessage = ev => { try { onStreamMessage(JSON.parse(ev.data)); } catch (_) {} };
+        ws.onerror = () => { if (!opened) reject(new Error("WebSocket unavailable")); };
+        ws.onclose = () => { if (opened) onClosed(); else reject(new Error("WebSocket closed")); };
+      });
+    }
+
+    async function openHttpStream(onClosed) {
+      const url = `/api/stream/${encodeURIComponent(cameraId)}`;
+      const controller = new AbortController();
+      const res = await fetch(url, { signal: controller.signal });
+      if (!res.ok || !res.body) throw new Error("Streaming unavailable");
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      (async () => {
+        let buf = "";
+        try {
+          for (;;) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buf += decoder.decode(value, { stream: true });
+            let nl;
+            while ((nl = buf.indexOf("\n")) >= 0) {
+              const line = buf.slice(0, nl).trim();
+              buf = buf.slice(nl + 1);
+              if (line) onStreamMessage(JSON.parse(line));
+            }
+          }
+        } catch (_) {}
+        if (!controller.signal.aborted) onClosed();
+      })();
+      let posting = false;
+      return {
+        send: async blob => {
+          if (posting) return;
+          posting = true;
+          try {
+            await fetch(url, { method: "POST", body: blob, headers: { "Content-Type": "image/jpeg" } });
+          } catch (_) {} finally { posting = false; }
+        },
+        close: () => controller.abort(),
+      };
+    }
+
+    async function startStreaming() {
+      if (frameStream || autoScanTimer) return;
+      // Connection lost mid-session: keep scanning by polling instead
+      const onClosed = () => {
+        if (!frameStream) return;
+        stopStreaming();
+        startAutoScan();
+      };
+      try {
+        frameStream = await openWebSocketStream(onClosed);
+      } catch (_) {
+        try { frameStream = await openHttpStream(onClosed); } catch (_) { frameStream = null; }
+      }
+      if (!frameStream) {
+        startAutoScan();
+        return;
+      }
+      streamTimer = setInterval(async () => {
+        if (streamBusy || !frameStream) return;
+        streamBusy = true;
+        try {
+          lastFrame = await captureFrame(overlay);
+          frameStream.send(lastFrame.blob);
+        } catch (_) {} finally { streamBusy = false; }
+      }, streamIntervalMs);
+    }
+
+    function stopStreaming() {
+      if (streamTimer) {
+        clearInterval(streamTimer);
+        streamTimer = null;
+      }
+      if (frameStream) {
+        const s = frameStream;
+        frameStream = null;
+        s.close();
+      }
+      streamBusy = false;
+      overlay = null;
+    }
+
     document.getElementById("scanBtn").addEventListener("click", async () => {
       document.getElementById("webcamArea").classList.remove("hidden");
       // Make canvas visible so annotated frame can be seen after capture
@@ -135,13 +273,14 @@
       video.style.height = 'auto';
       canvas.style.width = '100%';
       canvas.style.height = 'auto';
-      // Start auto scan
-      startAutoScan();
+      // Start continuous recognition
+      startStreaming();
     });
 
     document.getElementById("closeCamBtn").addEventListener("click", () => {
       if (streamRef) streamRef.getTracks().forEach(t => t.stop());
       document.getElementById("webcamArea").classList.add("hidden");
+      stopStreaming();
       stopAutoScan();
     });
 
@@ -218,9 +357,17 @@
     async function showUserAttendance(name) {
       userTitle.textContent = `Attendance for ${name}`;
       userAttendanceDiv.innerHTML = '<p class="text-sm text-gray-600">Loading...</p>';
-      const res = await fetch(`/api/attendance/${encodeURIComponent(name)}`);
-      const j = await res.json();
-      const records = j && j.success && Array.isArray(j.attendance) ? j.attendance : [];
+      // Results are paginated; follow next_cursor until the history is complete
+      const records = [];
+      let cursor = null;
+      do {
+        const qs = cursor ? `?cursor=${cursor}` : '';
+        const res = await fetch(`/api/attendance/${encodeURIComponent(name)}${qs}`);
+        const j = await res.json();
+        if (!j || !j.success || !Array.isArray(j.attendance)) break;
+        records.push(...j.attendance);
+        cursor = j.next_cursor;
+      } while (cursor);
       renderUserTable(name, records);
     }
 
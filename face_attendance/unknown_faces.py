@@ -0,0 +1,224 @@
+# unknown_faces.py
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+from PIL import Image, ImageOps
+
+
+class _Cluster:
+    """One unknown visitor: running mean encoding and the cache slots
+    holding their samples."""
+
+    __slots__ = ("token", "centroid", "sightings", "first_seen", "last_seen", "slots")
+
+    def __init__(self, token, encoding, now):
+        self.token = token
+        self.centroid = encoding.copy()
+        self.sightings = 1
+        self.first_seen = self.last_seen = now
+        self.slots = []
+
+    def add(self, encoding, now):
+        self.sightings += 1
+        self.centroid += (encoding - self.centroid) / self.sightings
+        self.last_seen = now
+
+
+class UnknownFaces:
+    """Recent unrecognized faces, grouped by visitor so they can be enrolled.
+
+    Sightings are clustered as they arrive: a face joins the cluster whose
+    centroid (running mean encoding) is closest if it is within
+    ``cluster_threshold``, otherwise it starts a new cluster, and clusters
+    that drift within the threshold of each other are merged.  The
+    threshold defaults to the recognition tolerance: faces recognition
+    would take for one person are grouped as one visitor.  A cluster
+    keeps up to ``samples_per_cluster`` sightings that differ by at least
+    ``sample_gap`` (encoding plus a ``crop_size`` square face crop) in slots
+    of preallocated arrays, so the cache never holds more than ``capacity``
+    samples.  Clusters not seen for ``ttl`` seconds are dropped; when every
+    slot is taken, the least recently seen cluster goes.  Clients only see
+    a cluster's token; tokens of merged clusters resolve to the merged one.
+    """
+
+    def __init__(self, capacity=256, ttl=3600, cluster_threshold=0.6, samples_per_cluster=8,
+                 sample_gap=0.1, crop_size=128, dim=128):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.cluster_threshold = cluster_threshold
+        self.samples_per_cluster = samples_per_cluster
+        self.sample_gap = sample_gap
+        self.crop_size = crop_size
+        self._encodings = np.zeros((capacity, dim), dtype=np.float32)
+        self._crops = np.zeros((capacity, crop_size, crop_size, 3), dtype=np.uint8)
+        self._has_crop = np.zeros(capacity, dtype=bool)
+        self._free = list(range(capacity - 1, -1, -1))
+        self._clusters = OrderedDict()  # token -> _Cluster, least recently seen first
+        self._aliases = {}  # token of a merged cluster -> token it was merged into
+        self._lock = threading.Lock()
+        self._stats = {"sightings": 0, "clusters": 0, "merged": 0, "expired": 0, "evicted": 0}
+
+    def __len__(self):
+        return len(self._clusters)
+
+    # === Sightings ===
+    def add(self, encoding, crop=None, now=None):
+        """Record an unrecognized face; returns (token, sightings) of its
+        cluster.  ``crop`` returns the face as a PIL image and is only called
+        if the sighting is kept as a sample."""
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(-1)
+        now = time.time() if now is None else now
+        with self._lock:
+            self._stats["sightings"] += 1
+            self._expire(now)
+            cluster = self._nearest(encoding)
+            if cluster is None:
+                cluster = _Cluster(secrets.token_urlsafe(9), encoding, now)
+                self._clusters[cluster.token] = cluster
+                self._stats["clusters"] += 1
+            else:
+                cluster.add(encoding, now)
+                self._clusters.move_to_end(cluster.token)
+                cluster = self._merge_into(cluster)
+            token = cluster.token
+            wanted = self._wants_sample(cluster, encoding)
+        if wanted:
+            # Cropping decodes the frame, so it happens outside the lock
+            image = None
+            if crop is not None:
+                try:
+                    image = self._fit(crop())
+                except (OSError, ValueError):
+                    image = None
+            with self._lock:
+                cluster = self._resolve(token)
+                if cluster is not None and self._wants_sample(cluster, encoding):
+                    self._store(cluster, encoding, image)
+        with self._lock:
+            cluster = self._resolve(token)
+            return (cluster.token, cluster.sightings) if cluster is not None else (token, 1)
+
+    def _nearest(self, encoding, exclude=None):
+        candidates = [c for c in self._clusters.values() if c is not exclude]
+        if not candidates:
+            return None
+        distances = np.linalg.norm(np.stack([c.centroid for c in candidates]) - encoding, axis=1)
+        best = int(np.argmin(distances))
+        return candidates[best] if distances[best] < self.cluster_threshold else None
+
+    def _merge_into(self, cluster):
+        """Merge ``cluster`` with another whose centroid is now within the
+        threshold; returns the surviving cluster."""
+        other = self._nearest(cluster.centroid, exclude=cluster)
+        if other is None:
+            return cluster
+        keep, gone = (cluster, other) if cluster.sightings >= other.sightings else (other, cluster)
+        total = keep.sightings + gone.sightings
+        keep.centroid = (keep.centroid * keep.sightings + gone.centroid * gone.sightings) / total
+        keep.sightings = total
+        keep.first_seen = min(keep.first_seen, gone.first_seen)
+        keep.last_seen = max(keep.last_seen, gone.last_seen)
+        room = self.samples_per_cluster - len(keep.slots)
+        keep.slots.extend(gone.slots[:room])
+        self._free.extend(gone.slots[room:])
+        gone.slots = []
+        del self._clusters[gone.token]
+        self._clusters.move_to_end(keep.token)
+        self._aliases = {alias: (keep.token if target == gone.token else target)
+                         for alias, target in self._aliases.items()}
+        self._aliases[gone.token] = keep.token
+        self._stats["merged"] += 1
+        return keep
+
+    def _wants_sample(self, cluster, encoding):
+        if len(cluster.slots) >= self.samples_per_cluster:
+            return False
+        if not cluster.slots:
+            return True
+        distances = np.linalg.norm(self._encodings[cluster.slots] - encoding, axis=1)
+        return float(distances.min()) >= self.sample_gap
+
+    def _store(self, cluster, encoding, image):
+        while not self._free:
+            victim = next((c for c in self._clusters.values() if c is not cluster), None)
+            if victim is None:
+                return
+            self._drop(victim)
+            self._stats["evicted"] += 1
+        slot = self._free.pop()
+        self._encodings[slot] = encoding
+        self._has_crop[slot] = image is not None
+        if image is not None:
+            self._crops[slot] = image
+        cluster.slots.append(slot)
+
+    def _fit(self, image):
+        """``crop_size`` square RGB array of a face image (padded, not stretched)."""
+        return np.asarray(ImageOps.pad(image.convert("RGB"), (self.crop_size, self.crop_size),
+                                       method=Image.BILINEAR))
+
+    # === Eviction ===
+    def _expire(self, now):
+        while self._clusters:
+            oldest = next(iter(self._clusters.values()))
+            if now - oldest.last_seen <= self.ttl:
+                break
+            self._drop(oldest)
+            self._stats["expired"] += 1
+
+    def _drop(self, cluster):
+        del self._clusters[cluster.token]
+        self._free.extend(cluster.slots)
+        cluster.slots = []
+        self._aliases = {alias: target for alias, target in self._aliases.items() if target != cluster.token}
+
+    def _resolve(self, token):
+        return self._clusters.get(self._aliases.get(token, token))
+
+    # === Reading ===
+    def clusters(self, now=None):
+        """Registration candidates, most often seen first."""
+        with self._lock:
+            self._expire(time.time() if now is None else now)
+            found = sorted(self._clusters.values(), key=lambda c: c.sightings, reverse=True)
+            return [{"token": c.token, "sightings": c.sightings, "samples": len(c.slots),
+                     "first_seen": datetime.fromtimestamp(c.first_seen).isoformat(timespec="seconds"),
+                     "last_seen": datetime.fromtimestamp(c.last_seen).isoformat(timespec="seconds")}
+                    for c in found]
+
+    def crop(self, token, index=0):
+        """Face crop (RGB array) of one sample of a cluster, or None."""
+        with self._lock:
+            cluster = self._resolve(token)
+            if cluster is None or not 0 <= index < len(cluster.slots) or not self._has_crop[cluster.slots[index]]:
+                return None
+            return self._crops[cluster.slots[index]].copy()
+
+    def samples(self, token):
+        """(encodings, crops) of a cluster's samples, crops None where the
+        face couldn't be cropped; None for an unknown or expired token."""
+        with self._lock:
+            cluster = self._resolve(token)
+            if cluster is None:
+                return None
+            slots = list(cluster.slots)
+            return (self._encodings[slots].copy(),
+                    [self._crops[s].copy() if self._has_crop[s] else None for s in slots])
+
+    def discard(self, token):
+        """Forget a cluster (after it was enrolled or dismissed)."""
+        with self._lock:
+            cluster = self._resolve(token)
+            if cluster is None:
+                return False
+            self._drop(cluster)
+            self._aliases.pop(token, None)
+            return True
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, cached_clusters=len(self._clusters),
+                        cached_samples=self.capacity - len(self._free))
@@ -1,40 +1,228 @@
 # utils.py
 import os
+import re
+import json
+import ntpath
 import sqlite3
 import pickle
+import threading
+from contextlib import contextmanager
 import numpy as np
 from datetime import datetime
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
-UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
-EXPORTS_DIR = os.path.join(os.path.dirname(__file__), "exports")
+# Everything the app stores lives next to the code, or under
+# FACE_ATTENDANCE_HOME when set (the benchmarks point it at a scratch folder)
+HOME_DIR = os.environ.get("FACE_ATTENDANCE_HOME") or os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(HOME_DIR, "data")
+UPLOAD_DIR = os.path.join(HOME_DIR, "uploads")
+EXPORTS_DIR = os.path.join(HOME_DIR, "exports")
+KNOWN_FACES_DIR = os.path.join(HOME_DIR, "known_faces")
 ENCODINGS_PATH = os.path.join(DATA_DIR, "encodings.pickle")
+KNOWN_ENCODINGS_PATH = os.path.join(DATA_DIR, "known_encodings.npy")
+KNOWN_META_PATH = os.path.join(DATA_DIR, "known_encodings.json")
 DB_PATH = os.path.join(DATA_DIR, "attendance.db")
+# Image files accepted in known_faces/, enrollment folders and archives
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
 
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(EXPORTS_DIR, exist_ok=True)
 
 # DB helpers
+# One connection per process, shared by its threads and serialized by DB_LOCK.
+# WAL mode lets other processes keep reading while a worker writes.
+DB_LOCK = threading.RLock()
+_DB = {"pid": None, "conn": None}
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+    if _DB["pid"] != os.getpid():
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _DB.update(pid=os.getpid(), conn=conn)
+    return _DB["conn"]
+
+@contextmanager
+def db_cursor():
+    """Cursor on the shared connection; commits on success, rolls back on error."""
+    with DB_LOCK:
+        conn = get_db_connection()
+        c = conn.cursor()
+        try:
+            yield c
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            c.close()
 
 def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
+    with db_cursor() as c:
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS attendance (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                date TEXT NOT NULL,
+                time TEXT NOT NULL,
+                image_path TEXT,
+                legacy_id TEXT
+            )
+        """)
+        columns = {row["name"] for row in c.execute("PRAGMA table_info(attendance)")}
+        if "legacy_id" not in columns:
+            # Databases created before the CSV importer existed
+            c.execute("ALTER TABLE attendance ADD COLUMN legacy_id TEXT")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_name_date ON attendance (name, date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance (date)")
+        # Older rows hold absolute snapshot paths (some from Windows machines)
+        c.execute("SELECT id, image_path FROM attendance "
+                  "WHERE image_path LIKE '/%' OR image_path LIKE '\\%' OR image_path LIKE '_:%'")
+        c.executemany("UPDATE attendance SET image_path = ? WHERE id = ?",
+                      [(snapshot_key(path), row_id) for row_id, path in c.fetchall()])
+        _init_rollups(c)
+        # Resume points of recorded videos being ingested (see video_ingest.py)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS video_progress (
+                video TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+
+# Rollups: per person per day, per day and per person, kept up to date by a
+# trigger in the same transaction as every attendance insert, so summaries
+# read a handful of rows however long the history is.  Times are HH:MM:SS
+# strings, which compare in clock order.
+ROLLUP_TABLES = ("attendance_daily", "attendance_days", "attendance_users")
+
+def _init_rollups(c):
     c.execute("""
-        CREATE TABLE IF NOT EXISTS attendance (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+        CREATE TABLE IF NOT EXISTS attendance_daily (
             name TEXT NOT NULL,
             date TEXT NOT NULL,
-            time TEXT NOT NULL,
-            image_path TEXT
-        )
+            first_seen TEXT NOT NULL,
+            last_seen TEXT NOT NULL,
+            scans INTEGER NOT NULL,
+            PRIMARY KEY (name, date)
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_daily_date ON attendance_daily (date)")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_days (
+            date TEXT PRIMARY KEY,
+            present INTEGER NOT NULL,
+            scans INTEGER NOT NULL,
+            first_seen TEXT NOT NULL,
+            last_seen TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_users (
+            name TEXT PRIMARY KEY,
+            first_date TEXT NOT NULL,
+            last_date TEXT NOT NULL,
+            days_present INTEGER NOT NULL,
+            scans INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    # attendance_daily is updated last: the other two check whether this is
+    # the person's first row of the day before it exists
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS attendance_rollup AFTER INSERT ON attendance
+        BEGIN
+            INSERT INTO attendance_users (name, first_date, last_date, days_present, scans)
+            VALUES (NEW.name, NEW.date, NEW.date, 1, 1)
+            ON CONFLICT (name) DO UPDATE SET
+                first_date = min(first_date, excluded.first_date),
+                last_date = max(last_date, excluded.last_date),
+                days_present = days_present + NOT EXISTS (
+                    SELECT 1 FROM attendance_daily WHERE name = NEW.name AND date = NEW.date),
+                scans = scans + 1;
+            INSERT INTO attendance_days (date, present, scans, first_seen, last_seen)
+            VALUES (NEW.date, 1, 1, NEW.time, NEW.time)
+            ON CONFLICT (date) DO UPDATE SET
+                present = present + NOT EXISTS (
+                    SELECT 1 FROM attendance_daily WHERE name = NEW.name AND date = NEW.date),
+                scans = scans + 1,
+                first_seen = min(first_seen, excluded.first_seen),
+                last_seen = max(last_seen, excluded.last_seen);
+            INSERT INTO attendance_daily (name, date, first_seen, last_seen, scans)
+            VALUES (NEW.name, NEW.date, NEW.time, NEW.time, 1)
+            ON CONFLICT (name, date) DO UPDATE SET
+                first_seen = min(first_seen, excluded.first_seen),
+                last_seen = max(last_seen, excluded.last_seen),
+                scans = scans + 1;
+        END
     """)
-    conn.commit()
-    conn.close()
+    # Databases logged before the rollups existed are backfilled once
+    c.execute("SELECT EXISTS (SELECT 1 FROM attendance_users), EXISTS (SELECT 1 FROM attendance)")
+    has_rollups, has_rows = c.fetchone()
+    if has_rows and not has_rollups:
+        _rebuild_rollups(c)
+
+def _rebuild_rollups(c):
+    for table in ROLLUP_TABLES:
+        c.execute(f"DELETE FROM {table}")
+    c.execute("""
+        INSERT INTO attendance_daily (name, date, first_seen, last_seen, scans)
+        SELECT name, date, MIN(time), MAX(time), COUNT(*) FROM attendance GROUP BY name, date
+    """)
+    c.execute("""
+        INSERT INTO attendance_days (date, present, scans, first_seen, last_seen)
+        SELECT date, COUNT(*), SUM(scans), MIN(first_seen), MAX(last_seen)
+        FROM attendance_daily GROUP BY date
+    """)
+    c.execute("""
+        INSERT INTO attendance_users (name, first_date, last_date, days_present, scans)
+        SELECT name, MIN(date), MAX(date), COUNT(*), SUM(scans) FROM attendance_daily GROUP BY name
+    """)
+
+def rebuild_rollups():
+    """Recompute every rollup from the attendance table in one transaction;
+    returns the number of (person, day) rows."""
+    init_db()
+    with db_cursor() as c:
+        _rebuild_rollups(c)
+        c.execute("SELECT COUNT(*) FROM attendance_daily")
+        return c.fetchone()[0]
+
+def snapshot_key(image_path):
+    """Snapshot key (relative to uploads/) for a stored image path.
+
+    New rows already hold keys such as ``2026/10/17/<sha1>.jpg``; absolute
+    paths written by older versions keep only their file name, which is
+    where those full frames live in uploads/.
+    """
+    if not image_path:
+        return None
+    if ntpath.isabs(image_path) or ntpath.splitdrive(image_path)[0]:
+        return ntpath.basename(image_path)
+    return image_path
+
+# Known faces
+def identity_name(file):
+    """Person a known_faces/ image belongs to: ``Name/any.jpg``, ``Name.jpg``
+    and the ``Name_1.jpg``, ``Name_2.jpg``... extra photos are all "Name"."""
+    parts = file.replace("\\", "/").split("/")
+    if len(parts) > 1:
+        return parts[0]
+    return re.sub(r"_\d+$", "", os.path.splitext(parts[0])[0])
+
+def known_face_files():
+    """Image paths relative to known_faces/, including one level of per-person folders."""
+    files = []
+    if not os.path.isdir(KNOWN_FACES_DIR):
+        return files
+    for entry in sorted(os.listdir(KNOWN_FACES_DIR)):
+        path = os.path.join(KNOWN_FACES_DIR, entry)
+        if os.path.isdir(path):
+            files.extend(f"{entry}/{f}" for f in sorted(os.listdir(path))
+                         if f.lower().endswith(IMAGE_EXTENSIONS))
+        elif entry.lower().endswith(IMAGE_EXTENSIONS):
+            files.append(entry)
+    return files
 
 # Encodings helpers
 def load_encodings():
@@ -54,21 +242,59 @@ def save_encodings(encodings):
         pickle.dump(encodings, f)
 
 # Attendance record
-def add_attendance(name, image_path=None):
-    conn = get_db_connection()
-    c = conn.cursor()
-    now = datetime.now()
-    date = now.strftime("%Y-%m-%d")
-    time = now.strftime("%H:%M:%S")
-    c.execute("INSERT INTO attendance (name, date, time, image_path) VALUES (?, ?, ?, ?)",
-              (name, date, time, image_path))
-    conn.commit()
-    conn.close()
-
-def query_attendance(limit=100, start_date=None, end_date=None, name=None):
-    conn = get_db_connection()
-    c = conn.cursor()
-    q = "SELECT * FROM attendance WHERE 1=1"
+# image_path holds a snapshot key relative to UPLOAD_DIR (see snapshot_store.py)
+ATTENDANCE_COLUMNS = ["id", "name", "date", "time", "image_path"]
+
+def add_attendance(name, image_path=None, when=None):
+    """Insert one attendance row and return its id."""
+    when = when or datetime.now()
+    date = when.strftime("%Y-%m-%d")
+    time = when.strftime("%H:%M:%S")
+    with db_cursor() as c:
+        c.execute("INSERT INTO attendance (name, date, time, image_path) VALUES (?, ?, ?, ?)",
+                  (name, date, time, image_path))
+        return c.lastrowid
+
+def add_attendance_many(rows):
+    """Insert (name, when, image_path) rows in one transaction."""
+    params = [(name, when.strftime("%Y-%m-%d"), when.strftime("%H:%M:%S"), image_path)
+              for name, when, image_path in rows]
+    with db_cursor() as c:
+        c.executemany("INSERT INTO attendance (name, date, time, image_path) VALUES (?, ?, ?, ?)",
+                      params)
+
+def video_progress(video):
+    """Saved state of a video being ingested (a dict), or None."""
+    with db_cursor() as c:
+        c.execute("SELECT state FROM video_progress WHERE video = ?", (video,))
+        row = c.fetchone()
+    return json.loads(row[0]) if row else None
+
+def save_video_progress(video, state, rows=()):
+    """Insert attendance ``rows`` (name, when, image_path) and save ``state``
+    for ``video`` in one transaction, so a resumed job never logs twice."""
+    params = [(name, when.strftime("%Y-%m-%d"), when.strftime("%H:%M:%S"), image_path)
+              for name, when, image_path in rows]
+    with db_cursor() as c:
+        c.executemany("INSERT INTO attendance (name, date, time, image_path) VALUES (?, ?, ?, ?)",
+                      params)
+        c.execute("INSERT INTO video_progress (video, state, updated_at) VALUES (?, ?, ?) "
+                  "ON CONFLICT (video) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                  (video, json.dumps(state), datetime.now().isoformat(timespec="seconds")))
+
+def count_attendance():
+    with db_cursor() as c:
+        c.execute("SELECT COUNT(*) FROM attendance")
+        return c.fetchone()[0]
+
+def attendance_names():
+    with db_cursor() as c:
+        c.execute("SELECT DISTINCT name FROM attendance")
+        return [row[0] for row in c.fetchall()]
+
+def _attendance_filters(name=None, start_date=None, end_date=None, after_id=None, ascending=False):
+    """WHERE clause and params shared by the attendance queries."""
+    q = " WHERE 1=1"
     params = []
     if name:
         q += " AND name = ?"
@@ -79,9 +305,75 @@ def query_attendance(limit=100, start_date=None, end_date=None, name=None):
     if end_date:
         q += " AND date <= ?"
         params.append(end_date)
-    q += " ORDER BY id DESC LIMIT ?"
-    params.append(limit)
-    c.execute(q, params)
-    rows = c.fetchall()
-    conn.close()
+    if after_id is not None:
+        # Keyset cursor: continue after the last id of the previous page
+        q += " AND id > ?" if ascending else " AND id < ?"
+        params.append(after_id)
+    return q, params
+
+def query_attendance(limit=100, start_date=None, end_date=None, name=None, ascending=False, after_id=None):
+    where, params = _attendance_filters(name, start_date, end_date, after_id, ascending)
+    q = f"SELECT {', '.join(ATTENDANCE_COLUMNS)} FROM attendance" + where
+    q += " ORDER BY id ASC" if ascending else " ORDER BY id DESC"
+    if limit is not None:
+        q += " LIMIT ?"
+        params.append(limit)
+    with db_cursor() as c:
+        c.execute(q, params)
+        rows = c.fetchall()
     return [dict(r) for r in rows]
+
+def iter_attendance(page_size=1000, start_date=None, end_date=None, name=None, ascending=True):
+    """Yield attendance rows page by page without holding the DB lock in between."""
+    after_id = None
+    while True:
+        page = query_attendance(page_size, start_date, end_date, name, ascending, after_id)
+        yield from page
+        if len(page) < page_size:
+            return
+        after_id = page[-1]["id"]
+
+def attendance_stats(start_date=None, end_date=None, name=None):
+    """(row count, days with rows) for the filtered log, read from the
+    rollups: one row per day (per person with ``name``) instead of one per
+    attendance row.  Rows are never deleted, so the count changes whenever
+    a matching row is added."""
+    table = "attendance_daily" if name else "attendance_days"
+    where, params = _attendance_filters(name, start_date, end_date)
+    with db_cursor() as c:
+        c.execute(f"SELECT COALESCE(SUM(scans), 0), COUNT(*) FROM {table}" + where, params)
+        count, days = c.fetchone()
+    return count, days
+
+# Summaries (read from the rollups; cost depends on the range asked for, not the history)
+def day_rollup(date):
+    """(totals, [per-person rows]) for ``date``; totals is None when nobody was seen."""
+    with db_cursor() as c:
+        c.execute("SELECT date, present, scans, first_seen, last_seen FROM attendance_days WHERE date = ?",
+                  (date,))
+        totals = c.fetchone()
+        c.execute("SELECT name, first_seen, last_seen, scans FROM attendance_daily "
+                  "WHERE date = ? ORDER BY first_seen, name", (date,))
+        rows = c.fetchall()
+    return (dict(totals) if totals else None), [dict(r) for r in rows]
+
+def days_rollup(start_date, end_date):
+    """Per-day totals between two dates (inclusive), oldest first."""
+    with db_cursor() as c:
+        c.execute("SELECT date, present, scans, first_seen, last_seen FROM attendance_days "
+                  "WHERE date >= ? AND date <= ? ORDER BY date", (start_date, end_date))
+        return [dict(r) for r in c.fetchall()]
+
+def user_rollup(name, start_date=None, end_date=None):
+    """(totals, [per-day rows]) for ``name``; the days are limited to the
+    given range, the totals cover the whole history.  totals is None for
+    someone never logged."""
+    with db_cursor() as c:
+        c.execute("SELECT name, first_date, last_date, days_present, scans FROM attendance_users "
+                  "WHERE name = ?", (name,))
+        totals = c.fetchone()
+        c.execute("SELECT date, first_seen, last_seen, scans FROM attendance_daily "
+                  "WHERE name = ? AND date >= ? AND date <= ? ORDER BY date",
+                  (name, start_date or "", end_date or "9999-12-31"))
+        rows = c.fetchall()
+    return (dict(totals) if totals else None), [dict(r) for r in rows]
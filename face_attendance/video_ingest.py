@@ -0,0 +1,416 @@
+# video_ingest.py
+import os
+import re
+import sys
+import json
+import time
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+import numpy as np
+import cv2
+from camera_session import thumbnail, frame_difference
+from encoding_store import EncodingStore
+from face_index import FaceIndex
+from recognition_engine import load_models
+from snapshot_store import SnapshotStore
+from utils import (init_db, video_progress, save_video_progress,
+                   KNOWN_ENCODINGS_PATH, KNOWN_META_PATH, UPLOAD_DIR)
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".m4v", ".ts")
+# Recording start in a file name: 20261017_083000, 2026-10-17_08-30-00, 2026-10-17T08:30:00...
+_STAMP = re.compile(r"(\d{4})-?(\d{2})-?(\d{2})[ _T-]?(\d{2})[-:.]?(\d{2})[-:.]?(\d{2})")
+
+
+def find_videos(paths):
+    """Video files among ``paths``; folders are searched recursively."""
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _dirs, files in os.walk(path):
+                videos.extend(os.path.join(dirpath, f) for f in sorted(files)
+                              if f.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            videos.append(path)
+    return videos
+
+
+def video_key(path):
+    """Progress key of a video file: its absolute path and size."""
+    return f"{os.path.abspath(path)}:{os.path.getsize(path)}"
+
+
+def probe(path):
+    """(frames per second, frame count) of a video; raises ValueError if it can't be opened."""
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"cannot open {path}")
+        return cap.get(cv2.CAP_PROP_FPS) or 25.0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    finally:
+        cap.release()
+
+
+def recording_start(path, duration, start=None):
+    """(wall-clock time of the first frame, where it came from).
+
+    ``start`` wins; otherwise a timestamp in the file name; otherwise the
+    file's modification time (when the recorder closed it) minus the
+    ``duration`` in seconds."""
+    if start is not None:
+        return start, "argument"
+    m = _STAMP.search(os.path.basename(path))
+    if m:
+        try:
+            return datetime(*map(int, m.groups())), "file name"
+        except ValueError:
+            pass
+    return datetime.fromtimestamp(os.path.getmtime(path)) - timedelta(seconds=duration), "file time"
+
+
+# === Frames ===
+def sample_frames(path, fps=2.0, start_frame=0):
+    """Yield (frame index, milliseconds into the video, BGR frame) for one
+    frame every 1/``fps`` seconds, starting at ``start_frame``.  The frames
+    in between are grabbed but never converted."""
+    native, _count = probe(path)
+    step = max(1, round(native / fps)) if fps else 1
+    index = -(-start_frame // step) * step  # stay on the sampling grid when resuming
+    cap = cv2.VideoCapture(path)
+    try:
+        if index:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        while True:
+            if index % step == 0:
+                ok, frame = cap.read()
+                if not ok:
+                    return
+                yield index, index * 1000.0 / native, frame
+            elif not cap.grab():
+                return
+            index += 1
+    finally:
+        cap.release()
+
+
+def changed_frames(frames, width=640, threshold=2.0):
+    """Downscale each frame to at most ``width`` pixels (RGB) and tag it with
+    whether the scene changed since the last changed frame: yields
+    (index, ms, image, changed).  ``threshold`` is the mean absolute
+    difference (0-255) of small grayscale thumbnails; 0 marks every frame
+    as changed."""
+    reference = None
+    for index, ms, frame in frames:
+        h, w = frame.shape[:2]
+        if width and w > width:
+            frame = cv2.resize(frame, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        thumb = thumbnail(image)
+        changed = reference is None or threshold <= 0 or frame_difference(thumb, reference) >= threshold
+        if changed:
+            reference = thumb
+        yield index, ms, image, changed
+
+
+def _detect_task(image, model="hog"):
+    """Face locations and encodings of one frame, in a worker process."""
+    import face_recognition
+    locations = face_recognition.face_locations(image, model=model)
+    if not locations:
+        return [], np.zeros((0, 128), dtype=np.float32)
+    return locations, np.asarray(face_recognition.face_encodings(image, locations), dtype=np.float32)
+
+
+# === Sightings ===
+class Sightings:
+    """Collapses per-frame recognitions into one event per visit.
+
+    A person's sighting stays open while they are seen again within ``gap``
+    seconds of video; it closes as an event once they have been gone that
+    long (or at the end of the video), if it spanned at least
+    ``min_frames`` frames.  The open sightings are plain dicts so they can
+    be checkpointed; the best frame of each (for the snapshot) is not.
+    """
+
+    def __init__(self, gap=10.0, min_frames=2, state=None):
+        self.gap_ms = gap * 1000.0
+        self.min_frames = min_frames
+        self.open = {s["name"]: s for s in state or []}
+        self._best = {}  # name -> (image, box) of the closest match
+
+    def update(self, ms, matches, image=None):
+        """Add a frame's (name, distance, box) matches; returns the sightings
+        that closed."""
+        for name, distance, box in matches:
+            if name is None:
+                continue
+            s = self.open.get(name)
+            if s is None:
+                s = self.open[name] = {"name": name, "first_ms": ms, "last_ms": ms, "frames": 0,
+                                       "distance": distance}
+            s["last_ms"] = ms
+            s["frames"] += 1
+            if distance <= s["distance"] or name not in self._best:
+                s["distance"] = distance
+                self._best[name] = (image, box)
+        return self._close(lambda s: ms - s["last_ms"] > self.gap_ms)
+
+    def flush(self):
+        return self._close(lambda s: True)
+
+    def state(self):
+        return list(self.open.values())
+
+    def _close(self, finished):
+        closed = []
+        for name in [n for n, s in self.open.items() if finished(s)]:
+            sighting = self.open.pop(name)
+            best = self._best.pop(name, None)
+            if sighting["frames"] >= self.min_frames:
+                closed.append(dict(sighting, best=best))
+        return closed
+
+
+# === Pipeline ===
+class VideoJob:
+    """One video going through the pipeline.
+
+    Sampled frames are decoded on this job's thread and handed to the shared
+    process ``pool``; results are taken back in frame order (at most
+    ``max_inflight`` outstanding), matched against ``index`` and collapsed
+    into sightings.  Frames where the scene didn't change are not sent to
+    the pool: they repeat the previous frame's matches.  Every
+    ``checkpoint_every`` seconds the closed sightings are written as
+    attendance together with the resume point, in one transaction.
+    """
+
+    def __init__(self, path, pool, index, fps=2.0, scene_threshold=2.0, gap=10.0, min_frames=2,
+                 threshold=0.6, detect_width=640, model="hog", start=None, resume=True, dry_run=False,
+                 snapshots=None, max_inflight=4, checkpoint_every=10.0):
+        self.path = path
+        self.pool = pool
+        self.index = index
+        self.fps = fps
+        self.scene_threshold = scene_threshold
+        self.gap = gap
+        self.min_frames = min_frames
+        self.threshold = threshold
+        self.detect_width = detect_width
+        self.model = model
+        self.start = start
+        self.resume = resume
+        self.dry_run = dry_run
+        self.snapshots = snapshots
+        self.max_inflight = max_inflight
+        self.checkpoint_every = checkpoint_every
+        self.status = "pending"
+        self.stats = {"sampled": 0, "recognized": 0, "unchanged": 0, "faces": 0, "events": 0,
+                      "video_seconds": 0.0, "seconds": 0.0}
+        self.events = []
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            self._run()
+            if self.status == "running":
+                self.status = "done"
+        except Exception as e:
+            self.status = "error"
+            self.stats["error"] = str(e)
+        self.stats["seconds"] = time.perf_counter() - started
+        return self
+
+    def _run(self):
+        key = video_key(self.path)
+        state = video_progress(key) if self.resume and not self.dry_run else None
+        if state and state.get("done"):
+            self.status = "already_done"
+            return
+        native, count = probe(self.path)
+        if state:
+            self.recorded_at = datetime.fromisoformat(state["recorded_at"])
+            self.stats["resumed_at"] = round(state["next_frame"] / native, 1)
+        else:
+            self.recorded_at, source = recording_start(self.path, count / native, self.start)
+            self.stats["start_from"] = source
+            state = {"next_frame": 0, "open": [], "recorded_at": self.recorded_at.isoformat()}
+        self.stats["recorded_at"] = state["recorded_at"]
+        self._state = state
+        self._sightings = Sightings(self.gap, self.min_frames, state["open"])
+        self._last = []
+        self._pending = []
+        self._checkpointed = time.monotonic()
+        self.status = "running"
+
+        inflight = deque()
+        frames = changed_frames(sample_frames(self.path, self.fps, state["next_frame"]),
+                                self.detect_width, self.scene_threshold)
+        for frame_index, ms, image, changed in frames:
+            self.stats["sampled"] += 1
+            future = self.pool.submit(_detect_task, image, self.model) if changed else None
+            inflight.append((frame_index, ms, image, future))
+            while inflight and (len(inflight) > self.max_inflight
+                                or inflight[0][3] is None or inflight[0][3].done()):
+                self._resolve(*inflight.popleft())
+            if time.monotonic() - self._checkpointed >= self.checkpoint_every:
+                self._checkpoint()
+        while inflight:
+            self._resolve(*inflight.popleft())
+        self._pending.extend(self._sightings.flush())
+        self._checkpoint(done=True)
+
+    def _resolve(self, frame_index, ms, image, future):
+        if future is None:
+            # Unchanged scene: the same people as in the last recognized frame
+            self.stats["unchanged"] += 1
+            matches = self._last
+        else:
+            locations, encodings = future.result()
+            self.stats["recognized"] += 1
+            self.stats["faces"] += len(locations)
+            found = self.index.match(encodings, threshold=self.threshold) if len(encodings) else []
+            matches = self._last = [(name, distance, box) for (name, distance, _row), box in zip(found, locations)]
+        self._pending.extend(self._sightings.update(ms, matches, image))
+        self._state["next_frame"] = frame_index + 1
+        self.stats["video_seconds"] = ms / 1000.0
+
+    def _checkpoint(self, done=False):
+        rows = []
+        for sighting in self._pending:
+            when = self.recorded_at + timedelta(milliseconds=sighting["first_ms"])
+            rows.append((sighting["name"], when, self._snapshot(sighting, when)))
+            self.events.append({"name": sighting["name"], "time": when.isoformat(timespec="seconds"),
+                                "video_seconds": round(sighting["first_ms"] / 1000.0, 1),
+                                "seen_for": round((sighting["last_ms"] - sighting["first_ms"]) / 1000.0, 1),
+                                "frames": sighting["frames"], "distance": round(sighting["distance"], 3)})
+        self._pending = []
+        self.stats["events"] += len(rows)
+        self._state.update(open=self._sightings.state(), done=done)
+        if not self.dry_run:
+            save_video_progress(video_key(self.path), self._state, rows)
+        self._checkpointed = time.monotonic()
+
+    def _snapshot(self, sighting, when):
+        best = sighting.get("best")
+        if self.snapshots is None or self.dry_run or not best or best[0] is None:
+            return None
+        image, box = best
+        ok, jpeg = cv2.imencode(".jpg", cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        try:
+            return self.snapshots.save(jpeg.tobytes(), box, when) if ok else None
+        except (OSError, ValueError):
+            return None
+
+
+def load_gallery():
+    """FaceIndex of everything in the encoding store (as the app builds it)."""
+    store = EncodingStore(KNOWN_ENCODINGS_PATH, KNOWN_META_PATH).load()
+    index = FaceIndex(capacity=max(len(store.entries), 1024),
+                      n_lists=int(os.environ.get("FACE_INDEX_LISTS", 0)),
+                      n_probe=int(os.environ.get("FACE_INDEX_PROBES", 4)),
+                      mode=os.environ.get("GALLERY_MODE", "centroid"))
+    index.add_many(np.asarray(store.matrix), [entry["name"] for entry in store.entries])
+    if index.n_lists:
+        index.build_partitions()
+    return index
+
+
+def ingest_videos(paths, workers=None, files=2, resume=True, dry_run=False, snapshots=True,
+                  progress=None, **options):
+    """Recognize people in recorded videos and log each visit as attendance
+    at the time it happened in the recording.
+
+    ``files`` videos are decoded concurrently (one thread each) and share a
+    pool of ``workers`` processes for detection and encoding; ``options``
+    are passed to VideoJob.  Progress is checkpointed in attendance.db, so
+    running the same command again continues where it stopped (``resume``
+    False starts over).  Returns a report with per-file stats, the events
+    and frames processed per second.
+    """
+    init_db()
+    index = load_gallery()
+    if not len(index):
+        raise SystemExit("The face gallery is empty; enroll people first")
+    workers = workers or os.cpu_count() or 1
+    store = SnapshotStore(UPLOAD_DIR) if snapshots else None
+    method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+    if method == "fork":
+        load_models()  # once, shared copy-on-write by the forked workers
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context(method),
+                             initializer=load_models) as pool:
+        # Start the workers before any decoding thread exists
+        wait([pool.submit(time.sleep, 0.05) for _ in range(workers)])
+        jobs = [VideoJob(path, pool, index, resume=resume, dry_run=dry_run, snapshots=store,
+                         max_inflight=2 * workers, **options) for path in paths]
+        with ThreadPoolExecutor(max_workers=max(1, files)) as threads:
+            futures = [threads.submit(job.run) for job in jobs]
+            while wait(futures, timeout=2.0).not_done:
+                if progress:
+                    progress(jobs, time.perf_counter() - start)
+    elapsed = time.perf_counter() - start
+    if progress:
+        progress(jobs, elapsed)
+    sampled = sum(job.stats["sampled"] for job in jobs)
+    return {"files": [dict(job.stats, path=job.path, status=job.status) for job in jobs],
+            "events": sorted((dict(event, path=job.path) for job in jobs for event in job.events),
+                             key=lambda event: (event["path"], event["time"])),
+            "frames": sampled, "seconds": elapsed,
+            "frames_per_second": sampled / elapsed if elapsed else 0.0,
+            "video_seconds_per_second": sum(job.stats["video_seconds"] for job in jobs) / elapsed if elapsed else 0.0}
+
+
+def _print_progress(jobs, elapsed):
+    sampled = sum(job.stats["sampled"] for job in jobs)
+    running = sum(job.status == "running" for job in jobs)
+    finished = sum(job.status not in ("pending", "running") for job in jobs)
+    print(f"\r{finished}/{len(jobs)} files ({running} running)  {sampled} frames  "
+          f"{sampled / elapsed if elapsed else 0.0:.1f} frames/s", end="", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Take attendance from recorded video files")
+    parser.add_argument("paths", nargs="+", help="video files or folders of them")
+    parser.add_argument("--fps", type=float, default=2.0, help="frames sampled per second of video")
+    parser.add_argument("--scene-threshold", type=float, default=2.0,
+                        help="skip frames that differ less than this from the last one (0-255, 0 = never)")
+    parser.add_argument("--gap", type=float, default=10.0, help="seconds someone must be gone to end a visit")
+    parser.add_argument("--min-frames", type=int, default=2, help="frames needed to count a visit")
+    parser.add_argument("--threshold", type=float, default=0.6, help="max face distance for a match")
+    parser.add_argument("--detect-width", type=int, default=640, help="downscale wider frames before detection")
+    parser.add_argument("--model", choices=["hog", "cnn"], default="hog")
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        help="wall-clock time of the first frame (default: from the file name or time)")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--files", type=int, default=2, help="videos decoded at the same time")
+    parser.add_argument("--checkpoint-every", type=float, default=10.0, help="seconds between saved resume points")
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress and start over")
+    parser.add_argument("--dry-run", action="store_true", help="print the visits without logging them")
+    parser.add_argument("--no-snapshots", action="store_true", help="don't store face snapshots")
+    parser.add_argument("--report", help="write the full JSON report here")
+    args = parser.parse_args()
+
+    report = ingest_videos(find_videos(args.paths), workers=args.workers, files=args.files,
+                           resume=not args.restart, dry_run=args.dry_run,
+                           snapshots=not args.no_snapshots, progress=_print_progress,
+                           fps=args.fps, scene_threshold=args.scene_threshold, gap=args.gap,
+                           min_frames=args.min_frames, threshold=args.threshold,
+                           detect_width=args.detect_width, model=args.model, start=args.start,
+                           checkpoint_every=args.checkpoint_every)
+    print(file=sys.stderr)
+    print(f"Processed {report['frames']} frames in {report['seconds']:.1f}s "
+          f"({report['frames_per_second']:.1f} frames/s, {report['video_seconds_per_second']:.1f}x real time)")
+    for f in report["files"]:
+        line = (f"  {f['status']:<12} {f['path']}  {f['sampled']} frames "
+                f"({f['unchanged']} unchanged), {f['events']} visits")
+        if f.get("error"):
+            line += f"  ! {f['error']}"
+        print(line)
+    for event in report["events"]:
+        print(f"  {event['time']}  {event['name']:<20} seen {event['seen_for']}s "
+              f"at {event['video_seconds']}s of {os.path.basename(event['path'])}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from face_index import FaceIndex
+
+
+def _gallery(rng, identities=50, photos=5, spread=0.06, noise=0.05):
+    centers = rng.normal(0.0, spread, size=(identities, 128)).astype(np.float32)
+    encodings = np.repeat(centers, photos, axis=0) + rng.normal(0.0, noise, size=(identities * photos, 128))
+    names = [f"p{i}" for i in range(identities) for _ in range(photos)]
+    return encodings.astype(np.float32), names
+
+
+def _index(mode, encodings, names, **options):
+    index = FaceIndex(mode=mode, **options)
+    index.add_many(encodings, names)
+    if index.n_lists:
+        index.build_partitions()
+    return index
+
+
+@pytest.mark.parametrize("mode", FaceIndex.MODES)
+def test_close_to_one_photo_is_accepted(mode):
+    # One photo of p0 is far from p0's other photos, so p0's centroid is far
+    # from a query that is right next to that photo
+    rng = np.random.default_rng(0)
+    encodings, names = _gallery(rng)
+    encodings[0] = encodings[1] + rng.normal(0.0, 0.09, 128)
+    query = encodings[0] + rng.normal(0.0, 0.13 / np.sqrt(128), 128).astype(np.float32)
+    name, dist, row = _index(mode, encodings, names).match(query[None, :], threshold=0.6)[0]
+    assert (name, row) == ("p0", 0)
+    assert dist == pytest.approx(np.linalg.norm(query - encodings[0]), abs=1e-4)
+
+
+@pytest.mark.parametrize("mode", ["centroid", "medoid"])
+@pytest.mark.parametrize("n_lists", [0, 8])
+def test_identity_modes_agree_with_exhaustive(mode, n_lists):
+    rng = np.random.default_rng(1)
+    encodings, names = _gallery(rng, identities=200)
+    queries = np.concatenate([encodings[::7] + rng.normal(0.0, 0.04, (len(encodings[::7]), 128)),
+                              rng.normal(0.0, 0.06, (20, 128))]).astype(np.float32)
+    # Probing every partition keeps the partitioned index exact
+    options = {"n_lists": n_lists, "n_probe": n_lists}
+    expected = _index("exhaustive", encodings, names).match(queries)
+    got = _index(mode, encodings, names, **options).match(queries)
+    assert [m[0] for m in got] == [m[0] for m in expected]
+    # Accepted matches are the same photo; rejected ones only report the
+    # closest distance among the shortlisted identities
+    for (name, d1, r1), (_, d2, r2) in zip(got, expected):
+        if name is not None:
+            assert (r1, d1) == (r2, pytest.approx(d2, abs=1e-4))
+
+
+def test_identity_modes_use_partitions():
+    rng = np.random.default_rng(2)
+    encodings, names = _gallery(rng, identities=200)
+    index = _index("centroid", encodings, names, n_lists=16, n_probe=1)
+    calls = []
+    original = index._candidate_rows
+    index._candidate_rows = lambda q: calls.append(len(q)) or original(q)
+    assert index.match(encodings[:1])[0][0] == "p0"
+    assert calls
@@ -0,0 +1,47 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+face_recognition = pytest.importorskip("face_recognition")
+
+from face_index import FaceIndex
+from ingest import IngestedFrame
+from recognition_engine import RecognitionEngine
+
+UPLOADS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "face_attendance", "uploads", "*.jpg")))
+
+
+@pytest.mark.skipif(not UPLOADS, reason="needs kiosk captures in face_attendance/uploads/")
+@pytest.mark.parametrize("mode", FaceIndex.MODES)
+def test_pool_matches_like_the_app(mode):
+    """A frame gets the same verdict from the worker pool as in-process."""
+    data = open(UPLOADS[0], "rb").read()
+    frame = IngestedFrame(data, 640, 160)
+    locations = face_recognition.face_locations(frame.image)
+    encodings = np.asarray(frame.encode(locations), dtype=np.float32)
+    assert len(encodings)
+
+    # The face's person has one photo right next to it and others far away,
+    # which used to make centroid mode reject it only in-process
+    rng = np.random.default_rng(0)
+    gallery = [rng.normal(0.0, 0.06, (300, 128)).astype(np.float32),
+               encodings[:1] + rng.normal(0.0, 0.13 / np.sqrt(128), (1, 128)).astype(np.float32),
+               encodings[:1] + rng.normal(0.0, 0.12, (4, 128)).astype(np.float32)]
+    names = [f"p{i // 3}" for i in range(300)] + ["visitor"] * 5
+    index = FaceIndex(mode=mode)
+    index.add_many(np.concatenate(gallery), names)
+    expected = index.match(encodings)
+
+    engine = RecognitionEngine(1, mode=mode)
+    try:
+        engine.gallery.reset(index.encodings, index.names)
+        _locations, _encodings, matches = engine.recognize(data)
+    finally:
+        engine.close()
+    assert [m[0] for m in matches] == [m[0] for m in expected]
+    assert matches[0][0] == "visitor"
+    for (_, d1, r1), (_, d2, r2) in zip(matches, expected):
+        assert r1 == r2
+        assert d1 == pytest.approx(d2, abs=1e-4)